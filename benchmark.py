@@ -0,0 +1,219 @@
+# benchmark.py
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from instrumentation import peak_rss_bytes, reset_peak_rss
+
+# Times every pipeline stage and the dashboard's data paths at several sizes.
+# Tasks are called through their undecorated .fn, so no Prefect server or API is
+# involved. Each size runs in a fresh process, and peak RSS is reset before every
+# stage where the OS allows it (Linux), so each stage reports its own peak.
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_RESULTS_DIR = 'reports/benchmarks'
+DEFAULT_THRESHOLD = 0.10
+PROFILE_LOOKUPS = 1_000
+
+
+def _measure(stage: str, num_rows: int, run: Callable[[], object], repeat: int,
+             setup: Optional[Callable[[], None]] = None, rows: Optional[int] = None) -> dict:
+    """Runs a stage `repeat` times and keeps the fastest wall time and the highest peak RSS."""
+    wall_times, peaks, result = [], [], None
+    peak_is_per_stage = True
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        result = None
+        peak_is_per_stage &= reset_peak_rss()
+        start = time.perf_counter()
+        result = run()
+        wall_times.append(time.perf_counter() - start)
+        peaks.append(peak_rss_bytes())
+    wall = min(wall_times)
+    rows = num_rows if rows is None else rows
+    return {'stage': stage, 'num_rows': num_rows, 'wall_time_s': wall, 'rows_per_s': rows / wall if wall else None,
+            'peak_rss_bytes': max(peaks), 'peak_rss_per_stage': peak_is_per_stage, 'repeat': repeat,
+            '_result': result}
+
+
+def run_size(num_rows: int, repeat: int = 1, max_workers: Optional[int] = None) -> List[dict]:
+    """
+    Runs every stage once per repeat at num_rows rows, in stage order, and returns
+    one record per stage. Meant to run in its own process (see run_benchmarks).
+    """
+    # Imported here so the parent process stays small
+    import dashboard_data
+    import tasks
+    from releases import publish_release, current_release
+    from schema import PSYCH_TRAITS
+    from training import MODEL_NAME
+    from user_index import prefix_ranges
+
+    workdir = tempfile.mkdtemp(prefix='shadowpersona-bench-')
+    release = os.path.join(workdir, 'releases', 'bench')
+    os.makedirs(release)
+    dataset_path = os.path.join(release, dashboard_data.DATASET_NAME)
+    records = []
+    state: Dict[str, object] = {}
+
+    def record(entry: dict) -> object:
+        result = entry.pop('_result')
+        records.append(entry)
+        print(f"  {entry['stage']:<26} {entry['wall_time_s']:9.3f}s {entry['rows_per_s'] or 0:14,.0f} rows/s "
+              f"{entry['peak_rss_bytes'] / 2**20:9.1f} MB peak", flush=True)
+        return result
+
+    try:
+        # Feature engineering adds columns in place, so every repeat starts from a fresh copy
+        state['raw'] = record(_measure('generate_data', num_rows, lambda: tasks.generate_data.fn(
+            num_records=num_rows, seed=0, max_workers=max_workers), repeat))
+        state['processed'] = record(_measure('feature_engineer_data', num_rows,
+                                             lambda: tasks.feature_engineer_data.fn(state['input']), repeat,
+                                             setup=lambda: state.update(input=state['raw'].copy())))
+        del state['raw'], state['input']
+        record(_measure('save_data', num_rows, lambda: tasks.save_data.fn(df=state['processed'],
+                                                                          dataset_path=dataset_path), repeat))
+        del state['processed']
+        record(_measure('build_rollup', num_rows, lambda: tasks.build_rollup.fn(
+            dataset_path=dataset_path, rollup_path=os.path.join(release, dashboard_data.ROLLUP_NAME)), repeat))
+        record(_measure('build_user_index', num_rows, lambda: tasks.build_user_index.fn(
+            dataset_path=dataset_path, index_path=os.path.join(release, dashboard_data.USER_INDEX_NAME)), repeat))
+        record(_measure('train_model', num_rows, lambda: tasks.train_model.fn(
+            dataset_path=dataset_path, model_path=os.path.join(release, MODEL_NAME), n_jobs=max_workers or -1), repeat))
+        publish_release(release, data_dir=workdir)
+
+        shared = record(_measure('dashboard_load', num_rows,
+                                 lambda: dashboard_data.open_release(current_release(workdir)), repeat))
+        traits = PSYCH_TRAITS[:2]
+        record(_measure('dashboard_aggregate', num_rows, lambda: dashboard_data.summarize(shared.cube, traits), repeat))
+        record(_measure('dashboard_trait_filter', num_rows,
+                        lambda: dashboard_data.trait_user_index(shared, traits), repeat))
+
+        def search_and_profile():
+            # One prefix search, then a page of profile loads through the index
+            index = shared.user_index
+            ranges = prefix_ranges('user_', index.max_id)
+            index.count(ranges)
+            ids = np.random.default_rng(0).integers(0, num_rows, PROFILE_LOOKUPS)
+            for user_id in ids:
+                shared.rows([index.lookup(int(user_id))])
+        record(_measure('dashboard_profile_lookup', num_rows, search_and_profile, repeat, rows=PROFILE_LOOKUPS))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return records
+
+
+def git_revision() -> str:
+    """Short hash of HEAD, suffixed with -dirty when tracked files have uncommitted changes."""
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{rev}-dirty" if dirty else rev
+
+
+def run_benchmarks(sizes: List[int], repeat: int = 1, max_workers: Optional[int] = None,
+                   results_dir: str = DEFAULT_RESULTS_DIR, revision: Optional[str] = None) -> str:
+    """
+    Benchmarks every size in a fresh spawned process and writes the results to
+    {results_dir}/{revision}.json.
+    Returns:
+        str: Path of the results file.
+    """
+    revision = revision or git_revision()
+    records = []
+    for num_rows in sizes:
+        print(f"Benchmarking {num_rows:,} rows...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            records += executor.submit(run_size, num_rows, repeat, max_workers).result()
+    results = {
+        'revision': revision,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'results': records,
+    }
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{revision}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results for {revision} saved to {path}.")
+    return path
+
+
+def _load_results(name: str, results_dir: str) -> dict:
+    path = name if os.path.isfile(name) else os.path.join(results_dir, f"{name}.json")
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: str, candidate: str, threshold: float = DEFAULT_THRESHOLD,
+            results_dir: str = DEFAULT_RESULTS_DIR) -> List[dict]:
+    """
+    Compares two result files (paths or revisions saved in results_dir) stage by
+    stage and size by size, printing a table.
+    Returns:
+        list[dict]: The regressions: wall time or peak RSS more than threshold
+            (a fraction) above the baseline.
+    """
+    old = {(r['stage'], r['num_rows']): r for r in _load_results(baseline, results_dir)['results']}
+    new = {(r['stage'], r['num_rows']): r for r in _load_results(candidate, results_dir)['results']}
+    regressions = []
+    print(f"{'stage':<26} {'rows':>12} {'time':>9} {'Δtime':>8} {'peak MB':>9} {'Δpeak':>8}")
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (k[1], list(new).index(k))):
+        before, after = old[key], new[key]
+        time_change = after['wall_time_s'] / before['wall_time_s'] - 1 if before['wall_time_s'] else 0.0
+        rss_change = after['peak_rss_bytes'] / before['peak_rss_bytes'] - 1 if before['peak_rss_bytes'] else 0.0
+        flags = [name for name, change in (('time', time_change), ('peak_rss', rss_change)) if change > threshold]
+        if flags:
+            regressions.append({'stage': key[0], 'num_rows': key[1], 'metrics': flags,
+                                'time_change': time_change, 'peak_rss_change': rss_change})
+        print(f"{key[0]:<26} {key[1]:>12,} {after['wall_time_s']:>8.3f}s {time_change:>+8.1%} "
+              f"{after['peak_rss_bytes'] / 2**20:>9.1f} {rss_change:>+8.1%}{'  REGRESSION' if flags else ''}")
+    missing = old.keys() - new.keys()
+    if missing:
+        print(f"{len(missing)} stage/size pair(s) in {baseline} were not measured in {candidate}.")
+    print(f"{len(regressions)} regression(s) past {threshold:.0%}.")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="ShadowPersona performance benchmarks.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Benchmark the current tree and save results for its git revision.")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    run_parser.add_argument('--repeat', type=int, default=1, help="Runs per stage; the fastest is kept.")
+    run_parser.add_argument('--max-workers', type=int, default=None, help="Generation worker processes.")
+    run_parser.add_argument('--revision', default=None, help="Name for the results file; defaults to the git revision.")
+    run_parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR)
+    compare_parser = subparsers.add_parser('compare', help="Compare two saved runs and flag regressions.")
+    compare_parser.add_argument('baseline', help="Baseline revision or results file.")
+    compare_parser.add_argument('candidate', help="Candidate revision or results file.")
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help="Allowed slowdown/growth as a fraction (default 0.10).")
+    compare_parser.add_argument('--results-dir', default=DEFAULT_RESULTS_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run_benchmarks(args.sizes, repeat=args.repeat, max_workers=args.max_workers,
+                       results_dir=args.results_dir, revision=args.revision)
+        return 0
+    regressions = compare(args.baseline, args.candidate, threshold=args.threshold, results_dir=args.results_dir)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# cache.py
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+from typing import Optional
+
+from storage import is_dataset, open_dataset
+
+DEFAULT_CACHE_DIR = '.cache/shadowpersona'
+CACHE_METADATA_FILENAME = '_cache.json'
+
+
+def code_hash(*objects) -> str:
+    """
+    Hashes the source code of the given functions, classes or modules.
+    Any edit to that code changes the hash and so invalidates cache entries
+    keyed on it.
+    """
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+def make_cache_key(name: str, inputs: dict, code: str) -> str:
+    """
+    Derives a content address from a task name, its JSON-serializable inputs
+    and the hash of the code that produces its output.
+    """
+    payload = json.dumps({'name': name, 'inputs': inputs, 'code': code}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def entry_dir(key: str, cache_dir: str = DEFAULT_CACHE_DIR) -> str:
+    """Returns the directory holding the cached dataset for key."""
+    return os.path.join(cache_dir, key)
+
+
+def cached_rows(key: str, cache_dir: str = DEFAULT_CACHE_DIR) -> int:
+    """Returns how many rows the cache holds for key (0 on a miss)."""
+    path = entry_dir(key, cache_dir)
+    return open_dataset(path).num_rows if is_dataset(path) else 0
+
+
+def write_metadata(key: str, inputs: dict, cache_dir: str = DEFAULT_CACHE_DIR):
+    """Records the inputs behind a cache entry next to its data, for inspection."""
+    path = entry_dir(key, cache_dir)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, CACHE_METADATA_FILENAME), 'w') as f:
+        json.dump({'key': key, 'inputs': inputs}, f, indent=2, sort_keys=True)
+
+
+def clear_cache(key: Optional[str] = None, cache_dir: str = DEFAULT_CACHE_DIR):
+    """Removes one cache entry, or the whole cache directory when key is None."""
+    path = entry_dir(key, cache_dir) if key else cache_dir
+    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,117 @@
+# dashboard_data.py
+
+import os
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from rollup import RollupCube
+from schema import read_csv
+from storage import ColumnarDataset, open_dataset
+from user_index import UserIndex
+
+# The dashboard's data access, kept free of Streamlit so it can be benchmarked and
+# reused; streamlit_dashboard.py adds the caching and the layout on top.
+DATASET_NAME = 'shadowpersona_processed_data.cols'
+ROLLUP_NAME = 'shadowpersona_rollup.npz'
+USER_INDEX_NAME = 'shadowpersona_user_index.npz'
+HEATMAP_MEASURES = ['session_time', 'doomscroll_length', 'rage_clicks', 'total_negative_engagement_score']
+
+
+class SharedData(NamedTuple):
+    """
+    Everything the dashboard reads for one version of the data. A single instance
+    is shared, read-only, by every session: dataset is memory-mapped, so sessions
+    share its pages instead of each holding a copy. frame is only set for legacy
+    CSV data, which has no release to map.
+    """
+    source: str
+    dataset: Optional[ColumnarDataset]
+    frame: Optional[pd.DataFrame]
+    cube: RollupCube
+    user_index: UserIndex
+
+    @property
+    def num_rows(self) -> int:
+        return self.dataset.num_rows if self.dataset is not None else len(self.frame)
+
+    def user_ids(self, offsets: Sequence[int]) -> np.ndarray:
+        """The user ids of the rows at offsets."""
+        if self.dataset is not None:
+            return self.dataset.column_take('user_id', offsets)
+        return self.frame['user_id'].to_numpy()[offsets]
+
+    def trait_offsets(self, traits: Sequence[str]) -> np.ndarray:
+        """Row offsets of the users with one of the given traits."""
+        if self.dataset is not None:
+            return self.dataset.where([('predicted_trait_label', 'in', list(traits))])
+        return np.flatnonzero(self.frame['predicted_trait_label'].isin(traits).to_numpy())
+
+    def rows(self, offsets: Sequence[int]) -> pd.DataFrame:
+        """Reads just the rows at offsets."""
+        if self.dataset is not None:
+            return self.dataset.read_rows(offsets)
+        return self.frame.iloc[list(offsets)]
+
+
+def open_release(release: str) -> SharedData:
+    """Opens a release written by the pipeline: already in the shared schema layout, pre-aggregated and indexed."""
+    dataset = open_dataset(os.path.join(release, DATASET_NAME))
+    return SharedData(release, dataset, None, RollupCube.load(os.path.join(release, ROLLUP_NAME)),
+                      UserIndex.load(os.path.join(release, USER_INDEX_NAME)))
+
+
+def open_csv(path: str) -> SharedData:
+    """Loads a legacy CSV export into memory, aggregating and indexing it on the spot."""
+    # The shared schema parses every column straight into its compact dtype
+    df = read_csv(path)
+    # Handle NaN for notif_response_time (important if you have it in your data)
+    df['notif_response_time'] = df['notif_response_time'].replace([np.inf, -np.inf], np.nan)
+    return SharedData(path, None, df, RollupCube.from_frame(df), UserIndex.from_ids(df['user_id'].to_numpy()))
+
+
+def trait_user_index(shared: SharedData, traits: Sequence[str]) -> UserIndex:
+    """
+    Indexes the ids of users with the given traits, for searching within the
+    trait filter. Built from an offset array into the shared data, not a
+    filtered copy of it.
+    """
+    return UserIndex.from_ids(shared.user_ids(shared.trait_offsets(traits)))
+
+
+class DashboardSummary(NamedTuple):
+    """The aggregates behind the dashboard's metrics and charts."""
+    overall: pd.Series
+    responders: pd.Series
+    filtered_count: int
+    trait_counts: pd.DataFrame
+    heatmap: pd.DataFrame
+    emotion_counts: pd.DataFrame
+    category_counts: pd.DataFrame
+
+
+def summarize(cube: RollupCube, traits: Sequence[str]) -> DashboardSummary:
+    """
+    Computes every dashboard aggregate from the rollup cube. Headline metrics
+    cover all users; the charts cover the users with one of the given traits.
+    """
+    filtered = cube.select(predicted_trait_label=traits)
+    trait_counts = filtered.aggregate(by=['predicted_trait_label'], measures=[])['count'].reset_index()
+    trait_counts.columns = ['Trait', 'Count']
+    heatmap = filtered.aggregate(by=['predicted_trait_label'], measures=HEATMAP_MEASURES)
+    heatmap = heatmap[[f'{m}_mean' for m in HEATMAP_MEASURES]].set_axis(HEATMAP_MEASURES, axis=1)
+    emotion_counts = filtered.aggregate(by=['ad_click_emotion'], measures=[])['count'].reset_index()
+    emotion_counts.columns = ['Emotion', 'Count']
+    category_counts = filtered.aggregate(by=['ad_category_clicked'], measures=[])['count'] \
+        .sort_values(ascending=False).reset_index()
+    category_counts.columns = ['Category', 'Count']
+    return DashboardSummary(
+        overall=cube.aggregate().iloc[0],
+        responders=cube.aggregate(by=['active_notif_responder'], measures=[], include_empty=True)['count'],
+        filtered_count=filtered.total_count,
+        trait_counts=trait_counts,
+        heatmap=heatmap,
+        emotion_counts=emotion_counts,
+        category_counts=category_counts,
+    )
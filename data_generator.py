@@ -1,71 +1,264 @@
 # data_generator.py
 
+import os
 import pandas as pd
 import numpy as np
-from faker import Faker
-import random
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import NamedTuple
 
-def generate_user_engagement_data(num_records=1000):
+# Possible ad click emotions, categories and psychological traits (for 'predicted_trait_label' -
+# this would normally be an ML output) are the fixed dictionaries of the shared schema.
+from schema import (AD_EMOTIONS, AD_CATEGORIES, PSYCH_TRAITS, RAW_DTYPES,
+                    AD_EMOTION_DTYPE, AD_CATEGORY_DTYPE, PSYCH_TRAIT_DTYPE)
+from identity import check_identity_columns, generate_identity_columns, load_vocabulary
+
+# Rows per shard when generation is split across processes
+DEFAULT_SHARD_SIZE = 1_000_000
+# Seed of pipeline runs that do not choose one, so plain re-runs hit the cache
+DEFAULT_SEED = 42
+# Rows are seeded in fixed blocks of user ids: block k is drawn from the k-th
+# child of the master seed, so a row depends only on the seed and its user id,
+# never on how the run is split into shards or chunks. Changing this changes
+# every generated dataset.
+SEED_BLOCK_SIZE = 100_000
+
+
+# Every random variable of a row gets its own stream spawned from the batch seed,
+# so the first k rows of a batch do not depend on how many rows it has. That makes
+# shards prefix-stable: regenerating a longer run reproduces the shorter one
+# exactly, which incremental recompute relies on. Append new names at the end only.
+_RANDOM_STREAMS = (
+    'session_time', 'rage_click_chance', 'rage_clicks', 'doomscroll_chance', 'doomscroll_length',
+    'ad_click_emotion', 'feed_bias_score', 'notif_hour', 'notif_minute', 'notif_response_chance',
+    'notif_response_time', 'keyword_sentiment_score', 'ad_category_clicked', 'trait', 'high_negative_trait',
+    'identity_name', 'identity_country', 'identity_city', 'identity_age_band', 'identity_device',
+    'identity_signup_date',
+)
+
+
+def _random_streams(seed):
+    seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    # Build the children explicitly rather than with seq.spawn(), which depends on
+    # how many children were spawned before
+    return {
+        name: np.random.default_rng(np.random.SeedSequence(seq.entropy, spawn_key=seq.spawn_key + (i,)))
+        for i, name in enumerate(_RANDOM_STREAMS)
+    }
+
+
+def generate_engagement_batch(num_records, seed=None, start_id=0, identity_columns=None):
+    """
+    Vectorized batch engine behind the synthetic engagement data.
+    Draws every column as a whole array from seeded np.random.Generator streams
+    (one per random variable) and applies the trait rules with boolean masks
+    instead of a per-row loop. The marginal distributions match the original
+    per-row generator, and row i is the same whatever num_records is.
+    Args:
+        num_records (int): Number of rows to generate.
+        seed (int | np.random.SeedSequence, optional): Seed for the batch.
+        start_id (int): Index of the first user, used to build contiguous user ids.
+        identity_columns (list[str], optional): Identity columns to append (see
+            identity.IDENTITY_COLUMNS), sampled as codes into the identity vocabulary.
+    Returns:
+        pd.DataFrame: A DataFrame containing the simulated user engagement data.
+    """
+    identity_columns = check_identity_columns(identity_columns)
+    rng = _random_streams(seed)
+    n = num_records
+
+    session_time = rng['session_time'].integers(5, 120, n) # 5 to 120 minutes
+    rage_clicks = np.where(rng['rage_click_chance'].random(n) < 0.3, rng['rage_clicks'].integers(0, 15, n), 0) # 30% chance of rage clicks
+    doomscroll_length = np.where(rng['doomscroll_chance'].random(n) < 0.5, rng['doomscroll_length'].uniform(0, 60, n), 0.0) # 50% chance of doomscrolling
+    ad_click_emotion = rng['ad_click_emotion'].integers(0, len(AD_EMOTIONS), n)
+    feed_bias_score = rng['feed_bias_score'].uniform(0, 1, n) # 0 to 1
+
+    # Simulate notification time within a day (hour 8-22, minute 0-58, as in the per-row generator)
+    notif_hour = rng['notif_hour'].integers(8, 23, n)
+    notif_minute = rng['notif_minute'].integers(0, 59, n)
+
+    notif_response_time = np.where(rng['notif_response_chance'].random(n) < 0.7,
+                                   rng['notif_response_time'].uniform(1, 60, n), np.nan) # 70% response, otherwise NaN
+    keyword_sentiment_score = rng['keyword_sentiment_score'].uniform(-1, 1, n) # -1 (negative) to 1 (positive)
+    ad_category_clicked = rng['ad_category_clicked'].integers(0, len(AD_CATEGORIES), n)
+
+    # Simulate predicted_trait_label based on some simple rules for demonstration.
+    # Start from "no specific rule matched" and overwrite in reverse rule order so
+    # the earliest matching rule wins, exactly like the original if/elif chain.
+    trait = rng['trait'].integers(0, len(PSYCH_TRAITS), n)
+    trait[ad_click_emotion == AD_EMOTIONS.index('curiosity')] = PSYCH_TRAITS.index('curious')
+    trait[keyword_sentiment_score < -0.5] = PSYCH_TRAITS.index('skeptical')
+    high_negative = (rage_clicks > 5) | (doomscroll_length > 30)
+    trait[high_negative] = rng['high_negative_trait'].integers(0, 2, n)[high_negative] # 'anxious' or 'impulsive'
+
+    # Emit the shared compact layout directly: categoricals from their codes,
+    # notification time as seconds since midnight and narrow numeric widths.
+    columns = {
+        'user_id': np.arange(start_id, start_id + n),
+        'session_time': session_time,
+        'rage_clicks': rage_clicks,
+        'doomscroll_length': doomscroll_length,
+        'ad_click_emotion': pd.Categorical.from_codes(ad_click_emotion, dtype=AD_EMOTION_DTYPE),
+        'feed_bias_score': feed_bias_score,
+        'notification_time': notif_hour * 3600 + notif_minute * 60,
+        'notif_response_time': notif_response_time,
+        'keyword_sentiment_score': keyword_sentiment_score,
+        'ad_category_clicked': pd.Categorical.from_codes(ad_category_clicked, dtype=AD_CATEGORY_DTYPE),
+        'predicted_trait_label': pd.Categorical.from_codes(trait, dtype=PSYCH_TRAIT_DTYPE) # This is the "ground truth" for simulation
+    }
+    df = pd.DataFrame({
+        column: values if isinstance(values, pd.Categorical) else values.astype(RAW_DTYPES[column])
+        for column, values in columns.items()
+    })
+    if identity_columns:
+        # Opt-in, after the engagement columns; their streams leave the ones above untouched
+        for column, values in generate_identity_columns(identity_columns, rng, n, load_vocabulary()).items():
+            df[column] = values
+    return df
+
+
+class Shard(NamedTuple):
+    """
+    One contiguous slice of a generation run and the master seed its seed
+    blocks are spawned from.
+    """
+    index: int
+    start_id: int
+    num_records: int
+    seed: np.random.SeedSequence
+
+
+def plan_shards(num_records, seed=None, shard_size=DEFAULT_SHARD_SIZE, start_id=0):
+    """
+    Splits a generation run into fixed-size shards, the units of work handed to
+    worker processes. Shard i covers user ids [i * shard_size, (i + 1) * shard_size);
+    its rows come from the seed blocks of those ids (see SEED_BLOCK_SIZE), so the
+    output depends only on num_records and seed - never on shard_size or the
+    worker count. Shard sizes that are multiples of SEED_BLOCK_SIZE avoid
+    generating rows twice.
+    Args:
+        num_records (int): Total number of rows (the end of the user id range).
+        seed (int, optional): Master seed; None draws fresh entropy once for the whole run.
+        shard_size (int): Maximum rows per shard.
+        start_id (int): First user id to generate; earlier rows are left out of the plan.
+    Returns:
+        list[Shard]: The shards covering [start_id, num_records) in user id order.
+    """
+    if shard_size <= 0:
+        raise ValueError(f"shard_size must be positive, got {shard_size}")
+    master = np.random.SeedSequence(seed)
+    shards = []
+    for index in range(start_id // shard_size, -(-num_records // shard_size)):
+        shard_start = max(index * shard_size, start_id)
+        shards.append(Shard(index, shard_start, min((index + 1) * shard_size, num_records) - shard_start, master))
+    return shards
+
+
+def plan_partitions(num_records, partitions, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Splits [0, num_records) into at most `partitions` contiguous (start_id, stop_id)
+    ranges of whole shards. Partitions generated separately give the same rows
+    as one run with the same seed.
+    """
+    if partitions <= 0:
+        raise ValueError(f"partitions must be positive, got {partitions}")
+    num_shards = -(-num_records // shard_size)
+    partition_size = -(-num_shards // partitions) * shard_size
+    return [(start, min(start + partition_size, num_records)) for start in range(0, num_records, partition_size)]
+
+
+def generate_shard(shard, identity_columns=None):
+    """
+    Generates the rows of a single shard, one seed block at a time. A shard
+    starting part-way through a block generates the block's earlier rows and
+    drops them, as a block's rows do not depend on how many are drawn.
+    """
+    stop_id = shard.start_id + shard.num_records
+    frames = []
+    for block in range(shard.start_id // SEED_BLOCK_SIZE, -(-stop_id // SEED_BLOCK_SIZE)):
+        block_start = block * SEED_BLOCK_SIZE
+        seed = np.random.SeedSequence(shard.seed.entropy, spawn_key=shard.seed.spawn_key + (block,))
+        df = generate_engagement_batch(min(stop_id, block_start + SEED_BLOCK_SIZE) - block_start, seed=seed,
+                                       start_id=block_start, identity_columns=identity_columns)
+        frames.append(df.iloc[max(shard.start_id - block_start, 0):])
+    if not frames:
+        return generate_engagement_batch(0, identity_columns=identity_columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def generate_sharded(num_records, seed=None, shard_size=DEFAULT_SHARD_SIZE, max_workers=None, start_id=0,
+                     identity_columns=None):
+    """
+    Generates num_records rows as independent shards on a process pool.
+    The result is bit-for-bit identical for a given seed whatever shard_size and
+    max_workers are, including the in-process path used for a single shard or worker.
+    Args:
+        num_records (int): Total number of rows.
+        seed (int, optional): Master seed for the run.
+        shard_size (int): Maximum rows per shard.
+        max_workers (int, optional): Worker processes; defaults to the CPU count.
+        start_id (int): First user id to generate, to extend a run that already has start_id rows.
+        identity_columns (list[str], optional): Identity columns to add to every shard.
+    Returns:
+        pd.DataFrame: The concatenated shards with contiguous user ids.
+    """
+    shards = plan_shards(num_records, seed=seed, shard_size=shard_size, start_id=start_id)
+    if not shards:
+        return generate_engagement_batch(0, identity_columns=identity_columns)
+    generate = partial(generate_shard, identity_columns=identity_columns)
+    if len(shards) == 1 or max_workers == 1:
+        frames = [generate(shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            frames = list(executor.map(generate, shards))
+    return pd.concat(frames, ignore_index=True)
+
+
+def iter_sharded(num_records, seed=None, shard_size=DEFAULT_SHARD_SIZE, max_workers=None, start_id=0,
+                 identity_columns=None):
+    """
+    Yields the shards of a generation run one DataFrame at a time, in user id order.
+    At most max_workers shards are in flight on the process pool, so memory stays
+    bounded by a handful of shards however large num_records is. The concatenated
+    output equals generate_sharded(num_records, seed, start_id=start_id,
+    identity_columns=identity_columns).
+    Args:
+        num_records (int): Total number of rows.
+        seed (int, optional): Master seed for the run.
+        shard_size (int): Maximum rows per shard (the chunk size).
+        max_workers (int, optional): Worker processes; defaults to the CPU count.
+        start_id (int): First user id to generate.
+        identity_columns (list[str], optional): Identity columns to add to every shard.
+    Yields:
+        pd.DataFrame: One shard of generated rows.
+    """
+    shards = plan_shards(num_records, seed=seed, shard_size=shard_size, start_id=start_id)
+    generate = partial(generate_shard, identity_columns=identity_columns)
+    if len(shards) <= 1 or max_workers == 1:
+        for shard in shards:
+            yield generate(shard)
+        return
+    window = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=window) as executor:
+        pending = deque()
+        for shard in shards:
+            pending.append(executor.submit(generate, shard))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def generate_user_engagement_data(num_records=1000, seed=None, shard_size=DEFAULT_SHARD_SIZE, max_workers=None,
+                                  identity_columns=None):
     """
     Generates a synthetic dataset for user engagement and psychological profiling.
     Mimics the schema: shadowpersona_user_engagement.csv
+    identity_columns optionally adds demographic and device columns (see identity.py).
     """
-    fake = Faker()
-    data = []
-
-    # Define possible ad click emotions and categories
-    ad_emotions = ['anger', 'curiosity', 'joy', 'sadness', 'surprise', 'neutral']
-    ad_categories = ['finance', 'travel', 'fashion', 'tech', 'food', 'gaming', 'news']
-
-    # Define possible psychological traits (for 'predicted_trait_label' - this would normally be an ML output)
-    # We'll assign these probabilistically for simulation purposes.
-    psych_traits = ['anxious', 'impulsive', 'curious', 'skeptical', 'compliant', 'distracted']
-
-    for i in range(num_records):
-        user_id = f"user_{i:05d}"
-        session_time = np.random.randint(5, 120) # 5 to 120 minutes
-        rage_clicks = np.random.randint(0, 15) if np.random.rand() < 0.3 else 0 # 30% chance of rage clicks
-        doomscroll_length = np.random.uniform(0, 60) if np.random.rand() < 0.5 else 0 # 50% chance of doomscrolling
-        ad_click_emotion = random.choice(ad_emotions)
-        feed_bias_score = np.random.uniform(0, 1) # 0 to 1
-        
-        # Simulate notification time within a day
-        base_time = datetime(2023, 1, 1, np.random.randint(8, 23), np.random.randint(0, 59))
-        notification_time_str = base_time.strftime("%H:%M:%S")
-
-        notif_response_time = np.random.uniform(1, 60) if np.random.rand() < 0.7 else np.nan # 70% response, otherwise NaN
-        keyword_sentiment_score = np.random.uniform(-1, 1) # -1 (negative) to 1 (positive)
-        ad_category_clicked = random.choice(ad_categories)
-
-        # Simulate predicted_trait_label based on some simple rules for demonstration
-        # In a real scenario, this would come from your ML model.
-        # Here, we're just creating plausible "ground truth" for the simulated data.
-        if rage_clicks > 5 or doomscroll_length > 30:
-            predicted_trait_label = random.choice(['anxious', 'impulsive'])
-        elif keyword_sentiment_score < -0.5:
-            predicted_trait_label = 'skeptical'
-        elif ad_click_emotion == 'curiosity':
-            predicted_trait_label = 'curious'
-        else:
-            predicted_trait_label = random.choice(psych_traits) # pick from all if no specific rule matched
-
-        data.append({
-            'user_id': user_id,
-            'session_time': session_time,
-            'rage_clicks': rage_clicks,
-            'doomscroll_length': doomscroll_length,
-            'ad_click_emotion': ad_click_emotion,
-            'feed_bias_score': feed_bias_score,
-            'notification_time': notification_time_str,
-            'notif_response_time': notif_response_time,
-            'keyword_sentiment_score': keyword_sentiment_score,
-            'ad_category_clicked': ad_category_clicked,
-            'predicted_trait_label': predicted_trait_label # This is the "ground truth" for simulation
-        })
-
-    df = pd.DataFrame(data)
-    return df
+    return generate_sharded(num_records, seed=seed, shard_size=shard_size, max_workers=max_workers,
+                            identity_columns=identity_columns)
 
 if __name__ == "__main__":
     print("Generating synthetic user engagement data...")
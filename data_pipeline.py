@@ -1,23 +1,216 @@
 # data_pipeline.py
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
 from prefect import flow
-from tasks import generate_data, feature_engineer_data, save_data
+from prefect.task_runners import ProcessPoolTaskRunner, ThreadPoolTaskRunner
+from data_generator import DEFAULT_SEED, DEFAULT_SHARD_SIZE, plan_partitions
+from cache import DEFAULT_CACHE_DIR
+from identity import load_vocabulary
+from releases import DEFAULT_DATA_DIR, create_release, discard_release
+from storage import partition_path
+from training import DEFAULT_TIME_BUDGET_S
+from tasks import (generate_data, feature_engineer_data, save_data,
+                   generate_data_chunks, feature_engineer_chunks, save_data_chunks,
+                   processed_data_cache_key, lookup_cached_data, load_cached_data, update_cache,
+                   cache_data_chunks, load_cached_data_chunks, build_rollup, build_user_index,
+                   train_model, publish_data_release, write_partition_manifest)
+
+TASK_RUNNERS = {'thread': ThreadPoolTaskRunner, 'process': ProcessPoolTaskRunner}
+
+
+@flow(name="ShadowPersona Partitioned Build", log_prints=True)
+def shadowpersona_partitioned_build(num_records: int, seed: int, shard_size: int, partitions: int,
+                                    dataset_path: str, csv_path: Optional[str] = None,
+                                    max_in_flight: Optional[int] = None,
+                                    identity_columns: Optional[List[str]] = None) -> int:
+    """
+    Generates, engineers and saves the data as independent partitions of whole
+    shards, each written to its own dataset inside dataset_path, then writes
+    the manifest that makes them one dataset. Every partition is a chain of
+    task submissions on the flow's task runner, so partitions overlap: one is
+    saved while the next ones are generated and engineered. At most
+    max_in_flight partitions (default: the CPU count, at least 2) are held in
+    memory at once.
+    """
+    if identity_columns:
+        # Built here if missing, so the partition workers only ever read it
+        load_vocabulary()
+    bounds = plan_partitions(num_records, partitions, shard_size)
+    paths = [partition_path(dataset_path, i) for i in range(len(bounds))]
+    csv_parts = [f"{csv_path}.part-{i:05d}" for i in range(len(bounds))] if csv_path else None
+    window = max_in_flight or max(os.cpu_count() or 1, 2)
+    print(f"Building {len(bounds)} partitions of up to {bounds[0][1] - bounds[0][0]} rows, {window} at a time...")
+    saves = []
+    for i, (start_id, stop_id) in enumerate(bounds):
+        if i >= window:
+            saves[i - window].wait()
+        raw = generate_data.submit(num_records=stop_id, seed=seed, shard_size=shard_size, max_workers=1, start_id=start_id,
+                                   identity_columns=identity_columns)
+        processed = feature_engineer_data.submit(df=raw)
+        saves.append(save_data.submit(df=processed, dataset_path=paths[i], csv_path=csv_parts[i] if csv_parts else None))
+    rows = sum(save.result() for save in saves)
+    write_partition_manifest(dataset_path=dataset_path, partition_paths=paths, csv_parts=csv_parts, csv_path=csv_path)
+    return rows
+
+
+def _cache_plan(num_records: int, seed: Optional[int], use_cache: bool, incremental: bool, cache_dir: str,
+                identity_columns: Optional[List[str]]) -> Tuple[Optional[str], int, dict]:
+    # Returns the cache key (None when not caching), the first row to compute
+    # (rows before it come from the cache) and the inputs recorded with the cache
+    cache_key, cached = None, 0
+    if use_cache and seed is not None:
+        cache_key = processed_data_cache_key(seed=seed, identity_columns=identity_columns)
+        cached = lookup_cached_data(cache_key=cache_key, cache_dir=cache_dir)
+    elif use_cache:
+        print("No seed given; output is not reproducible, so the cache is skipped.")
+    start_id = min(cached, num_records) if incremental or cached >= num_records else 0
+    return cache_key, start_id, {'seed': seed, 'identity_columns': identity_columns}
+
+
+@flow(name="ShadowPersona Batch Build", log_prints=True)
+def shadowpersona_batch_build(num_records: int, seed: Optional[int], shard_size: int, max_workers: Optional[int],
+                              dataset_path: str, csv_path: Optional[str] = None, use_cache: bool = True,
+                              incremental: bool = True, cache_dir: str = DEFAULT_CACHE_DIR,
+                              identity_columns: Optional[List[str]] = None):
+    """
+    Generates, engineers and saves the data as whole frames. Generation is
+    split into shards of shard_size rows on up to max_workers processes.
+    Cached rows are reused, and with incremental only the rows beyond the
+    cache are computed and appended to it.
+    """
+    cache_key, start_id, cache_inputs = _cache_plan(num_records, seed, use_cache, incremental, cache_dir,
+                                                    identity_columns)
+    if start_id == num_records:
+        # 1-2. Reuse cached generated and engineered data
+        processed_df = load_cached_data(cache_key=cache_key, num_records=num_records, cache_dir=cache_dir)
+    else:
+        # 1. Generate Raw Data (only the rows the cache does not hold)
+        raw_df = generate_data(num_records=num_records, seed=seed, shard_size=shard_size,
+                               max_workers=max_workers, start_id=start_id, identity_columns=identity_columns)
+
+        # 2. Perform Feature Engineering
+        processed_df = feature_engineer_data(df=raw_df)
+
+        if cache_key is not None:
+            update_cache(df=processed_df, cache_key=cache_key, inputs=cache_inputs, append=start_id > 0, cache_dir=cache_dir)
+            if start_id:
+                processed_df = load_cached_data(cache_key=cache_key, num_records=num_records, cache_dir=cache_dir)
+
+    # 3. Save Processed Data
+    save_data(df=processed_df, dataset_path=dataset_path, csv_path=csv_path)
+
+
+@flow(name="ShadowPersona Streaming Build", log_prints=True)
+def shadowpersona_streaming_build(num_records: int, seed: Optional[int], chunk_size: int, max_workers: Optional[int],
+                                  dataset_path: str, csv_path: Optional[str] = None, use_cache: bool = True,
+                                  incremental: bool = True, cache_dir: str = DEFAULT_CACHE_DIR,
+                                  identity_columns: Optional[List[str]] = None):
+    """
+    Streams chunks of chunk_size rows through generation, feature engineering
+    and an appending save one at a time, so the full dataset is never held in
+    memory. The cache is used as in the batch build, a chunk at a time.
+    """
+    cache_key, start_id, cache_inputs = _cache_plan(num_records, seed, use_cache, incremental, cache_dir,
+                                                    identity_columns)
+    if start_id == num_records:
+        engineered_chunks = load_cached_data_chunks(cache_key=cache_key, num_records=num_records, cache_dir=cache_dir)
+    else:
+        chunks = generate_data_chunks(num_records=num_records, seed=seed, chunk_size=chunk_size,
+                                      max_workers=max_workers, start_id=start_id, identity_columns=identity_columns)
+        engineered_chunks = feature_engineer_chunks(chunks=chunks)
+        if cache_key is not None:
+            engineered_chunks = cache_data_chunks(chunks=engineered_chunks, cache_key=cache_key, inputs=cache_inputs,
+                                                  start_id=start_id, cache_dir=cache_dir)
+    save_data_chunks(chunks=engineered_chunks, dataset_path=dataset_path, csv_path=csv_path)
+
 
 @flow(name="ShadowPersona Data Pipeline", log_prints=True)
-def shadowpersona_data_pipeline(num_records: int = 5000, output_filename: str = 'shadowpersona_processed_data.csv'):
+def shadowpersona_data_pipeline(num_records: int = 5000, output_filename: str = 'shadowpersona_processed_data.csv',
+                                seed: Optional[int] = DEFAULT_SEED, shard_size: int = DEFAULT_SHARD_SIZE,
+                                max_workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                                dataset_name: str = 'shadowpersona_processed_data.cols', export_csv: bool = True,
+                                use_cache: bool = True, incremental: bool = True, cache_dir: str = DEFAULT_CACHE_DIR,
+                                rollup_name: str = 'shadowpersona_rollup.npz',
+                                user_index_name: str = 'shadowpersona_user_index.npz',
+                                model_name: str = 'shadowpersona_trait_model.joblib', train: bool = False,
+                                model_time_budget_s: float = DEFAULT_TIME_BUDGET_S,
+                                partitions: Optional[int] = None, task_runner: str = 'thread',
+                                identity_columns: Optional[List[str]] = None, data_dir: str = DEFAULT_DATA_DIR):
     """
     Orchestrates the data generation, feature engineering, and saving steps.
+    The data is built by one of three subflows, which only differ in how they
+    execute; the rows only depend on seed:
+    - batch (default): shadowpersona_batch_build generates shards of
+      shard_size rows on up to max_workers processes, as whole frames.
+    - streaming (chunk_size set): shadowpersona_streaming_build passes chunks of
+      chunk_size rows through every step one at a time, so the full dataset is
+      never held in memory.
+    - partitioned (partitions set): shadowpersona_partitioned_build builds that
+      many partitions (one dataset each, plus a manifest) on a 'thread' or
+      'process' task_runner with max_workers workers, overlapping the saving of
+      one partition with the computing of the next. The processed-data cache
+      is not used.
+    The processed data is stored as a memory-mappable columnar dataset named
+    dataset_name in a new release directory under {data_dir}/releases/;
+    export_csv also writes {data_dir}/{output_filename}.
+    With use_cache, processed rows are cached in cache_dir under a key derived
+    from the seed and the generation/feature code. A re-run then skips
+    generation and feature engineering, and with incremental a larger
+    num_records only generates and engineers the rows beyond the cache. seed
+    defaults to DEFAULT_SEED so plain re-runs hit the cache; seed=None draws
+    fresh data on every run and skips the cache.
+    Finally the stored data is pre-aggregated into the dashboard's rollup cube
+    ({rollup_name}) and indexed by user id ({user_index_name}) in the same
+    release, which is then published atomically for the dashboard to pick up.
+    A run that fails before publishing removes its release directory.
+    With train, a trait classifier is selected within model_time_budget_s and
+    saved to the release as {model_name} for scoring.
+    identity_columns adds synthetic demographic and device columns (any of
+    identity.IDENTITY_COLUMNS) to the data, drawn from a vocabulary built with
+    Faker once and reused from identity.DEFAULT_VOCABULARY_PATH.
     """
+    if chunk_size is not None and partitions is not None:
+        raise ValueError("chunk_size and partitions are alternative execution modes; set only one.")
+    if partitions is not None and task_runner not in TASK_RUNNERS:
+        raise ValueError(f"task_runner must be one of {list(TASK_RUNNERS)}, got {task_runner!r}.")
     print("Starting ShadowPersona Data Pipeline...")
-    
-    # 1. Generate Raw Data
-    raw_df = generate_data(num_records=num_records)
+    release_path = create_release(data_dir)
+    dataset_path = os.path.join(release_path, dataset_name)
+    csv_path = os.path.join(data_dir, output_filename) if export_csv else None
 
-    # 2. Perform Feature Engineering
-    processed_df = feature_engineer_data(df=raw_df)
+    try:
+        # 1-3. Generate, engineer and save the data
+        if partitions is not None:
+            # Drawn once, so partitions built separately still share one seed
+            run_seed = seed if seed is not None else int(np.random.SeedSequence().entropy)
+            build = shadowpersona_partitioned_build.with_options(task_runner=TASK_RUNNERS[task_runner](max_workers=max_workers))
+            build(num_records=num_records, seed=run_seed, shard_size=shard_size, partitions=partitions,
+                  dataset_path=dataset_path, csv_path=csv_path, max_in_flight=max_workers, identity_columns=identity_columns)
+        elif chunk_size is not None:
+            shadowpersona_streaming_build(num_records=num_records, seed=seed, chunk_size=chunk_size, max_workers=max_workers,
+                                          dataset_path=dataset_path, csv_path=csv_path, use_cache=use_cache,
+                                          incremental=incremental, cache_dir=cache_dir, identity_columns=identity_columns)
+        else:
+            shadowpersona_batch_build(num_records=num_records, seed=seed, shard_size=shard_size, max_workers=max_workers,
+                                      dataset_path=dataset_path, csv_path=csv_path, use_cache=use_cache,
+                                      incremental=incremental, cache_dir=cache_dir, identity_columns=identity_columns)
+
+        # 4. Pre-aggregate, index and train the trait model
+        build_rollup(dataset_path=dataset_path, rollup_path=os.path.join(release_path, rollup_name))
+        build_user_index(dataset_path=dataset_path, index_path=os.path.join(release_path, user_index_name))
+        if train:
+            train_model(dataset_path=dataset_path, model_path=os.path.join(release_path, model_name),
+                        time_budget_s=model_time_budget_s)
+    except BaseException:
+        # A failed run's release is never published, so remove what it wrote
+        discard_release(release_path)
+        raise
+
+    # 5. Publish the release to the dashboard
+    publish_data_release(release_path=release_path, data_dir=data_dir)
 
-    # 3. Save Processed Data
-    save_data(df=processed_df, output_path=f"data/{output_filename}")
-    
     print("ShadowPersona Data Pipeline completed successfully.")
 
 if __name__ == "__main__":
@@ -1,55 +1,69 @@
 # eda_analysis.py (or in a Jupyter Notebook)
 
-import pandas as pd
-import numpy as np
-import sweetviz as sv # Optional, for quick auto-EDA
-# import dtale # Optional, for interactive EDA (might be a bit heavier than sweetviz)
+from schema import read_csv
+from features import compute_features
+from profiler import DEFAULT_CHUNK_SIZE, profile_csv, profile_dataset, write_report
+from storage import is_dataset, open_dataset
+# import dtale # Optional, for interactive EDA (might be a bit heavier than the built-in profiler)
 
-def perform_eda_and_feature_engineering(filepath='data/shadowpersona_user_engagement.csv'):
+def read_sample(filepath, rows=DEFAULT_CHUNK_SIZE):
     """
-    Loads data, performs basic EDA, and light feature engineering.
+    Reads the head of a CSV (its first `rows` rows) or of a columnar dataset
+    (its first row group) without loading the rest.
+    """
+    if is_dataset(filepath):
+        dataset = open_dataset(filepath)
+        sample = next(dataset.iter_row_groups(), None)
+        return sample if sample is not None else dataset.read()
+    return read_csv(filepath, nrows=rows)
+
+
+def perform_eda_and_feature_engineering(filepath='data/shadowpersona_user_engagement.csv', max_workers=None):
+    """
+    Performs basic EDA and light feature engineering in constant memory.
+    Descriptive statistics and the HTML/JSON report come from the streaming
+    profiler, which reads the whole file in chunks on up to max_workers
+    processes; the info and feature previews only look at a sample from the
+    head of the file (see read_sample).
+    filepath may also be a columnar dataset written by the pipeline; a
+    partitioned one is read through its manifest.
+    Returns:
+        pd.DataFrame: The sample with the registered features added.
     """
     try:
-        df = pd.read_csv(filepath)
+        df = read_sample(filepath)
         print("Data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {filepath}. Please run data_generator.py first.")
         return None
 
-    print("\n--- Initial Data Info ---")
+    print(f"\n--- Initial Data Info (first {len(df)} rows) ---")
     df.info()
     print("\n--- First 5 Rows ---")
     print(df.head())
     print("\n--- Descriptive Statistics ---")
-    print(df.describe(include='all'))
+    # Single pass over the file in chunks, raw columns plus the registered features
+    if is_dataset(filepath):
+        profile = profile_dataset(filepath, max_workers=max_workers)
+    else:
+        profile = profile_csv(filepath, max_workers=max_workers)
+    print(profile.describe())
 
     # --- Light Feature Engineering ---
-    # Example: Create a 'total_negative_engagement_score'
-    df['total_negative_engagement_score'] = df['rage_clicks'] * 0.5 + df['doomscroll_length'] * 0.7
-
-    # Example: Binary feature for "active_notif_responder"
-    df['active_notif_responder'] = (~df['notif_response_time'].isna()).astype(int)
-
-    # Example: Simple classification of feed bias
-    df['feed_bias_category'] = pd.cut(df['feed_bias_score'], bins=[0, 0.3, 0.7, 1.0],
-                                      labels=['left_leaning', 'neutral', 'right_leaning'], include_lowest=True)
+    # Same registered features as the pipeline: total_negative_engagement_score,
+    # the binary active_notif_responder flag and the feed_bias_category buckets.
+    # Only the sample is engineered here; the profile covers every row.
+    df = compute_features(df)
 
     print("\n--- Data after Feature Engineering ---")
     print(df[['rage_clicks', 'doomscroll_length', 'total_negative_engagement_score',
               'notif_response_time', 'active_notif_responder', 'feed_bias_score', 'feed_bias_category']].head())
     print(df.info())
 
-    # --- Optional: Automated EDA (Sweetviz) ---
-    # This might take a few seconds but gives a great report.
-    # If you have memory issues, comment this out.
-    try:
-        print("\n--- Generating Sweetviz EDA Report (can be memory intensive for large datasets) ---")
-        advert_report = sv.analyze(df)
-        advert_report.show_html('reports/eda_report.html') # Default will open in your web browser
-        print("Sweetviz report generated: reports/eda_report.html")
-    except Exception as e:
-        print(f"Could not generate Sweetviz report: {e}. You might be low on memory or Sweetviz might need specific dependencies.")
-
+    # --- Automated EDA Report ---
+    # Built from the profile above, so it costs no extra pass over the data
+    write_report(profile, 'reports/eda_report.html', 'reports/eda_report.json')
+    print("EDA report generated: reports/eda_report.html (profile data in reports/eda_report.json)")
 
     return df
 
@@ -0,0 +1,479 @@
+# event_stream.py
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from features import compute_feature_arrays
+from schema import AD_CATEGORIES, AD_EMOTIONS, FEATURE_DTYPES, USER_ID_PREFIX
+from storage import write_dataset
+
+# Event-level ingestion. Instead of one pre-aggregated row per user, raw events
+# arrive one JSON object per line, e.g.
+#   {"user_id": "user_00042", "ts": 1718700000.5, "type": "rage_click"}
+# and fold into per-user state held in flat NumPy arrays with one slot per
+# user, handed out in order of first appearance.
+# Only base counters and latest values are kept per event; the registered
+# features are derived from them by features.py when a snapshot is taken.
+# WINDOWED measures are also kept per time bucket in a small per-user ring, so
+# their value over the last window_s seconds is a sum over a few slots.
+#
+# Event types and their fields:
+#   session               minutes  -> session_time
+#   rage_click                     -> rage_clicks (+1)
+#   scroll                minutes  -> doomscroll_length
+#   notification                   -> notification_time (seconds since midnight of ts)
+#   notification_response seconds  -> notif_response_time
+#   ad_click              emotion, category -> ad_click_emotion, ad_category_clicked
+#   sentiment             score    -> keyword_sentiment_score (running mean)
+#   feed_bias             score    -> feed_bias_score
+EVENT_TYPES = ['session', 'rage_click', 'scroll', 'notification', 'notification_response',
+               'ad_click', 'sentiment', 'feed_bias']
+WINDOWED = ['session_time', 'rage_clicks', 'doomscroll_length', 'notif_responses']
+DEFAULT_WINDOW_S = 3600
+DEFAULT_BUCKETS = 12
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_CHECKPOINT_INTERVAL_S = 30.0
+DEFAULT_POLL_INTERVAL_S = 0.5
+DEFAULT_CHECKPOINT_PATH = 'data/stream_state.npz'
+INITIAL_CAPACITY = 1024
+# Snapshots store user ids as uint32
+MAX_USER_ID = np.iinfo(np.uint32).max
+# Event type -> its numeric field
+_NUMERIC_FIELDS = {'session': 'minutes', 'scroll': 'minutes', 'notification_response': 'seconds',
+                   'sentiment': 'score', 'feed_bias': 'score'}
+
+# Per-user arrays: name -> (dtype, value of a user with no events yet)
+_FIELDS = {
+    'user_id': (np.uint32, 0),
+    'session_time': (np.float32, 0.0),
+    'rage_clicks': (np.uint32, 0),
+    'doomscroll_length': (np.float32, 0.0),
+    'notification_time': (np.int32, -1),
+    'notif_response_time': (np.float32, np.nan),
+    'ad_click_emotion': (np.int8, -1),
+    'ad_category_clicked': (np.int8, -1),
+    'feed_bias_score': (np.float32, np.nan),
+    'sentiment_sum': (np.float64, 0.0),
+    'sentiment_count': (np.uint32, 0),
+    'last_event_ts': (np.float64, np.nan),
+}
+
+
+def parse_user_id(value) -> int:
+    """Accepts 42 or 'user_00042'; raises ValueError outside [0, MAX_USER_ID]."""
+    if isinstance(value, str):
+        user_id = int(value.removeprefix(USER_ID_PREFIX))
+    elif isinstance(value, int) and not isinstance(value, bool):
+        user_id = value
+    else:
+        raise ValueError(f"User id {value!r} is not an integer or a '{USER_ID_PREFIX}' string.")
+    if not 0 <= user_id <= MAX_USER_ID:
+        raise ValueError(f"User id {user_id} is outside [0, {MAX_USER_ID}].")
+    return user_id
+
+
+def _finite(event: dict, field: str) -> float:
+    value = event[field]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"Event field '{field}' must be a finite number, got {value!r}.")
+    return float(value)
+
+
+def parse_event(event) -> Optional[Tuple[str, int, float, object]]:
+    """
+    Validates one event and returns (type, user id, ts, value), where value is
+    the type's numeric field, the (emotion, category) codes of an ad click
+    (-1 for unknown names) or None. Returns None for unknown event types.
+    Raises:
+        ValueError: The event is malformed.
+    """
+    if not isinstance(event, dict):
+        raise ValueError(f"Event {event!r} is not a JSON object.")
+    kind = event.get('type')
+    if kind not in EVENT_TYPES:
+        return None
+    try:
+        user_id = parse_user_id(event['user_id'])
+        ts = _finite(event, 'ts')
+        if kind in _NUMERIC_FIELDS:
+            value = _finite(event, _NUMERIC_FIELDS[kind])
+        elif kind == 'ad_click':
+            value = (AD_EMOTIONS.index(event['emotion']) if event.get('emotion') in AD_EMOTIONS else -1,
+                     AD_CATEGORIES.index(event['category']) if event.get('category') in AD_CATEGORIES else -1)
+        else:
+            value = None
+    except KeyError as e:
+        raise ValueError(f"{kind} event is missing {e}.") from None
+    if kind in ('session', 'scroll', 'notification_response') and value < 0:
+        raise ValueError(f"{kind} event has a negative {_NUMERIC_FIELDS[kind]}.")
+    return kind, user_id, ts, value
+
+
+def _last_per_user(users: np.ndarray) -> np.ndarray:
+    # Positions of each user's last event in the batch, so the latest value wins
+    _, reversed_first = np.unique(users[::-1], return_index=True)
+    return len(users) - 1 - reversed_first
+
+
+class UserFeatureState:
+    """
+    Per-user engagement state built from events. Every field is one array with
+    a slot per user (grown by doubling); slots are handed out as users first
+    appear, and the 'user_id' array and the slots dict map between the two, so
+    the arrays grow with the number of users, not with the size of their ids.
+    Each windowed measure is a (users, buckets) array plus the bucket number
+    each window slot currently holds; a window slot is cleared when its user's
+    next event in it belongs to a newer bucket.
+    Args:
+        window_s (int): Length of the rolling window in seconds.
+        buckets (int): Slots the window is divided into.
+    """
+    def __init__(self, window_s: int = DEFAULT_WINDOW_S, buckets: int = DEFAULT_BUCKETS,
+                 arrays: Optional[Dict[str, np.ndarray]] = None, events: int = 0, watermark: float = float('nan'),
+                 rejected: int = 0):
+        if window_s % buckets:
+            raise ValueError(f"window_s ({window_s}) must be a multiple of buckets ({buckets}).")
+        self.window_s = window_s
+        self.buckets = buckets
+        self.bucket_s = window_s // buckets
+        self.events = events
+        self.rejected = rejected
+        self.watermark = watermark
+        if arrays is None:
+            arrays, user_ids = self._allocate(INITIAL_CAPACITY), []
+        else:
+            # Saved arrays hold exactly the used slots
+            user_ids = arrays['user_id'].tolist()
+        self.arrays = arrays
+        self.slots: Dict[int, int] = {user_id: slot for slot, user_id in enumerate(user_ids)}
+
+    def _allocate(self, capacity: int) -> Dict[str, np.ndarray]:
+        arrays = {name: np.full(capacity, fill, dtype=dtype) for name, (dtype, fill) in _FIELDS.items()}
+        arrays['window_epoch'] = np.full((capacity, self.buckets), -1, dtype=np.int64)
+        for name in WINDOWED:
+            arrays[f'window_{name}'] = np.zeros((capacity, self.buckets), dtype=np.float32)
+        return arrays
+
+    @property
+    def capacity(self) -> int:
+        return len(self.arrays['user_id'])
+
+    @property
+    def num_users(self) -> int:
+        return len(self.slots)
+
+    def _ensure_capacity(self, size: int):
+        if size <= self.capacity:
+            return
+        capacity = max(self.capacity, INITIAL_CAPACITY)
+        while capacity < size:
+            capacity *= 2
+        grown = self._allocate(capacity)
+        for name, array in self.arrays.items():
+            grown[name][:len(array)] = array
+        self.arrays = grown
+
+    def _add_windowed(self, name: str, users: np.ndarray, ts: np.ndarray, amounts: np.ndarray):
+        epoch = self.arrays['window_epoch']
+        values = self.arrays[f'window_{name}']
+        bucket = (ts // self.bucket_s).astype(np.int64)
+        slot = bucket % self.buckets
+        previous = epoch[users, slot]
+        np.maximum.at(epoch, (users, slot), bucket)
+        newest = epoch[users, slot]
+        # Slots moving on to a newer bucket start over, in every windowed measure
+        advanced = previous < newest
+        for windowed in WINDOWED:
+            self.arrays[f'window_{windowed}'][users[advanced], slot[advanced]] = 0
+        # Events older than what their slot now holds have left the window
+        current = bucket == newest
+        np.add.at(values, (users[current], slot[current]), amounts[current])
+
+    def apply(self, events: Iterable[dict]) -> int:
+        """
+        Folds a batch of events into the state, one vectorized update per event
+        type. Within a batch, events are taken in order, so for latest-value
+        fields the last event of a user wins. Every event is validated (see
+        parse_event) before the state is touched; malformed events are skipped
+        and counted in rejected, as are events of unknown types.
+        Returns:
+            int: The number of events applied.
+        """
+        columns: Dict[str, Tuple[List[int], List[float], List]] = {kind: ([], [], []) for kind in EVENT_TYPES}
+        new_users = []
+        for event in events:
+            try:
+                parsed = parse_event(event)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                self.rejected += 1
+                continue
+            kind, user_id, ts, value = parsed
+            slot = self.slots.get(user_id)
+            if slot is None:
+                slot = self.slots[user_id] = len(self.slots)
+                new_users.append(user_id)
+            columns[kind][0].append(slot)
+            columns[kind][1].append(ts)
+            columns[kind][2].append(value)
+        applied = sum(len(users) for users, _, _ in columns.values())
+        if not applied:
+            return 0
+        self._ensure_capacity(self.num_users)
+        a = self.arrays
+        a['user_id'][self.num_users - len(new_users):self.num_users] = new_users
+
+        for kind, (user_list, ts_list, value_list) in columns.items():
+            if not user_list:
+                continue
+            users = np.asarray(user_list, dtype=np.int64)
+            ts = np.asarray(ts_list, dtype=np.float64)
+            last = _last_per_user(users)
+            a['last_event_ts'][users[last]] = np.fmax(a['last_event_ts'][users[last]], ts[last])
+            self.watermark = float(np.fmax(self.watermark, ts.max()))
+
+            if kind in ('session', 'scroll'):
+                minutes = np.asarray(value_list, dtype=np.float32)
+                name = 'session_time' if kind == 'session' else 'doomscroll_length'
+                np.add.at(a[name], users, minutes)
+                self._add_windowed(name, users, ts, minutes)
+            elif kind == 'rage_click':
+                np.add.at(a['rage_clicks'], users, 1)
+                self._add_windowed('rage_clicks', users, ts, np.ones(len(users), dtype=np.float32))
+            elif kind == 'notification':
+                a['notification_time'][users[last]] = (ts[last] % 86400).astype(np.int32)
+            elif kind == 'notification_response':
+                a['notif_response_time'][users[last]] = np.asarray(value_list, dtype=np.float32)[last]
+                self._add_windowed('notif_responses', users, ts, np.ones(len(users), dtype=np.float32))
+            elif kind == 'ad_click':
+                codes = np.asarray(value_list, dtype=np.int8)[last]
+                a['ad_click_emotion'][users[last]] = codes[:, 0]
+                a['ad_category_clicked'][users[last]] = codes[:, 1]
+            elif kind == 'sentiment':
+                np.add.at(a['sentiment_sum'], users, np.asarray(value_list, dtype=np.float64))
+                np.add.at(a['sentiment_count'], users, 1)
+            elif kind == 'feed_bias':
+                a['feed_bias_score'][users[last]] = np.asarray(value_list, dtype=np.float32)[last]
+        self.events += applied
+        return applied
+
+    def window_sums(self, name: str, now: Optional[float] = None) -> np.ndarray:
+        """Per-user sum of a windowed measure over the window_s seconds up to now (default: the watermark)."""
+        now = self.watermark if now is None else now
+        if np.isnan(now):
+            return np.zeros(self.capacity, dtype=np.float32)
+        live = self.arrays['window_epoch'] > int(now // self.bucket_s) - self.buckets
+        return np.where(live, self.arrays[f'window_{name}'], 0).sum(axis=1, dtype=np.float32)
+
+    def snapshot(self, now: Optional[float] = None) -> pd.DataFrame:
+        """
+        The current features of every user seen so far: totals, the registered
+        features and '<measure>_window' columns for the rolling window ending
+        at now (default: the newest event time seen).
+        """
+        a = self.arrays
+        # Slots of the users in user id order
+        users = np.argsort(a['user_id'][:self.num_users], kind='stable')
+        counts = a['sentiment_count'][users]
+        frame = pd.DataFrame({
+            'user_id': a['user_id'][users],
+            'session_time': a['session_time'][users],
+            'rage_clicks': a['rage_clicks'][users],
+            'doomscroll_length': a['doomscroll_length'][users],
+            'ad_click_emotion': pd.Categorical.from_codes(a['ad_click_emotion'][users], categories=AD_EMOTIONS),
+            'feed_bias_score': a['feed_bias_score'][users],
+            'notification_time': a['notification_time'][users],
+            'notif_response_time': a['notif_response_time'][users],
+            'keyword_sentiment_score': np.divide(a['sentiment_sum'][users], counts, out=np.full(len(users), np.nan),
+                                                 where=counts > 0).astype(np.float32),
+            'ad_category_clicked': pd.Categorical.from_codes(a['ad_category_clicked'][users], categories=AD_CATEGORIES),
+        })
+        # The registered features, from the totals and latest values as in the batch pipeline
+        features = compute_feature_arrays({name: frame[name].to_numpy() for name in
+                                           ('rage_clicks', 'doomscroll_length', 'notif_response_time', 'feed_bias_score')})
+        for name, values in features.items():
+            dtype = FEATURE_DTYPES[name]
+            frame[name] = pd.Categorical.from_codes(values, dtype=dtype) if isinstance(dtype, CategoricalDtype) else values
+        windows = {name: self.window_sums(name, now)[users] for name in WINDOWED}
+        for name in ['session_time', 'rage_clicks', 'doomscroll_length']:
+            frame[f'{name}_window'] = windows[name]
+        window_features = compute_feature_arrays({'rage_clicks': windows['rage_clicks'],
+                                                  'doomscroll_length': windows['doomscroll_length']},
+                                                 ['total_negative_engagement_score'])
+        frame['total_negative_engagement_score_window'] = window_features['total_negative_engagement_score']
+        frame['active_notif_responder_window'] = (windows['notif_responses'] > 0).astype(np.uint8)
+        frame['last_event_ts'] = a['last_event_ts'][users]
+        return frame
+
+    def save(self, path: str, offset: Optional[int] = None):
+        """
+        Checkpoints the state (and the source offset it covers) to an .npz
+        file, atomically: a crash leaves the previous checkpoint in place. Only
+        the used slots are written.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        used = {name: array[:self.num_users] for name, array in self.arrays.items()}
+        np.savez(tmp_path, window_s=self.window_s, buckets=self.buckets, events=self.events, watermark=self.watermark,
+                 rejected=self.rejected, offset=-1 if offset is None else offset, fields=np.asarray(list(used)), **used)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple['UserFeatureState', Optional[int]]:
+        """Reads a checkpoint written by save; returns the state and its source offset."""
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data['fields'].tolist()}
+            if set(arrays) != set(cls(int(data['window_s']), int(data['buckets']))._allocate(0)):
+                raise ValueError(f"Stream checkpoint at {path} has a different layout; delete it to start over.")
+            state = cls(int(data['window_s']), int(data['buckets']), arrays=arrays,
+                        events=int(data['events']), watermark=float(data['watermark']), rejected=int(data['rejected']))
+            offset = int(data['offset'])
+        return state, (offset if offset >= 0 else None)
+
+
+async def tail_jsonl(path: str, offset: int = 0, batch_size: int = DEFAULT_BATCH_SIZE,
+                     poll_interval: float = DEFAULT_POLL_INTERVAL_S,
+                     follow: bool = True) -> AsyncIterator[Tuple[List[dict], int]]:
+    """
+    Yields (events, offset after them) batches from a JSONL file starting at
+    byte offset, waiting for more lines once the end is reached (or stopping
+    there when follow is False). A partly written last line is left for the
+    next poll. Lines that are not valid JSON are passed on as None events, so
+    they are rejected and counted like any other malformed event.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            events = []
+            while len(events) < batch_size:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    f.seek(offset)
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    events.append(None)
+            if events:
+                yield events, offset
+            elif not follow:
+                return
+            else:
+                await asyncio.sleep(poll_interval)
+
+
+async def ingest(source: AsyncIterator, state: UserFeatureState, checkpoint_path: Optional[str] = None,
+                 checkpoint_interval_s: float = DEFAULT_CHECKPOINT_INTERVAL_S) -> UserFeatureState:
+    """
+    Applies event batches from any async source to state until it ends,
+    checkpointing at most every checkpoint_interval_s seconds and once at the
+    end. The source yields lists of events, or (events, offset) pairs when it
+    can resume from a position (see tail_jsonl).
+    A checkpoint only ever holds whole applied batches with the offset just
+    past them. If ingestion is interrupted or fails, nothing is saved, and a
+    restart resumes from the last checkpoint.
+    """
+    last_checkpoint = time.monotonic()
+    offset = None
+    async for item in source:
+        events, next_offset = item if isinstance(item, tuple) else (item, None)
+        state.apply(events)
+        offset = next_offset
+        if checkpoint_path and time.monotonic() - last_checkpoint >= checkpoint_interval_s:
+            state.save(checkpoint_path, offset)
+            last_checkpoint = time.monotonic()
+            print(f"Checkpointed {state.events} events ({state.num_users} users, "
+                  f"{state.rejected} rejected) to {checkpoint_path}.")
+    if checkpoint_path:
+        state.save(checkpoint_path, offset)
+    return state
+
+
+def simulate_events(path: str, num_users: int, num_events: int, seed: Optional[int] = None,
+                    start_ts: float = 1_718_700_000.0, duration_s: float = 86_400.0) -> int:
+    """Writes num_events random events for num_users users, in time order, as JSONL."""
+    rng = np.random.default_rng(seed)
+    ts = np.sort(rng.uniform(start_ts, start_ts + duration_s, num_events))
+    users = rng.integers(0, num_users, num_events)
+    kinds = rng.choice(EVENT_TYPES, num_events, p=[0.15, 0.15, 0.2, 0.1, 0.1, 0.1, 0.1, 0.1])
+    with open(path, 'w') as f:
+        for user, t, kind in zip(users.tolist(), ts.tolist(), kinds.tolist()):
+            event = {'user_id': f"{USER_ID_PREFIX}{user:05d}", 'ts': round(t, 3), 'type': kind}
+            if kind in ('session', 'scroll'):
+                event['minutes'] = round(float(rng.uniform(0.5, 20)), 2)
+            elif kind == 'notification_response':
+                event['seconds'] = round(float(rng.uniform(1, 60)), 2)
+            elif kind == 'ad_click':
+                event['emotion'] = AD_EMOTIONS[rng.integers(len(AD_EMOTIONS))]
+                event['category'] = AD_CATEGORIES[rng.integers(len(AD_CATEGORIES))]
+            elif kind in ('sentiment', 'feed_bias'):
+                low = -1 if kind == 'sentiment' else 0
+                event['score'] = round(float(rng.uniform(low, 1)), 4)
+            f.write(json.dumps(event) + '\n')
+    print(f"Wrote {num_events} events for {num_users} users to {path}.")
+    return num_events
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Event-level streaming ingestion of ShadowPersona engagement.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help="Tail a JSONL event file into checkpointed per-user state.")
+    ingest_parser.add_argument('path')
+    ingest_parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_PATH)
+    ingest_parser.add_argument('--checkpoint-interval', type=float, default=DEFAULT_CHECKPOINT_INTERVAL_S)
+    ingest_parser.add_argument('--window', type=int, default=DEFAULT_WINDOW_S, help="Rolling window in seconds.")
+    ingest_parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS)
+    ingest_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    ingest_parser.add_argument('--follow', action='store_true', help="Keep waiting for new events at the end of the file.")
+    export_parser = subparsers.add_parser('export', help="Write the checkpointed features as a columnar dataset.")
+    export_parser.add_argument('dataset_path')
+    export_parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_PATH)
+    simulate_parser = subparsers.add_parser('simulate', help="Write a JSONL file of random events.")
+    simulate_parser.add_argument('path')
+    simulate_parser.add_argument('--num-users', type=int, default=10_000)
+    simulate_parser.add_argument('--num-events', type=int, default=1_000_000)
+    simulate_parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'simulate':
+        simulate_events(args.path, args.num_users, args.num_events, seed=args.seed)
+    elif args.command == 'export':
+        state, _ = UserFeatureState.load(args.checkpoint)
+        write_dataset(state.snapshot(), args.dataset_path)
+        print(f"Exported features of {state.num_users} users to {args.dataset_path}.")
+    else:
+        offset = 0
+        if os.path.exists(args.checkpoint):
+            state, offset = UserFeatureState.load(args.checkpoint)
+            offset = offset or 0
+            print(f"Resuming from {args.checkpoint}: {state.events} events, byte offset {offset}.")
+        else:
+            state = UserFeatureState(window_s=args.window, buckets=args.buckets)
+        source = tail_jsonl(args.path, offset=offset, batch_size=args.batch_size, follow=args.follow)
+        started = time.perf_counter()
+        events_before, rejected_before = state.events, state.rejected
+        try:
+            asyncio.run(ingest(source, state, args.checkpoint, args.checkpoint_interval))
+            saved = "state checkpointed to"
+        except KeyboardInterrupt:
+            saved = "interrupted; resume from the last checkpoint in"
+        elapsed = time.perf_counter() - started
+        print(f"Ingested {state.events - events_before} events ({state.rejected - rejected_before} rejected) "
+              f"in {elapsed:.2f}s; {saved} {args.checkpoint}.")
+
+
+if __name__ == "__main__":
+    main()
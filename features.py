@@ -0,0 +1,166 @@
+# features.py
+
+from collections import Counter
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from schema import FEATURE_DTYPES
+
+
+class Feature(NamedTuple):
+    """
+    A derived feature: the columns it reads, its output dtype, the dtypes of the
+    scratch buffers its kernel needs for intermediates, and a kernel that writes
+    the result into a preallocated output array. Categorical outputs are written
+    as integer codes (-1 for missing).
+    """
+    name: str
+    inputs: Sequence[str]
+    dtype: object
+    scratch: Sequence[np.dtype]
+    compute: Callable[..., None]
+
+
+# Registration order is computation order, so a feature may use earlier features as inputs
+FEATURES: Dict[str, Feature] = {}
+
+# Rows per block. Every kernel runs on a block before the next block is read, so
+# a block's inputs, outputs and scratch buffers stay in cache across features.
+BLOCK_ROWS = 65_536
+
+
+def register_feature(name: str, inputs: Sequence[str], dtype=None, scratch: Sequence = ()):
+    """
+    Decorator registering a feature kernel, called as
+    kernel(out, *input_arrays, *scratch_arrays) on one block of rows at a time.
+    dtype defaults to the feature's entry in the shared schema; scratch lists the
+    dtypes of the kernel's scratch buffers, whose contents are undefined on entry.
+    """
+    def decorator(compute):
+        FEATURES[name] = Feature(name, tuple(inputs), dtype if dtype is not None else FEATURE_DTYPES[name],
+                                 tuple(np.dtype(d) for d in scratch), compute)
+        return compute
+    return decorator
+
+
+def _storage_dtype(dtype) -> np.dtype:
+    if isinstance(dtype, CategoricalDtype):
+        return np.dtype(np.int8) if len(dtype.categories) < 128 else np.dtype(np.int16)
+    return np.dtype(dtype)
+
+
+def resolve_features(names: Optional[Sequence[str]] = None) -> List[Feature]:
+    """
+    Returns the registered features needed for names (all when None), including
+    features they depend on, in computation order.
+    """
+    if names is None:
+        return list(FEATURES.values())
+    unknown = [name for name in names if name not in FEATURES]
+    if unknown:
+        raise KeyError(f"Unknown features {unknown}; registered features are {list(FEATURES)}.")
+    needed = set(names)
+    for feature in reversed(list(FEATURES.values())):
+        if feature.name in needed:
+            needed.update(name for name in feature.inputs if name in FEATURES)
+    return [feature for feature in FEATURES.values() if feature.name in needed]
+
+
+def compute_feature_arrays(columns: Mapping[str, np.ndarray], names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    Computes features from plain column arrays in a single blocked pass over the
+    rows: each block of BLOCK_ROWS rows goes through every kernel in registry
+    order. Each output is allocated once and filled in place; kernels keep their
+    intermediates in block-sized scratch buffers, allocated once per call and
+    shared between features.
+    Args:
+        columns (Mapping[str, np.ndarray]): Input columns by name.
+        names (list[str], optional): Features to compute; defaults to all registered.
+    Returns:
+        dict[str, np.ndarray]: Output arrays (codes for categorical features).
+    """
+    n = len(next(iter(columns.values()))) if columns else 0
+    features = resolve_features(names)
+    outputs = {feature.name: np.empty(n, dtype=_storage_dtype(feature.dtype)) for feature in features}
+    arrays = dict(columns, **outputs)
+    block_rows = min(n, BLOCK_ROWS)
+    pool: Dict[np.dtype, List[np.ndarray]] = {}
+    scratch = []
+    for feature in features:
+        taken = Counter()
+        buffers = []
+        for dtype in feature.scratch:
+            free = pool.setdefault(dtype, [])
+            if taken[dtype] == len(free):
+                free.append(np.empty(block_rows, dtype=dtype))
+            buffers.append(free[taken[dtype]])
+            taken[dtype] += 1
+        scratch.append(buffers)
+    for start in range(0, n, BLOCK_ROWS):
+        rows = slice(start, min(start + BLOCK_ROWS, n))
+        size = rows.stop - start
+        for feature, buffers in zip(features, scratch):
+            feature.compute(arrays[feature.name][rows], *(arrays[name][rows] for name in feature.inputs),
+                            *(buffer[:size] for buffer in buffers))
+    return outputs
+
+
+def compute_features(df: pd.DataFrame, names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Adds the requested features (all registered features by default) to df in place.
+    Input columns are passed to the kernels as zero-copy NumPy views.
+    Args:
+        df (pd.DataFrame): Engagement data in the shared schema layout.
+        names (list[str], optional): Features the caller needs; others are skipped.
+    Returns:
+        pd.DataFrame: df with the feature columns added.
+    """
+    features = resolve_features(names)
+    inputs = {name for feature in features for name in feature.inputs if name not in FEATURES}
+    outputs = compute_feature_arrays({name: df[name].to_numpy() for name in inputs}, [f.name for f in features])
+    for feature in features:
+        if names is not None and feature.name not in names:
+            continue
+        values = outputs[feature.name]
+        if isinstance(feature.dtype, CategoricalDtype):
+            values = pd.Categorical.from_codes(values, dtype=feature.dtype)
+        df[feature.name] = values
+    return df
+
+
+# --- Registered features ---
+@register_feature('total_negative_engagement_score', inputs=['rage_clicks', 'doomscroll_length'], scratch=[np.float64])
+def _total_negative_engagement_score(out, rage_clicks, doomscroll_length, product):
+    # rage_clicks * 0.5 + doomscroll_length * 0.7 with the same roundings as the
+    # column expression: the product is rounded in the input's own dtype (and held
+    # exactly in the float64 scratch), halving the click count is exact in out,
+    # and the sum is taken in float64 before the single rounding to the output dtype
+    np.multiply(doomscroll_length, 0.7, out=product)
+    np.multiply(rage_clicks, 0.5, out=out, casting='unsafe')
+    np.add(out, product, out=out, dtype=np.float64, casting='unsafe')
+
+
+@register_feature('active_notif_responder', inputs=['notif_response_time'])
+def _active_notif_responder(out, notif_response_time):
+    flags = out.view(np.bool_)
+    np.isnan(notif_response_time, out=flags)
+    np.logical_not(flags, out=flags)
+
+
+@register_feature('feed_bias_category', inputs=['feed_bias_score'], scratch=[np.bool_, np.bool_])
+def _feed_bias_category(out, feed_bias_score, flags, in_range):
+    # Same buckets as pd.cut(bins=[0, 0.3, 0.7, 1.0], include_lowest=True, right=True):
+    # [0, 0.3] -> left_leaning, (0.3, 0.7] -> neutral, (0.7, 1.0] -> right_leaning.
+    # Edges are float64, as in pd.cut, so float32 scores are compared after widening.
+    np.greater(feed_bias_score, np.float64(0.3), out=out, casting='unsafe')
+    np.greater(feed_bias_score, np.float64(0.7), out=flags)
+    np.add(out, flags, out=out, casting='unsafe')
+    # Outside [0, 1] or NaN -> missing
+    np.greater_equal(feed_bias_score, np.float64(0), out=in_range)
+    np.less_equal(feed_bias_score, np.float64(1), out=flags)
+    np.logical_and(in_range, flags, out=in_range)
+    np.logical_not(in_range, out=in_range)
+    np.copyto(out, -1, where=in_range)
@@ -0,0 +1,225 @@
+# identity.py
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import uuid
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from schema import AGE_BAND_DTYPE, AGE_BANDS, DEVICE_DTYPE, DEVICES, IDENTITY_COLUMNS, SIGNUP_DATE_DTYPE
+
+# Synthetic identity and demographic columns. Faker is slow per call, so it is
+# only used to build vocabulary pools (names and cities per country) once; the
+# pools are saved to a JSON file, and every row is then a handful of integer
+# codes into them drawn as whole arrays. Rows never call Faker. The columns and
+# their fixed dictionaries are registered in schema.py.
+DEFAULT_VOCABULARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'identity_vocabulary.json')
+VOCABULARY_VERSION = 1
+DEFAULT_NAMES_PER_COUNTRY = 200
+DEFAULT_CITIES_PER_COUNTRY = 40
+
+# Country -> (Faker locale, share of users)
+COUNTRY_LOCALES = {
+    'United States': ('en_US', 0.30),
+    'India': ('en_IN', 0.15),
+    'Brazil': ('pt_BR', 0.10),
+    'United Kingdom': ('en_GB', 0.08),
+    'Germany': ('de_DE', 0.07),
+    'France': ('fr_FR', 0.06),
+    'Japan': ('ja_JP', 0.06),
+    'Mexico': ('es_MX', 0.05),
+    'Canada': ('en_CA', 0.04),
+    'Italy': ('it_IT', 0.03),
+    'Spain': ('es_ES', 0.03),
+    'Australia': ('en_AU', 0.03),
+}
+
+# Shares of the schema's AGE_BANDS and DEVICES, in their order
+AGE_BAND_WEIGHTS = [0.06, 0.22, 0.28, 0.19, 0.12, 0.08, 0.05]
+DEVICE_WEIGHTS = [0.42, 0.28, 0.05, 0.06, 0.12, 0.05, 0.02]
+
+# Signup dates are uniform over whole days in [SIGNUP_START, SIGNUP_END)
+SIGNUP_START = np.datetime64('2015-01-01', 'D')
+SIGNUP_END = np.datetime64('2025-07-01', 'D')
+
+
+def _unique_values(make, count: int, max_attempts: int) -> List[str]:
+    # Small locales run out of distinct values, so stop after max_attempts draws
+    values = {}
+    for _ in range(max_attempts):
+        if len(values) >= count:
+            break
+        values.setdefault(make(), None)
+    return sorted(values)
+
+
+def build_vocabulary(names_per_country: int = DEFAULT_NAMES_PER_COUNTRY,
+                     cities_per_country: int = DEFAULT_CITIES_PER_COUNTRY, seed: int = 0) -> dict:
+    """
+    Builds the identity vocabulary with Faker: up to names_per_country full
+    names and cities_per_country cities for every country in COUNTRY_LOCALES,
+    each locale seeded from seed, so a given Faker version gives the same pools.
+    Returns:
+        dict: The JSON-serializable vocabulary.
+    """
+    from faker import VERSION as faker_version, Faker
+
+    names, cities = {}, {}
+    for i, (country, (locale, _)) in enumerate(COUNTRY_LOCALES.items()):
+        fake = Faker(locale)
+        fake.seed_instance(seed + i)
+        names[country] = _unique_values(fake.name, names_per_country, names_per_country * 10)
+        cities[country] = _unique_values(fake.city, cities_per_country, cities_per_country * 10)
+    return {'version': VOCABULARY_VERSION, 'faker_version': faker_version, 'seed': seed,
+            'countries': list(COUNTRY_LOCALES), 'country_weights': [weight for _, weight in COUNTRY_LOCALES.values()],
+            'names': names, 'cities': cities}
+
+
+def write_vocabulary(vocabulary: dict, path: str = DEFAULT_VOCABULARY_PATH):
+    """
+    Writes the vocabulary to path atomically. Every writer renames its own
+    complete temp file into place, so concurrent builders never collide.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class _Pool(NamedTuple):
+    # Per-country slices of a flat code array into the column's categories
+    categories: List[str]
+    codes: np.ndarray
+    offsets: np.ndarray
+    counts: np.ndarray
+
+
+def _pool(values_by_country: Dict[str, List[str]], countries: Sequence[str]) -> _Pool:
+    # The same value in two countries (e.g. a 'London' in Canada) is one category
+    categories = sorted({value for country in countries for value in values_by_country[country]})
+    index = {value: code for code, value in enumerate(categories)}
+    counts = np.array([len(values_by_country[country]) for country in countries], dtype=np.int64)
+    if not counts.all():
+        raise ValueError("Every country needs at least one name and one city in the identity vocabulary.")
+    codes = np.array([index[value] for country in countries for value in values_by_country[country]], dtype=np.int32)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return _Pool(categories, codes, offsets, counts)
+
+
+class IdentityVocabulary:
+    """
+    The identity vocabulary as sampling tables: country weights, and for names
+    and cities a flat code array with each country's slice of it.
+    Args:
+        vocabulary (dict): As returned by build_vocabulary.
+    """
+    def __init__(self, vocabulary: dict):
+        if vocabulary.get('version') != VOCABULARY_VERSION:
+            raise ValueError(f"Unsupported identity vocabulary version {vocabulary.get('version')!r}.")
+        self.countries = list(vocabulary['countries'])
+        weights = np.asarray(vocabulary['country_weights'], dtype=np.float64)
+        self.country_weights = weights / weights.sum()
+        self.names = _pool(vocabulary['names'], self.countries)
+        self.cities = _pool(vocabulary['cities'], self.countries)
+        self.country_dtype = CategoricalDtype(self.countries)
+        self.name_dtype = CategoricalDtype(self.names.categories)
+        self.city_dtype = CategoricalDtype(self.cities.categories)
+        self.digest = hashlib.sha256(json.dumps(vocabulary, sort_keys=True).encode()).hexdigest()
+
+    def sample_within(self, pool: _Pool, country: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Draws one code per row from the pool slice of that row's country."""
+        picks = (rng.random(len(country)) * pool.counts[country]).astype(np.int64)
+        return pool.codes[pool.offsets[country] + picks]
+
+
+# lru_cache does not stop two threads from running a first call at once
+_vocabulary_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _load_vocabulary(path: str) -> IdentityVocabulary:
+    if not os.path.exists(path):
+        print(f"No identity vocabulary at {path}; building it with Faker...")
+        write_vocabulary(build_vocabulary(), path)
+    with open(path, encoding='utf-8') as f:
+        return IdentityVocabulary(json.load(f))
+
+
+def load_vocabulary(path: Optional[str] = None) -> IdentityVocabulary:
+    """
+    Loads the identity vocabulary from path (default DEFAULT_VOCABULARY_PATH),
+    building and saving it with Faker first if the file does not exist. Loaded
+    once per process. Processes that find the file missing at the same time
+    each build it; the last complete write wins, and the builds are identical.
+    """
+    with _vocabulary_lock:
+        return _load_vocabulary(os.path.abspath(path or DEFAULT_VOCABULARY_PATH))
+
+
+def check_identity_columns(columns: Optional[Sequence[str]]) -> List[str]:
+    """Validates a selection of identity columns and puts it in IDENTITY_COLUMNS order."""
+    columns = list(columns or [])
+    unknown = sorted(set(columns) - set(IDENTITY_COLUMNS))
+    if unknown:
+        raise ValueError(f"Unknown identity columns {unknown}; choose from {IDENTITY_COLUMNS}.")
+    return [column for column in IDENTITY_COLUMNS if column in columns]
+
+
+def generate_identity_columns(columns: Sequence[str], rng: Dict[str, np.random.Generator],
+                              num_records: int, vocabulary: IdentityVocabulary) -> Dict[str, object]:
+    """
+    Draws the requested identity columns for num_records rows, each from its own
+    stream in rng (keyed 'identity_<column>'), so a column does not change when
+    others are added or left out. Name and city are drawn within the row's
+    country, which is drawn whenever any of the three is requested.
+    Returns:
+        dict: Column name -> pd.Categorical (datetime64 array for signup_date).
+    """
+    n = num_records
+    out = {}
+    if {'name', 'country', 'city'} & set(columns):
+        country = rng['identity_country'].choice(len(vocabulary.countries), n, p=vocabulary.country_weights)
+    if 'name' in columns:
+        out['name'] = pd.Categorical.from_codes(vocabulary.sample_within(vocabulary.names, country, rng['identity_name']),
+                                                dtype=vocabulary.name_dtype)
+    if 'country' in columns:
+        out['country'] = pd.Categorical.from_codes(country, dtype=vocabulary.country_dtype)
+    if 'city' in columns:
+        out['city'] = pd.Categorical.from_codes(vocabulary.sample_within(vocabulary.cities, country, rng['identity_city']),
+                                                dtype=vocabulary.city_dtype)
+    if 'age_band' in columns:
+        out['age_band'] = pd.Categorical.from_codes(rng['identity_age_band'].choice(len(AGE_BANDS), n, p=AGE_BAND_WEIGHTS),
+                                                    dtype=AGE_BAND_DTYPE)
+    if 'device' in columns:
+        out['device'] = pd.Categorical.from_codes(rng['identity_device'].choice(len(DEVICES), n, p=DEVICE_WEIGHTS),
+                                                  dtype=DEVICE_DTYPE)
+    if 'signup_date' in columns:
+        days = rng['identity_signup_date'].integers(0, (SIGNUP_END - SIGNUP_START).astype(np.int64), n)
+        out['signup_date'] = (SIGNUP_START + days).astype(SIGNUP_DATE_DTYPE)
+    return out
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build the identity vocabulary used by the synthetic data generator.")
+    parser.add_argument('--path', default=DEFAULT_VOCABULARY_PATH)
+    parser.add_argument('--names-per-country', type=int, default=DEFAULT_NAMES_PER_COUNTRY)
+    parser.add_argument('--cities-per-country', type=int, default=DEFAULT_CITIES_PER_COUNTRY)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    vocabulary = build_vocabulary(args.names_per_country, args.cities_per_country, seed=args.seed)
+    write_vocabulary(vocabulary, args.path)
+    sizes = IdentityVocabulary(vocabulary)
+    print(f"Wrote {len(sizes.countries)} countries, {len(sizes.names.categories)} names and "
+          f"{len(sizes.cities.categories)} cities to {args.path} (Faker {vocabulary['faker_version']}).")
+
+
+if __name__ == "__main__":
+    main()
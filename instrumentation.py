@@ -0,0 +1,352 @@
+# instrumentation.py
+
+import cProfile
+import contextvars
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+# Per-task performance records. Switched on by environment variables, so a flow
+# run can be instrumented without code changes; when they are unset a task call
+# costs two dictionary lookups on top of the task itself.
+#   SHADOWPERSONA_METRICS=<file.jsonl>   append one JSON record per task (and per
+#                                        stream) to the file and publish it as a
+#                                        Prefect table artifact
+#   SHADOWPERSONA_PROFILE=<names>|all    profile the named task functions
+#   SHADOWPERSONA_PROFILER=cprofile|sampling
+#   SHADOWPERSONA_PROFILE_DIR=<dir>      where profiles go (reports/profiles)
+# The peak RSS and CPU time are per-process counters, so a task's
+# peak_rss_delta_bytes and cpu_s are only measured when no other instrumented
+# call runs in the process at the same time (e.g. sequential tasks, or a
+# process-based task runner). Tasks overlapping on a thread-based task runner
+# record them as null instead of each other's memory and CPU.
+METRICS_ENV = 'SHADOWPERSONA_METRICS'
+PROFILE_ENV = 'SHADOWPERSONA_PROFILE'
+PROFILER_ENV = 'SHADOWPERSONA_PROFILER'
+PROFILE_DIR_ENV = 'SHADOWPERSONA_PROFILE_DIR'
+DEFAULT_PROFILE_DIR = 'reports/profiles'
+SAMPLING_INTERVAL_S = 0.005
+
+_current_record: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar('shadowpersona_record', default=None)
+_write_lock = threading.Lock()
+_local = threading.local()
+# Instrumented calls running in this process, and how many have ever started
+_calls_lock = threading.Lock()
+_active_calls = 0
+_started_calls = 0
+
+
+# --- Memory ---
+def _status_kb(field: str) -> Optional[int]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the process's peak RSS to its current RSS, so the next peak_rss_bytes
+    covers only what runs after the call. Linux only; returns False elsewhere.
+    The peak is shared by every thread of the process, so this also resets it
+    for anything running concurrently.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process (since the last reset_peak_rss on Linux)."""
+    peak = _status_kb('VmHWM')
+    if peak is not None:
+        return peak * 1024
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def current_rss_bytes() -> int:
+    rss = _status_kb('VmRSS')
+    return rss * 1024 if rss is not None else peak_rss_bytes()
+
+
+def _enter_call() -> Optional[int]:
+    # Returns the call's start number if it is the only instrumented call
+    # running in the process, None if it overlaps another one
+    global _active_calls, _started_calls
+    with _calls_lock:
+        _active_calls += 1
+        _started_calls += 1
+        return _started_calls if _active_calls == 1 else None
+
+
+def _exit_call(alone_since: Optional[int]) -> bool:
+    # True if no other instrumented call ran at any point during this one
+    global _active_calls
+    with _calls_lock:
+        _active_calls -= 1
+        return alone_since is not None and _started_calls == alone_since
+
+
+def _cpu_seconds() -> float:
+    # Includes finished child processes, e.g. a generation process pool that has been shut down
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+# --- Records ---
+def _now() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def record_metrics(**values):
+    """
+    Adds values (e.g. bytes_written=...) to the record of the instrumented task
+    currently running. A no-op when instrumentation is off.
+    """
+    record = _current_record.get()
+    if record is not None:
+        record.update(values)
+
+
+def _rows(value) -> Optional[int]:
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+
+def _run_ids() -> dict:
+    try:
+        from prefect.context import TaskRunContext
+        context = TaskRunContext.get()
+    except ImportError:
+        context = None
+    if context is None:
+        return {}
+    return {'flow_run_id': str(context.task_run.flow_run_id), 'task_run_id': str(context.task_run.id)}
+
+
+def _emit(record: dict, path: str):
+    duration = record.get('self_s', record['wall_s'])
+    rows = max(record.get('rows_in') or 0, record.get('rows_out') or 0)
+    record['rows_per_s'] = rows / duration if rows and duration else None
+    with _write_lock:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+    try:
+        from prefect.artifacts import create_table_artifact
+        if record.get('task_run_id'):
+            key = 'metrics-' + re.sub(r'[^a-z0-9-]+', '-', record['task'].lower()).strip('-')
+            create_table_artifact(table=[record], key=key, description=f"Performance of {record['task']}")
+    except Exception as e:
+        # Metrics must never fail the run they measure
+        print(f"Could not publish metrics artifact for {record['task']}: {e}")
+
+
+class _Timer:
+    # Frames of the instrumented calls and streams active on this thread. Time
+    # spent in a nested frame is charged to it and subtracted from its parent's
+    # self time, so a stream's cost is not counted again in the task draining it.
+    __slots__ = ('children',)
+
+    def __init__(self):
+        self.children = 0.0
+
+
+def _stack() -> List[_Timer]:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def metered(chunks: Iterable[pd.DataFrame], name: str, path: str) -> Iterator[pd.DataFrame]:
+    """
+    Passes chunks through, timing the work done to produce each one, and emits a
+    record for the stream once it is exhausted.
+    """
+    iterator = iter(chunks)
+    stack = _stack()
+    timer = _Timer()
+    record = {'task': f"{name}[stream]", 'started_at': _now(), 'rows_out': 0, 'chunks': 0, **_run_ids()}
+    wall = 0.0
+    while True:
+        start = time.perf_counter()
+        stack.append(timer)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - start
+            wall += elapsed
+            if stack:
+                stack[-1].children += elapsed
+        record['rows_out'] += len(chunk)
+        record['chunks'] += 1
+        yield chunk
+    record.update(wall_s=wall, self_s=wall - timer.children)
+    _emit(record, path)
+
+
+# --- Profiling ---
+def _profile_requested(name: str) -> bool:
+    requested = os.environ.get(PROFILE_ENV)
+    if not requested:
+        return False
+    names = {part.strip() for part in requested.split(',')}
+    return 'all' in names or name in names
+
+
+def _profile_path(name: str, extension: str) -> str:
+    directory = os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.{extension}")
+
+
+class _SamplingProfiler:
+    """
+    Samples the calling thread's stack every interval from a background thread and
+    writes the counts as folded stacks (one 'frame;frame;frame count' line each),
+    the input format of flamegraph tools.
+    """
+    def __init__(self, interval: float = SAMPLING_INTERVAL_S):
+        self.interval = interval
+        self.samples = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _call_profiled(fn: Callable, name: str, args, kwargs):
+    if os.environ.get(PROFILER_ENV, 'cprofile') == 'sampling':
+        path = _profile_path(name, 'folded')
+        profiler = _SamplingProfiler()
+        profiler.start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.stop()
+            profiler.dump(path)
+            print(f"Sampling profile of {name} written to {path}.")
+    path = _profile_path(name, 'prof')
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
+        print(f"cProfile of {name} written to {path} (view with python -m pstats or snakeviz).")
+
+
+# --- Decorator ---
+class _Instrumented:
+    # A class rather than a closure so tasks stay picklable for process-based
+    # task runners: the instance pickles as a reference to this class plus the
+    # task function, never this module's locks and context variables.
+    def __init__(self, fn: Callable, stream: bool):
+        functools.update_wrapper(self, fn)
+        self.fn = fn
+        self.name = fn.__name__
+        self.stream = stream
+
+    def __call__(self, *args, **kwargs):
+        fn, name = self.fn, self.name
+        path = os.environ.get(METRICS_ENV)
+        profile = _profile_requested(name)
+        if not path and not profile:
+            return fn(*args, **kwargs)
+        if not path:
+            return _call_profiled(fn, name, args, kwargs)
+
+        rows_in = sum(_rows(value) or 0 for value in list(args) + list(kwargs.values()))
+        record = {'task': name, 'started_at': _now(), 'rows_in': rows_in or None, **_run_ids()}
+        token = _current_record.set(record)
+        alone_since = _enter_call()
+        if alone_since is not None:
+            per_call_peak = reset_peak_rss()
+            rss_before = current_rss_bytes() if per_call_peak else peak_rss_bytes()
+        cpu_before = _cpu_seconds()
+        timer = _Timer()
+        stack = _stack()
+        stack.append(timer)
+        start = time.perf_counter()
+        try:
+            result = _call_profiled(fn, name, args, kwargs) if profile else fn(*args, **kwargs)
+            record['status'] = 'completed'
+        except BaseException as e:
+            record.update(status='failed', error=repr(e))
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1].children += wall
+            _current_record.reset(token)
+            alone = _exit_call(alone_since)
+            record.update(wall_s=wall, self_s=wall - timer.children,
+                          cpu_s=_cpu_seconds() - cpu_before if alone else None,
+                          peak_rss_delta_bytes=max(peak_rss_bytes() - rss_before, 0) if alone else None)
+            if record['status'] == 'failed':
+                _emit(record, path)
+        record.setdefault('rows_out', _rows(result))
+        _emit(record, path)
+        if self.stream:
+            return type(result)(metered(result, name, path))
+        return result
+
+
+def instrumented(stream: bool = False):
+    """
+    Decorator recording a task's performance; apply it under @task so Prefect
+    sees the original signature. Records hold wall, self and CPU time, the peak
+    RSS growth (null when other instrumented calls overlapped this one in the
+    process, see above), input/output DataFrame row counts, rows/s and anything
+    the task adds via record_metrics.
+    Args:
+        stream (bool): The task returns a ChunkStream-like object (constructible
+            from an iterator); its chunks are metered as they are pulled and
+            recorded as '<task>[stream]' when exhausted.
+    """
+    def decorator(fn: Callable) -> Callable:
+        return _Instrumented(fn, stream)
+    return decorator
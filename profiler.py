@@ -0,0 +1,606 @@
+# profiler.py
+
+import html
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from features import compute_features
+from schema import read_csv
+from storage import open_dataset
+
+# The profiler never holds more than one chunk per worker: every chunk is reduced
+# to small per-column sketches (moments, a fixed-size histogram, a HyperLogLog,
+# category counts) plus correlation sums, and sketches merge by addition/max, so
+# chunks can be profiled on any number of processes in any grouping.
+DEFAULT_CHUNK_SIZE = 262_144
+DEFAULT_NUM_BINS = 1024
+DISPLAY_BINS = 30
+HLL_PRECISION = 12
+TOP_K = 10
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+# Columns left out of the correlation matrix
+CORRELATION_EXCLUDE = ('user_id',)
+# Narrowest histogram bin, for columns holding a single value
+_MIN_BIN_WIDTH = 2.0 ** -20
+
+
+class Histogram:
+    """
+    Histogram over aligned bins [k * width, (k + 1) * width) with width a power
+    of two, keeping at most num_bins bins. When values fall outside the bins it
+    can hold, neighbouring bins are paired up and the width doubles, so memory
+    stays fixed and histograms of different chunks merge exactly once brought to
+    the same width.
+    """
+    def __init__(self, num_bins: int = DEFAULT_NUM_BINS):
+        self.num_bins = num_bins
+        self.width: Optional[float] = None
+        self.low = 0
+        self.counts = np.zeros(num_bins, dtype=np.int64)
+
+    def _occupied(self) -> Optional[Tuple[int, int]]:
+        nonzero = np.flatnonzero(self.counts)
+        return (self.low + int(nonzero[0]), self.low + int(nonzero[-1])) if len(nonzero) else None
+
+    def _coarsen(self):
+        bins = self.low + np.arange(self.num_bins)
+        merged = np.bincount(bins // 2 - self.low // 2, weights=self.counts, minlength=self.num_bins)
+        self.counts = merged[:self.num_bins].astype(np.int64)
+        self.low //= 2
+        self.width *= 2
+
+    def _fit(self, first: int, last: int):
+        # Coarsens until the occupied bins plus [first, last] fit, then rebases onto
+        # the lowest of them
+        while True:
+            occupied = self._occupied()
+            low = first if occupied is None else min(first, occupied[0])
+            high = last if occupied is None else max(last, occupied[1])
+            if high - low < self.num_bins:
+                break
+            self._coarsen()
+            first, last = first // 2, last // 2
+        if low != self.low:
+            counts = np.zeros(self.num_bins, dtype=np.int64)
+            if occupied is not None:
+                counts[occupied[0] - low:occupied[1] - low + 1] = self.counts[occupied[0] - self.low:occupied[1] - self.low + 1]
+            self.counts, self.low = counts, low
+
+    def add(self, values: np.ndarray):
+        """Adds finite float64 values."""
+        if len(values) == 0:
+            return
+        vmin, vmax = float(values.min()), float(values.max())
+        if self.width is None:
+            self.width = 2.0 ** np.ceil(np.log2(max((vmax - vmin) / (self.num_bins - 1), _MIN_BIN_WIDTH)))
+            self.low = int(np.floor(vmin / self.width))
+        self._fit(int(np.floor(vmin / self.width)), int(np.floor(vmax / self.width)))
+        bins = np.floor(values / self.width).astype(np.int64) - self.low
+        self.counts += np.bincount(bins, minlength=self.num_bins)
+
+    def merge(self, other: 'Histogram') -> 'Histogram':
+        if other.width is None:
+            return self
+        other = _copy_histogram(other)
+        if self.width is None:
+            self.width, self.low, self.counts = other.width, other.low, other.counts
+            return self
+        while self.width < other.width:
+            self._coarsen()
+        while other.width < self.width:
+            other._coarsen()
+        occupied = other._occupied()
+        if occupied is None:
+            return self
+        self._fit(*occupied)
+        # Fitting may have coarsened this histogram further; bring the other one along
+        while other.width < self.width:
+            other._coarsen()
+        first, last = other._occupied()
+        self.counts[first - self.low:last - self.low + 1] += other.counts[first - other.low:last - other.low + 1]
+        return self
+
+    def quantiles(self, qs: Sequence[float], vmin: float, vmax: float) -> List[float]:
+        """Approximate quantiles, interpolated within bins; off by at most one bin width."""
+        total = self.counts.sum()
+        if total == 0:
+            return [float('nan')] * len(qs)
+        cumulative = np.cumsum(self.counts)
+        result = []
+        for q in qs:
+            target = q * total
+            i = min(int(np.searchsorted(cumulative, target, side='left')), self.num_bins - 1)
+            before = cumulative[i - 1] if i else 0
+            fraction = (target - before) / self.counts[i] if self.counts[i] else 0.0
+            value = (self.low + i + fraction) * self.width
+            result.append(float(min(max(value, vmin), vmax)))
+        return result
+
+    def display(self, max_bins: int = DISPLAY_BINS) -> Tuple[List[float], List[int]]:
+        """Groups the occupied bins into at most max_bins bars; returns edges and counts."""
+        occupied = self._occupied()
+        if occupied is None:
+            return [], []
+        first, last = occupied[0] - self.low, occupied[1] - self.low
+        group = -(-(last - first + 1) // max_bins)
+        counts = self.counts[first:last + 1]
+        counts = np.pad(counts, (0, -len(counts) % group)).reshape(-1, group).sum(axis=1)
+        edges = (self.low + first + np.arange(len(counts) + 1) * group) * self.width
+        return edges.tolist(), counts.tolist()
+
+
+def _copy_histogram(histogram: Histogram) -> Histogram:
+    copy = Histogram(histogram.num_bins)
+    copy.width, copy.low, copy.counts = histogram.width, histogram.low, histogram.counts.copy()
+    return copy
+
+
+def _hash64(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer over the float64 bit patterns (-0.0 folded into 0.0)
+    z = (np.asarray(values, dtype=np.float64) + 0.0).view(np.uint64)
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class HyperLogLog:
+    """Approximate distinct counter (about 1.6% error with the default precision); merges by register max."""
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        hashes = _hash64(values)
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # Rank of the first set bit among the next 32 hash bits (33 when none are set)
+        rest = ((hashes << p) >> np.uint64(32)).astype(np.float64)
+        rank = np.where(rest > 0, 33 - np.frexp(rest)[1], 33).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class NumericSketch:
+    """Null count, min/max, running mean and M2, histogram and distinct count of a numeric column."""
+    kind = 'numeric'
+
+    def __init__(self, dtype: str):
+        self.dtype = dtype
+        self.count = 0
+        self.nulls = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = Histogram()
+        self.distinct = HyperLogLog()
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        if missing.any():
+            self.nulls += int(missing.sum())
+            values = values[~missing]
+        if len(values) == 0:
+            return
+        mean = float(values.mean())
+        self._combine(len(values), mean, float(np.square(values - mean).sum()))
+        self.min, self.max = min(self.min, float(values.min())), max(self.max, float(values.max()))
+        self.histogram.add(values[np.isfinite(values)])
+        self.distinct.add(values)
+
+    def _combine(self, count: int, mean: float, m2: float):
+        # Chan et al. parallel update of count/mean/M2
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other: 'NumericSketch') -> 'NumericSketch':
+        self.nulls += other.nulls
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.histogram.merge(other.histogram)
+        self.distinct.merge(other.distinct)
+        return self
+
+    def _quantiles(self) -> List[float]:
+        quantiles = self.histogram.quantiles(QUANTILES, self.min, self.max)
+        if np.dtype(self.dtype).kind in 'biu' and self.histogram.width <= 1:
+            # Each bin holds at most one integer, its lower edge rounded up
+            quantiles = [float(np.ceil(np.floor(q / self.histogram.width) * self.histogram.width)) for q in quantiles]
+        return quantiles
+
+    def summary(self) -> dict:
+        empty = self.count == 0
+        edges, counts = self.histogram.display()
+        return {
+            'kind': self.kind, 'dtype': self.dtype, 'count': self.count, 'nulls': self.nulls,
+            'distinct_approx': self.distinct.estimate(),
+            'mean': None if empty else self.mean,
+            'std': None if self.count < 2 else float(np.sqrt(self.m2 / (self.count - 1))),
+            'min': None if empty else self.min, 'max': None if empty else self.max,
+            'quantiles': {} if empty else dict(zip((f'p{round(q * 100)}' for q in QUANTILES), self._quantiles())),
+            'histogram': {'edges': edges, 'counts': counts},
+        }
+
+
+class CategoricalSketch:
+    """Exact per-category counts and null count of a categorical column."""
+    kind = 'categorical'
+
+    def __init__(self, categories: Sequence):
+        self.categories = list(categories)
+        self.counts = np.zeros(len(self.categories), dtype=np.int64)
+        self.nulls = 0
+
+    def update(self, codes: np.ndarray):
+        codes = np.asarray(codes)
+        valid = codes >= 0
+        self.nulls += int(len(codes) - valid.sum())
+        self.counts += np.bincount(codes[valid], minlength=len(self.categories))
+
+    def merge(self, other: 'CategoricalSketch') -> 'CategoricalSketch':
+        if other.categories != self.categories:
+            raise ValueError("Cannot merge categorical sketches with different categories.")
+        self.counts += other.counts
+        self.nulls += other.nulls
+        return self
+
+    def summary(self) -> dict:
+        count = int(self.counts.sum())
+        order = np.argsort(-self.counts, kind='stable')[:TOP_K]
+        return {
+            'kind': self.kind, 'count': count, 'nulls': self.nulls,
+            'distinct': int(np.count_nonzero(self.counts)),
+            'top': [{'value': str(self.categories[i]), 'count': int(self.counts[i]),
+                     'share': float(self.counts[i] / count) if count else 0.0}
+                    for i in order if self.counts[i]],
+        }
+
+
+class CorrelationSketch:
+    """
+    Pairwise sums behind the Pearson correlation of every pair of columns, over
+    the rows where both are present. All sums merge by addition.
+    """
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        k = len(self.names)
+        self.n = np.zeros((k, k))
+        self.sx = np.zeros((k, k))
+        self.sxx = np.zeros((k, k))
+        self.sxy = np.zeros((k, k))
+
+    def update(self, matrix: np.ndarray):
+        valid = ~np.isnan(matrix)
+        present = valid.astype(np.float64)
+        x = np.where(valid, matrix, 0.0)
+        self.n += present.T @ present
+        # sx[i, j] sums column i over the rows where column j is present
+        self.sx += x.T @ present
+        self.sxx += (x * x).T @ present
+        self.sxy += x.T @ x
+
+    def merge(self, other: 'CorrelationSketch') -> 'CorrelationSketch':
+        self.n += other.n
+        self.sx += other.sx
+        self.sxx += other.sxx
+        self.sxy += other.sxy
+        return self
+
+    def matrix(self) -> pd.DataFrame:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = self.n * self.sxy - self.sx * self.sx.T
+            variance = (self.n * self.sxx - self.sx ** 2) * (self.n * self.sxx - self.sx ** 2).T
+            corr = np.clip(covariance / np.sqrt(variance), -1.0, 1.0)
+        return pd.DataFrame(corr, index=self.names, columns=self.names)
+
+
+def _epoch_seconds(values: np.ndarray) -> np.ndarray:
+    # Datetimes are profiled as float64 seconds since the epoch, NaT as NaN
+    values = np.asarray(values).astype('datetime64[s]')
+    seconds = values.astype(np.int64).astype(np.float64)
+    seconds[np.isnat(values)] = np.nan
+    return seconds
+
+
+class TableProfile:
+    """
+    Sketches of every column of a table plus the correlations of its numeric
+    columns. Datetime columns are sketched as numbers of seconds since the epoch.
+    """
+    def __init__(self, sketches: Dict[str, object]):
+        self.sketches = sketches
+        self.num_rows = 0
+        self.correlations = CorrelationSketch([name for name, sketch in sketches.items()
+                                               if sketch.kind == 'numeric' and name not in CORRELATION_EXCLUDE])
+
+    @classmethod
+    def for_dtypes(cls, dtypes: Mapping[str, object]) -> 'TableProfile':
+        sketches = {}
+        for name, dtype in dtypes.items():
+            if isinstance(dtype, CategoricalDtype):
+                sketches[name] = CategoricalSketch(dtype.categories.tolist())
+            elif np.dtype(dtype).kind in 'biufM':
+                sketches[name] = NumericSketch(str(np.dtype(dtype)))
+            else:
+                raise TypeError(f"Column '{name}' has unsupported dtype {dtype}; only numeric, datetime and "
+                                f"categorical columns can be profiled.")
+        return cls(sketches)
+
+    def update(self, columns: Mapping[str, np.ndarray]):
+        """Adds a chunk given as plain arrays (integer codes for categorical columns)."""
+        columns = {name: _epoch_seconds(values) if np.asarray(values).dtype.kind == 'M' else values
+                   for name, values in columns.items() if name in self.sketches}
+        for name, sketch in self.sketches.items():
+            sketch.update(columns[name])
+        if self.correlations.names:
+            self.correlations.update(np.column_stack([np.asarray(columns[name], dtype=np.float64)
+                                                      for name in self.correlations.names]))
+        self.num_rows += len(columns[next(iter(self.sketches))]) if self.sketches else 0
+
+    def update_frame(self, df: pd.DataFrame):
+        self.update({name: df[name].cat.codes.to_numpy() if isinstance(df[name].dtype, CategoricalDtype)
+                     else df[name].to_numpy() if df[name].dtype.kind == 'M'
+                     else df[name].to_numpy(dtype=np.float64, na_value=np.nan) for name in self.sketches})
+
+    def merge(self, other: 'TableProfile') -> 'TableProfile':
+        if list(other.sketches) != list(self.sketches):
+            raise ValueError(f"Cannot merge profiles of columns {list(other.sketches)} into {list(self.sketches)}.")
+        for name, sketch in self.sketches.items():
+            sketch.merge(other.sketches[name])
+        self.correlations.merge(other.correlations)
+        self.num_rows += other.num_rows
+        return self
+
+    def describe(self) -> pd.DataFrame:
+        """A describe()-style table of the numeric columns."""
+        rows = {}
+        for name, sketch in self.sketches.items():
+            if sketch.kind == 'numeric':
+                summary = sketch.summary()
+                rows[name] = {'count': summary['count'], 'nulls': summary['nulls'], 'distinct~': summary['distinct_approx'],
+                              'mean': summary['mean'], 'std': summary['std'], 'min': summary['min'],
+                              **{q: summary['quantiles'].get(q) for q in ('p25', 'p50', 'p75')}, 'max': summary['max']}
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def to_dict(self) -> dict:
+        correlations = self.correlations.matrix()
+        return {
+            'num_rows': self.num_rows,
+            'columns': {name: sketch.summary() for name, sketch in self.sketches.items()},
+            'correlations': {'columns': list(correlations.columns),
+                             'matrix': [[None if np.isnan(v) else float(v) for v in row] for row in correlations.to_numpy()]},
+        }
+
+
+# --- Chunk workers (module level so they can run on a process pool) ---
+def _profile_dataset_rows(dataset_path: str, start: int, stop: int) -> TableProfile:
+    dataset = open_dataset(dataset_path)
+    profile = TableProfile.for_dtypes({name: dataset.dtype(name) for name in dataset.columns})
+    profile.update({name: dataset.column_slice(name, start, stop) for name in dataset.columns})
+    return profile
+
+
+def _profile_csv_range(filepath: str, start: int, stop: int, features: bool) -> TableProfile:
+    # Parses bytes [start, stop) of the CSV, whole lines, under its header line
+    with open(filepath, 'rb') as f:
+        header = f.readline()
+        f.seek(start)
+        df = read_csv(io.BytesIO(header + f.read(stop - start)))
+    if features:
+        df = compute_features(df)
+    profile = TableProfile.for_dtypes(df.dtypes.to_dict())
+    profile.update_frame(df)
+    return profile
+
+
+def _csv_ranges(filepath: str, chunk_size: int) -> List[Tuple[int, int]]:
+    # Byte ranges of about chunk_size rows each, estimated from the first lines
+    # and cut at line ends, so workers can parse their own range of the file
+    with open(filepath, 'rb') as f:
+        start = len(f.readline())
+        sample = f.readlines(1 << 16)
+        size = os.fstat(f.fileno()).st_size
+        if not sample:
+            return []
+        step = max(chunk_size * sum(map(len, sample)) // len(sample), 1)
+        ranges = []
+        while start < size:
+            stop = start + step
+            if stop < size:
+                # Finish the line holding byte stop - 1
+                f.seek(stop - 1)
+                f.readline()
+                stop = f.tell()
+            stop = min(stop, size)
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def _profile_parallel(worker: Callable[..., TableProfile], jobs: Iterable[tuple],
+                      max_workers: Optional[int] = None) -> Optional[TableProfile]:
+    # Merges chunk profiles in job order, with at most a window of jobs (and
+    # their chunks) in flight at once
+    jobs = iter(jobs)
+    merged = None
+    if max_workers == 1:
+        for job in jobs:
+            profile = worker(*job)
+            merged = profile if merged is None else merged.merge(profile)
+        return merged
+    window = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=window) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(worker, *job))
+            if len(pending) >= window:
+                profile = pending.popleft().result()
+                merged = profile if merged is None else merged.merge(profile)
+        while pending:
+            profile = pending.popleft().result()
+            merged = profile if merged is None else merged.merge(profile)
+    return merged
+
+
+def profile_dataset(dataset_path: str, max_workers: Optional[int] = None) -> TableProfile:
+    """
+    Profiles a stored columnar dataset one row group per job. Workers read their
+    rows straight from the memory-mapped column files, so only sketches travel
+    between processes.
+    Args:
+        dataset_path (str): Directory of the columnar dataset.
+        max_workers (int, optional): Worker processes; defaults to the CPU count, 1 runs in-process.
+    Returns:
+        TableProfile: The merged profile.
+    """
+    dataset = open_dataset(dataset_path)
+    jobs = [(dataset_path, group['offset'], group['offset'] + group['num_rows']) for group in dataset.row_groups]
+    if len(jobs) <= 1:
+        max_workers = 1
+    profile = _profile_parallel(_profile_dataset_rows, jobs, max_workers)
+    return profile if profile is not None else TableProfile.for_dtypes({name: dataset.dtype(name) for name in dataset.columns})
+
+
+def profile_csv(filepath: str, chunk_size: int = DEFAULT_CHUNK_SIZE, max_workers: Optional[int] = None,
+                features: bool = True) -> TableProfile:
+    """
+    Profiles an engagement CSV in chunks of about chunk_size rows, parsed with the
+    shared schema. The file is split into byte ranges at line ends (the export
+    has no line breaks inside fields) and every worker reads and parses its own
+    range, so only sketches travel between processes. With features, the
+    registered features are computed per chunk and profiled alongside the raw
+    columns.
+    Args:
+        filepath (str): Path to the CSV file.
+        chunk_size (int): Approximate rows per chunk.
+        max_workers (int, optional): Worker processes; defaults to the CPU count, 1 runs in-process.
+        features (bool): Also profile the engineered features.
+    Returns:
+        TableProfile: The merged profile.
+    """
+    jobs = [(filepath, start, stop, features) for start, stop in _csv_ranges(filepath, chunk_size)]
+    if len(jobs) <= 1:
+        max_workers = 1
+    profile = _profile_parallel(_profile_csv_range, jobs, max_workers)
+    if profile is None:
+        raise ValueError(f"{filepath} holds no rows to profile.")
+    return profile
+
+
+# --- Report ---
+def _fmt(value) -> str:
+    if value is None:
+        return '&ndash;'
+    if isinstance(value, float):
+        return f'{value:,.4g}' if abs(value) < 1e6 else f'{value:,.0f}'
+    return f'{value:,}' if isinstance(value, int) else html.escape(str(value))
+
+
+def _bars_svg(heights: Sequence[int], width: int = 300, height: int = 60) -> str:
+    peak = max(heights) if heights and max(heights) else 1
+    bar = width / max(len(heights), 1)
+    rects = ''.join(f'<rect x="{i * bar:.1f}" y="{height - h / peak * height:.1f}" width="{max(bar - 1, 1):.1f}" '
+                    f'height="{h / peak * height:.1f}"/>' for i, h in enumerate(heights))
+    return f'<svg width="{width}" height="{height}" class="bars">{rects}</svg>'
+
+
+def _column_html(name: str, summary: dict) -> str:
+    stats = [('count', summary['count']), ('nulls', summary['nulls'])]
+    if summary['kind'] == 'numeric':
+        stats += [('distinct (approx.)', summary['distinct_approx']), ('mean', summary['mean']), ('std', summary['std']),
+                  ('min', summary['min'])] + list(summary['quantiles'].items()) + [('max', summary['max'])]
+        histogram = summary['histogram']
+        chart = _bars_svg(histogram['counts'])
+        if histogram['edges']:
+            chart += f'<div class="axis">{_fmt(histogram["edges"][0])} &hellip; {_fmt(histogram["edges"][-1])}</div>'
+    else:
+        stats.append(('distinct', summary['distinct']))
+        chart = '<table class="top">' + ''.join(
+            f'<tr><td>{html.escape(top["value"])}</td><td>{_fmt(top["count"])}</td><td>{top["share"]:.1%}</td></tr>'
+            for top in summary['top']) + '</table>'
+    rows = ''.join(f'<tr><th>{html.escape(label)}</th><td>{_fmt(value)}</td></tr>' for label, value in stats)
+    return (f'<section><h2>{html.escape(name)} <small>{summary.get("dtype", summary["kind"])}</small></h2>'
+            f'<div class="column"><table>{rows}</table><div>{chart}</div></div></section>')
+
+
+def _correlations_html(correlations: dict) -> str:
+    names = correlations['columns']
+    if not names:
+        return ''
+    header = ''.join(f'<th>{html.escape(name)}</th>' for name in names)
+    body = ''
+    for name, row in zip(names, correlations['matrix']):
+        cells = ''
+        for value in row:
+            if value is None:
+                cells += '<td>&ndash;</td>'
+            else:
+                color = f'rgba(200,40,40,{abs(value):.2f})' if value > 0 else f'rgba(40,80,200,{abs(value):.2f})'
+                cells += f'<td style="background:{color}">{value:.2f}</td>'
+        body += f'<tr><th>{html.escape(name)}</th>{cells}</tr>'
+    return f'<section><h2>Correlations (Pearson)</h2><table class="corr"><tr><th></th>{header}</tr>{body}</table></section>'
+
+
+def write_report(profile: TableProfile, html_path: str, json_path: Optional[str] = None,
+                 title: str = 'ShadowPersona EDA Report'):
+    """
+    Writes a self-contained HTML report (no scripts, charts as inline SVG) and
+    optionally the same profile as JSON.
+    """
+    summary = profile.to_dict()
+    columns = ''.join(_column_html(name, column) for name, column in summary['columns'].items())
+    document = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+section {{ border-top: 1px solid #ddd; padding: 0.5em 0; }}
+h2 small {{ color: #888; font-weight: normal; }}
+.column {{ display: flex; gap: 2em; align-items: flex-start; }}
+table {{ border-collapse: collapse; font-size: 0.9em; }}
+th, td {{ padding: 2px 8px; text-align: right; }}
+th {{ text-align: left; font-weight: normal; color: #555; }}
+.bars rect {{ fill: #4a7ab7; }}
+.axis {{ font-size: 0.8em; color: #888; }}
+.corr td {{ min-width: 3em; }}
+</style></head><body>
+<h1>{html.escape(title)}</h1>
+<p>{summary['num_rows']:,} rows, {len(summary['columns'])} columns.</p>
+{columns}
+{_correlations_html(summary['correlations'])}
+</body></html>
+"""
+    os.makedirs(os.path.dirname(html_path) or '.', exist_ok=True)
+    with open(html_path, 'w') as f:
+        f.write(document)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
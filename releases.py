@@ -0,0 +1,123 @@
+# releases.py
+
+import os
+import shutil
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+# Every pipeline run writes its outputs (dataset, rollup cube, user index) into a
+# fresh release directory under data/releases/ and then publishes it by atomically
+# replacing data/CURRENT, which names the live release. Readers resolve CURRENT
+# once and keep using that release, so they never see a half-written run and pick
+# up a new one just by re-reading CURRENT.
+DEFAULT_DATA_DIR = 'data'
+RELEASES_DIRNAME = 'releases'
+CURRENT_FILENAME = 'CURRENT'
+# Written into a release when it is published, holding the publish time in ns
+PUBLISHED_FILENAME = '_published'
+DEFAULT_KEEP_RELEASES = 2
+# How long a superseded release outlives its successor's publish, so dashboard
+# sessions that resolved it just before still find every file
+DEFAULT_GRACE_S = 600.0
+
+_last_release_ns = 0
+
+
+def releases_dir(data_dir: str = DEFAULT_DATA_DIR) -> str:
+    return os.path.join(data_dir, RELEASES_DIRNAME)
+
+
+def list_releases(data_dir: str = DEFAULT_DATA_DIR) -> List[str]:
+    """Returns the names of all release directories, oldest first."""
+    path = releases_dir(data_dir)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+
+def _publish_times(data_dir: str) -> List[Tuple[int, str]]:
+    # (publish time in ns, name) of every published release, in publish order
+    published = []
+    for name in list_releases(data_dir):
+        try:
+            with open(os.path.join(releases_dir(data_dir), name, PUBLISHED_FILENAME)) as f:
+                published.append((int(f.read()), name))
+        except (FileNotFoundError, ValueError):
+            continue
+    return sorted(published)
+
+
+def published_releases(data_dir: str = DEFAULT_DATA_DIR) -> List[str]:
+    """Returns the names of the releases that have been published, in publish order."""
+    return [name for _, name in _publish_times(data_dir)]
+
+
+def create_release(data_dir: str = DEFAULT_DATA_DIR) -> str:
+    """
+    Creates an empty, unpublished release directory and returns its path.
+    Names start with a UTC timestamp in nanoseconds, strictly increasing within
+    a process, so they sort in creation order.
+    """
+    global _last_release_ns
+    now = _last_release_ns = max(time.time_ns(), _last_release_ns + 1)
+    seconds, nanoseconds = divmod(now, 10**9)
+    name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(seconds))}.{nanoseconds:09d}Z-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(releases_dir(data_dir), name)
+    os.makedirs(path)
+    return path
+
+
+def discard_release(release_path: str):
+    """
+    Removes a release that will never be published, such as one left behind by
+    a failed run. Pruning only removes published releases, so without this an
+    abandoned release would stay on disk for good.
+    """
+    if os.path.exists(os.path.join(release_path, PUBLISHED_FILENAME)):
+        raise ValueError(f"{release_path} has been published; old releases are removed by pruning instead.")
+    shutil.rmtree(release_path, ignore_errors=True)
+
+
+def current_release(data_dir: str = DEFAULT_DATA_DIR) -> Optional[str]:
+    """Returns the path of the published release, or None if nothing has been published."""
+    try:
+        with open(os.path.join(data_dir, CURRENT_FILENAME)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(releases_dir(data_dir), name)
+    return path if name and os.path.isdir(path) else None
+
+
+def publish_release(release_path: str, data_dir: str = DEFAULT_DATA_DIR, keep: int = DEFAULT_KEEP_RELEASES,
+                    grace_s: float = DEFAULT_GRACE_S) -> List[str]:
+    """
+    Makes release_path the current release, then removes the releases published
+    before the `keep` most recently published ones, once they have been
+    superseded (the next release was published) at least grace_s seconds ago.
+    Releases that were never published (such as one another run is still
+    writing) are left alone. Readers re-resolve CURRENT on every dashboard run,
+    so the grace period only has to outlast a reader that resolved the old
+    release just before the switch; later runs prune what it leaves behind.
+    Returns:
+        list[str]: The names of the removed releases.
+    """
+    name = os.path.basename(os.path.normpath(release_path))
+    now = time.time_ns()
+    with open(os.path.join(release_path, PUBLISHED_FILENAME), 'w') as f:
+        f.write(str(now))
+    # Write-then-rename so CURRENT always names a complete release
+    tmp_path = os.path.join(data_dir, f"{CURRENT_FILENAME}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(data_dir, CURRENT_FILENAME))
+
+    published = _publish_times(data_dir)
+    # A release is superseded when the one after it in publish order is published
+    superseded = {old: successor_ns for (_, old), (successor_ns, _) in zip(published, published[1:])}
+    removed = [old for _, old in published[:max(len(published) - keep, 0)]
+               if old != name and now - superseded.get(old, now) >= grace_s * 1e9]
+    for old in removed:
+        shutil.rmtree(os.path.join(releases_dir(data_dir), old), ignore_errors=True)
+    return removed
@@ -0,0 +1,189 @@
+# replay_client.py
+
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from scoring_server import DEFAULT_HOST, DEFAULT_PORT, RECORD_COLUMNS
+
+# Replays a JSONL file of engagement records against the scoring server and
+# reports latency percentiles and throughput. With a rate the sends follow a
+# fixed schedule whatever the responses do (an open loop), and latency is taken
+# from the scheduled send time, so a server that falls behind shows up as
+# growing latency instead of silently lowering the offered load.
+DEFAULT_CONCURRENCY = 64
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+def write_replay_file(path: str, num_records: int, seed: Optional[int] = None) -> int:
+    """
+    Writes synthetic engagement records, one JSON object per line, in the form
+    the scoring server accepts (the CSV export's columns, without the label).
+    Returns:
+        int: The number of records written.
+    """
+    from data_generator import generate_engagement_batch
+    from schema import format_notification_time, format_user_id
+
+    df = generate_engagement_batch(num_records, seed=seed)[RECORD_COLUMNS]
+    with open(path, 'w') as f:
+        for record in df.astype(object).to_dict('records'):
+            record['user_id'] = format_user_id(record['user_id'])
+            record['notification_time'] = format_notification_time(record['notification_time'])
+            record = {key: None if isinstance(value, float) and np.isnan(value) else value
+                      for key, value in record.items()}
+            f.write(json.dumps(record, default=lambda value: value.item()) + '\n')
+    print(f"Wrote {len(df)} replay records to {path}.")
+    return len(df)
+
+
+def read_replay_file(path: str) -> List[bytes]:
+    """Reads a JSONL request file into request bodies, skipping blank lines."""
+    with open(path, 'rb') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class _Connection:
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: bytes = b'') -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        try:
+            await self.writer.drain()
+            status = int((await self.reader.readline()).split(b' ', 2)[1])
+            length = 0
+            while True:
+                line = await self.reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            return status, await self.reader.readexactly(length)
+        except (ConnectionError, IndexError, ValueError, asyncio.IncompleteReadError):
+            self.close()
+            raise ConnectionError(f"Connection to {self.host}:{self.port} failed mid-request.")
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def summarize_latencies(latencies: np.ndarray, errors: int, duration: float) -> dict:
+    """Request count, error count, throughput and latency percentiles (ms)."""
+    ms = latencies * 1000
+    summary = {'requests': len(latencies) + errors, 'errors': errors, 'duration_s': duration,
+               'throughput_rps': len(latencies) / duration if duration else 0.0}
+    if len(ms):
+        summary.update({f'p{q}_ms': float(np.percentile(ms, q)) for q in (50, 90, 99)})
+        summary['max_ms'] = float(ms.max())
+    return summary
+
+
+async def replay(bodies: List[bytes], url: str = DEFAULT_URL, rate: Optional[float] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+    """
+    Sends every body as a POST /score, over up to concurrency keep-alive
+    connections, either at rate requests per second or as fast as the
+    connections allow (rate None).
+    Returns:
+        dict: The latency summary, plus the server's batch statistics.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname or DEFAULT_HOST, parts.port or DEFAULT_PORT
+    pool: asyncio.Queue = asyncio.Queue()
+    for _ in range(concurrency):
+        pool.put_nowait(_Connection(host, port))
+    latencies = np.empty(len(bodies))
+    ok = np.zeros(len(bodies), dtype=bool)
+    start = time.perf_counter()
+
+    async def send(i: int, scheduled: float):
+        connection = await pool.get()
+        try:
+            status, _ = await connection.request('POST', '/score', bodies[i])
+            ok[i] = status == 200
+        except ConnectionError:
+            pass
+        finally:
+            latencies[i] = time.perf_counter() - scheduled
+            pool.put_nowait(connection)
+
+    if rate:
+        pending = []
+        for i in range(len(bodies)):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            pending.append(asyncio.create_task(send(i, scheduled)))
+        await asyncio.gather(*pending)
+    else:
+        next_body = iter(range(len(bodies)))
+
+        async def worker():
+            for i in next_body:
+                await send(i, time.perf_counter())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    summary = summarize_latencies(latencies[ok], int((~ok).sum()), duration)
+    stats_connection = await pool.get()
+    try:
+        status, body = await stats_connection.request('GET', '/stats')
+        if status == 200:
+            summary['server'] = json.loads(body)
+    except ConnectionError:
+        pass
+    while not pool.empty():
+        pool.get_nowait().close()
+    stats_connection.close()
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay engagement records against the scoring server.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    make_parser = subparsers.add_parser('make', help="Write a JSONL file of synthetic records to replay.")
+    make_parser.add_argument('path')
+    make_parser.add_argument('--num-records', type=int, default=10_000)
+    make_parser.add_argument('--seed', type=int, default=None)
+    run_parser = subparsers.add_parser('run', help="Replay a JSONL file and report latency and throughput.")
+    run_parser.add_argument('path', help="JSONL file with one engagement record per line.")
+    run_parser.add_argument('--url', default=DEFAULT_URL)
+    run_parser.add_argument('--rate', type=float, default=None, help="Requests per second; unset sends as fast as possible.")
+    run_parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Keep-alive connections.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'make':
+        write_replay_file(args.path, args.num_records, seed=args.seed)
+        return
+    bodies = read_replay_file(args.path)
+    pace = f"at {args.rate:g} req/s" if args.rate else "as fast as possible"
+    print(f"Replaying {len(bodies)} requests from {args.path} to {args.url} {pace}...")
+    summary = asyncio.run(replay(bodies, url=args.url, rate=args.rate, concurrency=args.concurrency))
+    print(f"{summary['requests']} requests, {summary['errors']} errors in {summary['duration_s']:.2f}s: "
+          f"{summary['throughput_rps']:,.0f} req/s")
+    if 'p50_ms' in summary:
+        print(f"latency p50 {summary['p50_ms']:.2f} ms, p90 {summary['p90_ms']:.2f} ms, "
+              f"p99 {summary['p99_ms']:.2f} ms, max {summary['max_ms']:.2f} ms")
+    if 'server' in summary:
+        server = summary['server']
+        print(f"server: {server['batches']} batches, mean size {server['mean_batch_size']:.1f}, "
+              f"largest {server['largest_batch']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# rollup.py
+
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from schema import AD_CATEGORIES, AD_EMOTIONS, FEED_BIAS_CATEGORIES, PSYCH_TRAITS
+from storage import open_dataset
+
+# Cube axes, in order, with the label of every cell along them. Categorical axes
+# use the schema dictionaries, so a column's stored codes index the axis directly,
+# plus a trailing MISSING cell for rows without a value (code -1): the feature
+# engine leaves feed_bias_category missing for a feed_bias_score outside [0, 1],
+# as pd.cut does, and schema.read_csv/apply_schema turn labels outside a
+# dictionary into missing values.
+MISSING = 'missing'
+DIMENSIONS = {
+    'predicted_trait_label': PSYCH_TRAITS + [MISSING],
+    'ad_click_emotion': AD_EMOTIONS + [MISSING],
+    'ad_category_clicked': AD_CATEGORIES + [MISSING],
+    'feed_bias_category': FEED_BIAS_CATEGORIES + [MISSING],
+    'active_notif_responder': [0, 1],
+}
+
+# Columns summed (and summed as squares) per cell
+MEASURES = ['session_time', 'doomscroll_length', 'rage_clicks', 'total_negative_engagement_score',
+            'feed_bias_score', 'keyword_sentiment_score']
+
+
+def _dimension_codes(name: str, values) -> np.ndarray:
+    if isinstance(values, (pd.Series, pd.Categorical)) and isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.codes.to_numpy() if isinstance(values, pd.Series) else values.codes
+    codes = np.asarray(values).astype(np.intp)
+    missing = codes < 0
+    if missing.any():
+        # Missing categorical values (code -1) go to the axis's MISSING cell
+        if DIMENSIONS[name][-1] != MISSING:
+            raise ValueError(f"Column '{name}' has missing values, which its rollup axis cannot hold.")
+        codes[missing] = len(DIMENSIONS[name]) - 1
+    return codes
+
+
+class RollupCube:
+    """
+    Counts, sums and sums of squares of MEASURES for every combination of
+    DIMENSIONS. Cubes built from separate chunks merge by addition, and every
+    dashboard aggregate (counts, means, standard deviations by any subset of
+    dimensions, filtered by any of them) is a cheap reduction over the cube.
+    """
+    def __init__(self, counts: Optional[np.ndarray] = None, sums: Optional[np.ndarray] = None,
+                 sumsq: Optional[np.ndarray] = None):
+        shape = tuple(len(labels) for labels in DIMENSIONS.values())
+        self.counts = counts if counts is not None else np.zeros(shape, dtype=np.int64)
+        self.sums = sums if sums is not None else np.zeros((len(MEASURES),) + shape, dtype=np.float64)
+        self.sumsq = sumsq if sumsq is not None else np.zeros((len(MEASURES),) + shape, dtype=np.float64)
+
+    @property
+    def total_count(self) -> int:
+        return int(self.counts.sum())
+
+    def update(self, columns: Mapping[str, np.ndarray]):
+        """
+        Adds a chunk of rows to the cube.
+        Args:
+            columns (Mapping[str, array]): Every dimension column (categoricals or their
+                codes) and every measure column, all of the same length.
+        """
+        cells = np.ravel_multi_index([_dimension_codes(name, columns[name]) for name in DIMENSIONS],
+                                     self.counts.shape)
+        size = self.counts.size
+        self.counts += np.bincount(cells, minlength=size).reshape(self.counts.shape)
+        for i, name in enumerate(MEASURES):
+            values = np.asarray(columns[name], dtype=np.float64)
+            self.sums[i] += np.bincount(cells, weights=values, minlength=size).reshape(self.counts.shape)
+            self.sumsq[i] += np.bincount(cells, weights=values * values, minlength=size).reshape(self.counts.shape)
+
+    def merge(self, other: 'RollupCube') -> 'RollupCube':
+        """Adds another cube's cells into this one."""
+        self.counts += other.counts
+        self.sums += other.sums
+        self.sumsq += other.sumsq
+        return self
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'RollupCube':
+        """Builds a cube from an in-memory processed DataFrame."""
+        cube = cls()
+        cube.update({name: df[name] for name in list(DIMENSIONS) + MEASURES})
+        return cube
+
+    def select(self, **filters: Sequence) -> 'RollupCube':
+        """
+        Returns the sub-cube whose cells match filters, e.g.
+        cube.select(predicted_trait_label=['anxious', 'curious']). Filtered axes
+        keep their full length; cells that do not match are zeroed.
+        """
+        mask = np.ones(self.counts.shape, dtype=bool)
+        for axis, (name, labels) in enumerate(DIMENSIONS.items()):
+            if name in filters:
+                keep = np.isin(np.asarray(labels, dtype=object), np.asarray(list(filters[name]), dtype=object))
+                mask &= keep.reshape([-1 if a == axis else 1 for a in range(mask.ndim)])
+        return RollupCube(np.where(mask, self.counts, 0), np.where(mask, self.sums, 0.0), np.where(mask, self.sumsq, 0.0))
+
+    def aggregate(self, by: Sequence[str] = (), measures: Optional[Sequence[str]] = None,
+                  include_empty: bool = False) -> pd.DataFrame:
+        """
+        Reduces the cube to one row per combination of the `by` dimensions.
+        Args:
+            by (list[str]): Dimensions to group by; empty for a single overall row.
+            measures (list[str], optional): Measures to report; defaults to all.
+            include_empty (bool): Keep groups with a zero count.
+        Returns:
+            pd.DataFrame: 'count' plus '<measure>_mean' and '<measure>_std' (sample standard
+                deviation) columns, indexed by `by`.
+        """
+        measures = list(measures) if measures is not None else MEASURES
+        names = list(DIMENSIONS)
+        reduce_axes = tuple(i for i, name in enumerate(names) if name not in by)
+        counts = self.counts.sum(axis=reduce_axes)
+        kept = [name for name in names if name in by]
+        if kept:
+            index = pd.MultiIndex.from_product([DIMENSIONS[name] for name in kept], names=kept)
+            if len(kept) == 1:
+                index = index.get_level_values(0)
+            # Reorder from cube axis order to the order requested in `by`
+            order = [kept.index(name) for name in by]
+        else:
+            index, order = pd.RangeIndex(1), []
+        data = {'count': counts.ravel() if kept else np.atleast_1d(counts)}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for name in measures:
+                i = MEASURES.index(name)
+                sums = self.sums[i].sum(axis=reduce_axes)
+                sumsq = self.sumsq[i].sum(axis=reduce_axes)
+                mean = sums / counts
+                # Sample variance (ddof=1), matching pandas' std
+                variance = np.maximum((sumsq - counts * mean * mean) / (counts - 1), 0.0)
+                data[f'{name}_mean'] = np.atleast_1d(mean).ravel()
+                data[f'{name}_std'] = np.sqrt(np.atleast_1d(variance)).ravel()
+        result = pd.DataFrame(data, index=index)
+        if len(order) > 1:
+            result = result.reorder_levels(order).sort_index()
+        if not include_empty:
+            result = result[result['count'] > 0]
+        return result
+
+    def save(self, path: str):
+        """Writes the cube to an .npz file."""
+        arrays = {f'labels_{name}': np.asarray([str(label) for label in labels]) for name, labels in DIMENSIONS.items()}
+        np.savez(path, counts=self.counts, sums=self.sums, sumsq=self.sumsq,
+                 dimensions=np.asarray(list(DIMENSIONS)), measures=np.asarray(MEASURES), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'RollupCube':
+        """Reads a cube written by save, checking it matches the current layout."""
+        with np.load(path, allow_pickle=False) as data:
+            if data['dimensions'].tolist() != list(DIMENSIONS) or data['measures'].tolist() != MEASURES:
+                raise ValueError(f"Rollup cube at {path} was built with a different layout; rebuild it with the pipeline.")
+            for name, labels in DIMENSIONS.items():
+                if data[f'labels_{name}'].tolist() != [str(label) for label in labels]:
+                    raise ValueError(f"Rollup cube at {path} has different '{name}' categories; rebuild it with the pipeline.")
+            return cls(data['counts'], data['sums'], data['sumsq'])
+
+
+def build_rollup_from_dataset(dataset_path: str) -> RollupCube:
+    """
+    Builds a cube from a stored columnar dataset, one row group at a time.
+    Only the dimension and measure columns are read, straight from their
+    memory-mapped files (categoricals as stored codes).
+    """
+    dataset = open_dataset(dataset_path)
+    for name, labels in DIMENSIONS.items():
+        spec = dataset.footer['columns'][name]
+        if spec['kind'] == 'categorical' and spec['categories'] != labels[:len(spec['categories'])]:
+            raise ValueError(f"Column '{name}' in {dataset_path} does not use the schema categories.")
+    cube = RollupCube()
+    names = list(DIMENSIONS) + MEASURES
+    for group in dataset.row_groups:
+        start, stop = group['offset'], group['offset'] + group['num_rows']
+        cube.update({name: dataset.column_slice(name, start, stop) for name in names})
+    return cube
@@ -0,0 +1,139 @@
+# schema.py
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# --- Fixed categorical dictionaries ---
+# The order of each list is the integer code stored for that category, so
+# never reorder an existing entry; only append new ones.
+AD_EMOTIONS = ['anger', 'curiosity', 'joy', 'sadness', 'surprise', 'neutral']
+AD_CATEGORIES = ['finance', 'travel', 'fashion', 'tech', 'food', 'gaming', 'news']
+PSYCH_TRAITS = ['anxious', 'impulsive', 'curious', 'skeptical', 'compliant', 'distracted']
+FEED_BIAS_CATEGORIES = ['left_leaning', 'neutral', 'right_leaning']
+
+AD_EMOTION_DTYPE = CategoricalDtype(AD_EMOTIONS)
+AD_CATEGORY_DTYPE = CategoricalDtype(AD_CATEGORIES)
+PSYCH_TRAIT_DTYPE = CategoricalDtype(PSYCH_TRAITS)
+# Ordered, like the categorical pd.cut produces for the bias buckets
+FEED_BIAS_CATEGORY_DTYPE = CategoricalDtype(FEED_BIAS_CATEGORIES, ordered=True)
+
+# --- Column layout ---
+# user_id is the integer behind "user_00042"; notification_time is seconds since midnight.
+RAW_DTYPES = {
+    'user_id': np.dtype(np.uint32),
+    'session_time': np.dtype(np.uint8),
+    'rage_clicks': np.dtype(np.uint8),
+    'doomscroll_length': np.dtype(np.float32),
+    'ad_click_emotion': AD_EMOTION_DTYPE,
+    'feed_bias_score': np.dtype(np.float32),
+    'notification_time': np.dtype(np.uint32),
+    'notif_response_time': np.dtype(np.float32),
+    'keyword_sentiment_score': np.dtype(np.float32),
+    'ad_category_clicked': AD_CATEGORY_DTYPE,
+    'predicted_trait_label': PSYCH_TRAIT_DTYPE,
+}
+
+FEATURE_DTYPES = {
+    'total_negative_engagement_score': np.dtype(np.float32),
+    'active_notif_responder': np.dtype(np.uint8),
+    'feed_bias_category': FEED_BIAS_CATEGORY_DTYPE,
+}
+
+PROCESSED_DTYPES = {**RAW_DTYPES, **FEATURE_DTYPES}
+
+# --- Optional identity columns (generated by identity.py when requested) ---
+IDENTITY_COLUMNS = ['name', 'country', 'city', 'age_band', 'device', 'signup_date']
+AGE_BANDS = ['13-17', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+DEVICES = ['android_phone', 'iphone', 'android_tablet', 'ipad', 'windows_desktop', 'mac_desktop', 'linux_desktop']
+AGE_BAND_DTYPE = CategoricalDtype(AGE_BANDS, ordered=True)
+DEVICE_DTYPE = CategoricalDtype(DEVICES)
+SIGNUP_DATE_DTYPE = np.dtype('datetime64[s]')
+
+
+def identity_dtypes(columns=IDENTITY_COLUMNS) -> dict:
+    """
+    Dtypes of the given identity columns. Name, country and city categories
+    come from the identity vocabulary, which is only loaded when one of them
+    is asked for.
+    """
+    dtypes = {'age_band': AGE_BAND_DTYPE, 'device': DEVICE_DTYPE, 'signup_date': SIGNUP_DATE_DTYPE}
+    if {'name', 'country', 'city'} & set(columns):
+        from identity import load_vocabulary
+        vocabulary = load_vocabulary()
+        dtypes.update(name=vocabulary.name_dtype, country=vocabulary.country_dtype, city=vocabulary.city_dtype)
+    return {column: dtypes[column] for column in IDENTITY_COLUMNS if column in columns}
+
+USER_ID_PREFIX = 'user_'
+
+
+def format_user_id(user_id) -> str:
+    """Formats an integer user id for display, e.g. 42 -> 'user_00042'."""
+    return f"{USER_ID_PREFIX}{int(user_id):05d}"
+
+
+def format_notification_time(seconds) -> str:
+    """Formats seconds since midnight as 'HH:MM:SS'."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _parse_user_ids(values: pd.Series) -> pd.Series:
+    # Legacy files store "user_00042" strings
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype(str).str.removeprefix(USER_ID_PREFIX).astype(np.int64)
+    return values
+
+
+def _parse_notification_times(values: pd.Series) -> pd.Series:
+    # Legacy files store "HH:MM:SS" strings
+    if not pd.api.types.is_numeric_dtype(values):
+        parts = values.astype(str).str.split(':', expand=True).astype(np.int64)
+        values = parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return values
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts every known column of df, identity columns included, to the shared
+    compact layout. Columns already in the layout are left untouched, and
+    legacy string user ids and notification times are converted, so this is
+    cheap to call on data that a pipeline stage has already produced.
+    Args:
+        df (pd.DataFrame): Raw or processed engagement data.
+    Returns:
+        pd.DataFrame: The same frame with schema dtypes applied.
+    """
+    if 'user_id' in df.columns:
+        df['user_id'] = _parse_user_ids(df['user_id'])
+    if 'notification_time' in df.columns:
+        df['notification_time'] = _parse_notification_times(df['notification_time'])
+    dtypes = {**PROCESSED_DTYPES, **identity_dtypes([column for column in IDENTITY_COLUMNS if column in df.columns])}
+    for column, dtype in dtypes.items():
+        if column in df.columns and df[column].dtype != dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def read_csv(filepath: str, **kwargs) -> pd.DataFrame:
+    """
+    Reads an engagement CSV straight into the shared layout.
+    Categorical and float columns are parsed into their final dtypes by the CSV
+    reader; integer columns go through apply_schema so legacy files still load.
+    Args:
+        filepath (str): Path to the CSV file, or a seekable file object.
+        **kwargs: Passed through to pd.read_csv (e.g. usecols, chunksize).
+    Returns:
+        pd.DataFrame: The data in the shared layout (an iterator of such frames
+        when chunksize is given).
+    """
+    header = pd.read_csv(filepath, nrows=0).columns
+    if hasattr(filepath, 'seek'):
+        filepath.seek(0)
+    dtypes = {**PROCESSED_DTYPES, **identity_dtypes([column for column in IDENTITY_COLUMNS if column in header])}
+    dtype = {column: dtype for column, dtype in dtypes.items()
+             if isinstance(dtype, CategoricalDtype) or dtype.kind == 'f'}
+    reader = pd.read_csv(filepath, dtype=dtype, **kwargs)
+    if kwargs.get('chunksize') or kwargs.get('iterator'):
+        return (apply_schema(chunk) for chunk in reader)
+    return apply_schema(reader)
@@ -0,0 +1,270 @@
+# scoring_server.py
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from features import compute_features
+from releases import DEFAULT_DATA_DIR, current_release
+from schema import RAW_DTYPES, USER_ID_PREFIX, apply_schema, format_user_id
+from training import MODEL_NAME, TARGET, TraitModel
+
+# Local scoring service for single engagement records, over plain HTTP/1.1 with
+# keep-alive:
+#   POST /score   body: one raw engagement record as JSON (the columns of the
+#                 CSV export, minus predicted_trait_label)
+#                 -> {"user_id": ..., "predicted_trait_label": ...}
+#   GET  /stats   -> request and batch counters
+# Requests are not scored one by one: they queue up while the previous batch is
+# being scored, and the next batch takes everything waiting (up to
+# max_batch_size, after at most max_wait_ms), so under load one vectorized
+# feature-engineering and predict call serves many requests.
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH_SIZE = 512
+DEFAULT_MAX_WAIT_MS = 2.0
+RECORD_COLUMNS = [column for column in RAW_DTYPES if column != TARGET]
+MAX_BODY_BYTES = 1 << 20
+# Legacy 'HH:MM:SS' notification times, as in the CSV export
+_TIME_PATTERN = re.compile(r'([01]\d|2[0-3]):([0-5]\d):([0-5]\d)')
+
+
+class RecordError(ValueError):
+    """A request record that cannot be scored."""
+
+
+def _is_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check_record(record) -> dict:
+    """
+    Checks that a raw record fits the shared schema before it is queued:
+    every column present, categories from the schema dictionaries, integers in
+    range and notification times as seconds since midnight or 'HH:MM:SS'.
+    A bad record is turned away on its own instead of failing its batch.
+    Raises:
+        RecordError: Naming the first column that does not fit.
+    """
+    if not isinstance(record, dict):
+        raise RecordError("Record must be a JSON object.")
+    missing = [column for column in RECORD_COLUMNS if column not in record]
+    if missing:
+        raise RecordError(f"Record is missing {missing}.")
+    for column in RECORD_COLUMNS:
+        value, dtype = record[column], RAW_DTYPES[column]
+        if column == 'user_id':
+            valid = (_is_integer(value) and 0 <= value <= np.iinfo(dtype).max) or \
+                (isinstance(value, str) and re.fullmatch(rf'{USER_ID_PREFIX}\d+', value) is not None)
+            expected = f"an integer or a '{USER_ID_PREFIX}<digits>' string"
+        elif column == 'notification_time':
+            valid = (_is_integer(value) and 0 <= value < 86400) or \
+                (isinstance(value, str) and _TIME_PATTERN.fullmatch(value) is not None)
+            expected = "seconds since midnight or an 'HH:MM:SS' string"
+        elif isinstance(dtype, CategoricalDtype):
+            valid = isinstance(value, str) and value in dtype.categories
+            expected = f"one of {list(dtype.categories)}"
+        elif dtype.kind == 'f':
+            valid = value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+            expected = "a number or null"
+        else:
+            info = np.iinfo(dtype)
+            valid = _is_integer(value) and info.min <= value <= info.max
+            expected = f"an integer in [{info.min}, {info.max}]"
+        if not valid:
+            raise RecordError(f"'{column}' must be {expected}, got {value!r}.")
+    return record
+
+
+def score_records(model: TraitModel, records: List[dict]) -> List[dict]:
+    """
+    Scores raw engagement records in one vectorized pass: the shared schema,
+    the registered features (as in feature_engineer_data), then the model.
+    """
+    df = apply_schema(pd.DataFrame.from_records(records, columns=RECORD_COLUMNS))
+    compute_features(df)
+    labels = model.predict(df)
+    return [{'user_id': format_user_id(user_id), TARGET: label} for user_id, label in zip(df['user_id'], labels)]
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent score requests into batches. Batches are scored one at
+    a time on a worker thread, so the event loop keeps accepting requests (and
+    filling the next batch) meanwhile.
+    Args:
+        model (TraitModel): The loaded model.
+        max_batch_size (int): Most records scored in one call.
+        max_wait_ms (float): How long a batch waits for more records once its
+            first one has arrived.
+    """
+    def __init__(self, model: TraitModel, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scoring')
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    async def score(self, record: dict) -> dict:
+        check_record(record)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future))
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[dict, asyncio.Future]]:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score_batch(self, records: List[dict]) -> List[object]:
+        try:
+            return score_records(self.model, records)
+        except Exception:
+            # One malformed record must not fail the others, so find it the slow way
+            results = []
+            for record in records:
+                try:
+                    results.append(score_records(self.model, [record])[0])
+                except Exception as e:
+                    results.append(RecordError(f"Could not score record: {e}"))
+            return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            results = await loop.run_in_executor(self.executor, self._score_batch, [record for record, _ in batch])
+            self.requests += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {'requests': self.requests, 'batches': self.batches, 'largest_batch': self.largest_batch,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.0}
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    if length > MAX_BODY_BYTES:
+        raise RecordError(f"Request body over {MAX_BODY_BYTES} bytes.")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, body
+
+
+def _response(status: str, payload) -> bytes:
+    body = json.dumps(payload).encode()
+    return (f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n\r\n").encode() + body
+
+
+async def _handle_connection(batcher: MicroBatcher, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                writer.write(_response('400 Bad Request', {'error': str(e)}))
+                break
+            if request is None:
+                break
+            method, path, body = request
+            if method == 'POST' and path == '/score':
+                try:
+                    writer.write(_response('200 OK', await batcher.score(json.loads(body))))
+                except (ValueError, TypeError) as e:
+                    writer.write(_response('400 Bad Request', {'error': str(e)}))
+            elif method == 'GET' and path == '/stats':
+                writer.write(_response('200 OK', batcher.stats()))
+            else:
+                writer.write(_response('404 Not Found', {'error': f"No route for {method} {path}."}))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def default_model_path(data_dir: str = DEFAULT_DATA_DIR) -> Optional[str]:
+    """The trait model of the currently published release, if any."""
+    release = current_release(data_dir)
+    return os.path.join(release, MODEL_NAME) if release else None
+
+
+async def serve(model_path: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+    """Loads the model once and serves score requests until cancelled."""
+    batcher = MicroBatcher(TraitModel.load(model_path), max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batch_loop = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(lambda r, w: _handle_connection(batcher, r, w), host, port, backlog=1024)
+    print(f"Scoring with {model_path} ('{batcher.model.name}') on http://{host}:{port}/score.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_loop.cancel()
+        batcher.executor.shutdown()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Micro-batching scoring server for ShadowPersona engagement records.")
+    parser.add_argument('--model', default=None, help="Model file; defaults to the published release's trait model.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long a batch waits for more requests after its first one.")
+    args = parser.parse_args(argv)
+    model_path = args.model or default_model_path(args.data_dir)
+    if model_path is None or not os.path.exists(model_path):
+        parser.error("No trait model found; run the pipeline with train=True or pass --model.")
+    try:
+        asyncio.run(serve(model_path, args.host, args.port, args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+# storage.py
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# A dataset is a directory holding one raw little-endian file per column plus a
+# JSON footer. Categorical columns are stored as integer codes and their
+# dictionaries live in the footer. Rows are grouped into row groups, and the
+# footer keeps per-row-group min/max/null statistics so readers can skip groups
+# that cannot match a filter. Column files are memory-mapped on read.
+FOOTER_FILENAME = '_footer.json'
+FORMAT_NAME = 'shadowpersona-columnar'
+FORMAT_VERSION = 1
+DEFAULT_ROW_GROUP_SIZE = 262_144
+
+# A partitioned dataset is a directory of such datasets, one per partition, plus
+# a JSON manifest listing them in row order. It is written last, so a reader
+# sees either every partition or no dataset at all.
+MANIFEST_FILENAME = '_manifest.json'
+PARTITIONED_FORMAT_NAME = 'shadowpersona-partitioned'
+
+# (column, op, value) triples, e.g. ('predicted_trait_label', 'in', ['anxious'])
+Filter = Tuple[str, str, object]
+
+_COMPARISONS = {
+    '==': np.equal, '!=': np.not_equal,
+    '<': np.less, '<=': np.less_equal,
+    '>': np.greater, '>=': np.greater_equal,
+}
+
+
+def _code_dtype(num_categories: int) -> np.dtype:
+    return np.dtype(np.int8) if num_categories < 128 else np.dtype(np.int16) if num_categories < 32768 else np.dtype(np.int32)
+
+
+def _column_spec(series: pd.Series) -> dict:
+    dtype = series.dtype
+    if isinstance(dtype, CategoricalDtype):
+        categories = dtype.categories.tolist()
+        return {'kind': 'categorical', 'dtype': _code_dtype(len(categories)).str,
+                'categories': categories, 'ordered': bool(dtype.ordered)}
+    if dtype.kind not in 'biufM':
+        raise TypeError(f"Column '{series.name}' has unsupported dtype {dtype}; only fixed-width and categorical columns can be stored.")
+    return {'kind': 'numeric', 'dtype': dtype.newbyteorder('<').str}
+
+
+def _json_scalar(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _column_stats(values: np.ndarray, spec: dict) -> dict:
+    if spec['kind'] == 'categorical':
+        valid = values[values >= 0]
+        nulls = len(values) - len(valid)
+    elif values.dtype.kind in 'fM':
+        valid = values[~np.isnan(values)]
+        nulls = len(values) - len(valid)
+    else:
+        valid, nulls = values, 0
+    if len(valid) == 0:
+        return {'min': None, 'max': None, 'null_count': int(nulls)}
+    low, high = valid.min(), valid.max()
+    if values.dtype.kind == 'M':
+        low, high = low.astype('int64'), high.astype('int64')
+    return {'min': _json_scalar(low), 'max': _json_scalar(high), 'null_count': int(nulls)}
+
+
+def _encode(series: pd.Series, spec: dict) -> np.ndarray:
+    if spec['kind'] == 'categorical':
+        if series.cat.categories.tolist() != spec['categories']:
+            series = series.cat.set_categories(spec['categories'])
+        return np.ascontiguousarray(series.cat.codes.to_numpy(), dtype=spec['dtype'])
+    return np.ascontiguousarray(series.to_numpy(), dtype=spec['dtype'])
+
+
+def _write_footer(path: str, footer: dict):
+    # Write-then-rename so readers never observe a half-written footer
+    tmp_path = os.path.join(path, FOOTER_FILENAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(footer, f)
+    os.replace(tmp_path, os.path.join(path, FOOTER_FILENAME))
+
+
+def read_footer(path: str) -> dict:
+    """Reads and validates the footer of the dataset at path."""
+    with open(os.path.join(path, FOOTER_FILENAME)) as f:
+        footer = json.load(f)
+    if footer.get('format') != FORMAT_NAME:
+        raise ValueError(f"{path} is not a {FORMAT_NAME} dataset.")
+    if footer.get('version', 0) > FORMAT_VERSION:
+        raise ValueError(f"{path} uses format version {footer['version']}, newer than supported version {FORMAT_VERSION}.")
+    return footer
+
+
+def is_dataset(path: str) -> bool:
+    """Returns True if path holds a columnar dataset, partitioned or not."""
+    return os.path.isfile(os.path.join(path, FOOTER_FILENAME)) or is_partitioned(path)
+
+
+def is_partitioned(path: str) -> bool:
+    """Returns True if path holds a partitioned dataset."""
+    return os.path.isfile(os.path.join(path, MANIFEST_FILENAME))
+
+
+def partition_path(path: str, index: int) -> str:
+    """Directory of partition index within the partitioned dataset at path."""
+    return os.path.join(path, f"part-{index:05d}")
+
+
+def write_manifest(path: str, partitions: Sequence[str]) -> dict:
+    """
+    Publishes the written partitions (dataset directories inside path, in row
+    order) as one partitioned dataset at path. Every partition must have the
+    same columns, dtypes and categories.
+    Returns:
+        dict: The manifest.
+    """
+    entries, columns = [], None
+    for partition in partitions:
+        footer = read_footer(partition)
+        if columns is None:
+            columns = footer['columns']
+        if footer['columns'] != columns:
+            raise ValueError(f"Partition {partition} does not match the layout of the first partition.")
+        entries.append({'path': os.path.relpath(partition, path), 'num_rows': footer['num_rows']})
+    manifest = {'format': PARTITIONED_FORMAT_NAME, 'version': FORMAT_VERSION,
+                'num_rows': sum(entry['num_rows'] for entry in entries), 'partitions': entries}
+    tmp_path = os.path.join(path, MANIFEST_FILENAME + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILENAME))
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    """Reads and validates the manifest of the partitioned dataset at path."""
+    with open(os.path.join(path, MANIFEST_FILENAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != PARTITIONED_FORMAT_NAME:
+        raise ValueError(f"{path} is not a {PARTITIONED_FORMAT_NAME} dataset.")
+    if manifest.get('version', 0) > FORMAT_VERSION:
+        raise ValueError(f"{path} uses format version {manifest['version']}, newer than supported version {FORMAT_VERSION}.")
+    if not manifest['partitions']:
+        raise ValueError(f"{path} has no partitions.")
+    return manifest
+
+
+class ColumnarWriter:
+    """
+    Appends DataFrame chunks to a columnar dataset.
+    Each chunk is split into row groups of at most row_group_size rows and its
+    columns are appended to the per-column files; the footer is rewritten on
+    close. Use as a context manager. Appending first cuts the column files back
+    to the rows the footer commits, dropping what an interrupted write left.
+    Args:
+        path (str): Dataset directory.
+        mode (str): 'w' to replace any existing dataset, 'a' to append to it.
+        row_group_size (int): Maximum rows per row group.
+    """
+    def __init__(self, path: str, mode: str = 'w', row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        if mode not in ('w', 'a'):
+            raise ValueError(f"mode must be 'w' or 'a', got {mode!r}")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.bytes_written = 0
+        os.makedirs(path, exist_ok=True)
+        if mode == 'a' and is_dataset(path):
+            self.footer = read_footer(path)
+            self._discard_uncommitted()
+        else:
+            self.footer = {'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'num_rows': 0,
+                           'columns': {}, 'row_groups': []}
+            for name in os.listdir(path):
+                if name.endswith('.bin') or name == FOOTER_FILENAME:
+                    os.remove(os.path.join(path, name))
+        self._files = {}
+
+    def _discard_uncommitted(self):
+        # A write interrupted before its footer was committed can leave column
+        # files longer than the footer says (or files of columns it never
+        # recorded); appending after that tail would misalign the columns.
+        columns = self.footer['columns']
+        for name in os.listdir(self.path):
+            if name.endswith('.bin') and name[:-len('.bin')] not in columns:
+                os.remove(os.path.join(self.path, name))
+        for name, spec in columns.items():
+            file_path = os.path.join(self.path, f"{name}.bin")
+            size = self.footer['num_rows'] * np.dtype(spec['dtype']).itemsize
+            if (os.path.getsize(file_path) if os.path.exists(file_path) else 0) < size:
+                raise ValueError(f"Column file {file_path} is shorter than the {self.footer['num_rows']} rows in its footer.")
+            os.truncate(file_path, size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, df: pd.DataFrame):
+        """Appends df to the dataset."""
+        columns = self.footer['columns']
+        if not columns:
+            columns.update({name: _column_spec(df[name]) for name in df.columns})
+        elif list(df.columns) != list(columns):
+            raise ValueError(f"Chunk columns {list(df.columns)} do not match dataset columns {list(columns)}.")
+        encoded = {name: _encode(df[name], spec) for name, spec in columns.items()}
+
+        for start in range(0, len(df), self.row_group_size):
+            stop = min(start + self.row_group_size, len(df))
+            stats = {}
+            for name, spec in columns.items():
+                values = encoded[name][start:stop]
+                stats[name] = _column_stats(values, spec)
+                values.tofile(self._file(name))
+                self.bytes_written += values.nbytes
+            self.footer['row_groups'].append({'offset': self.footer['num_rows'], 'num_rows': stop - start, 'stats': stats})
+            self.footer['num_rows'] += stop - start
+
+    def _file(self, name: str):
+        if name not in self._files:
+            self._files[name] = open(os.path.join(self.path, f"{name}.bin"), 'ab')
+        return self._files[name]
+
+    def close(self):
+        """Flushes the column files and writes the footer."""
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        _write_footer(self.path, self.footer)
+
+
+def write_dataset(df: pd.DataFrame, path: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> int:
+    """
+    Writes df as a columnar dataset at path, replacing any existing one.
+    Returns:
+        int: The number of column bytes written.
+    """
+    with ColumnarWriter(path, mode='w', row_group_size=row_group_size) as writer:
+        writer.write(df)
+    return writer.bytes_written
+
+
+class ColumnarDataset:
+    """
+    Read-only, memory-mapped view of a columnar dataset.
+    Columns are only mapped when first accessed, so reading a projection
+    touches just those column files. Row groups whose statistics rule out a
+    filter are skipped without reading their data.
+    Args:
+        path (str): Dataset directory.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.footer = read_footer(path)
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    @property
+    def num_rows(self) -> int:
+        return self.footer['num_rows']
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.footer['columns'])
+
+    @property
+    def row_groups(self) -> List[dict]:
+        return self.footer['row_groups']
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def dtype(self, name: str):
+        """Returns the pandas dtype of a column."""
+        spec = self.footer['columns'][name]
+        if spec['kind'] == 'categorical':
+            return CategoricalDtype(spec['categories'], ordered=spec['ordered'])
+        return np.dtype(spec['dtype'])
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Returns the raw stored values of a column as a read-only memory map
+        (integer codes for categorical columns). No data is copied.
+        """
+        if name not in self._arrays:
+            spec = self.footer['columns'][name]
+            if self.num_rows == 0:
+                array = np.empty(0, dtype=spec['dtype'])
+            else:
+                array = np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=spec['dtype'],
+                                  mode='r', shape=(self.num_rows,))
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    def column_slice(self, name: str, start: int, stop: int) -> np.ndarray:
+        """Returns rows [start, stop) of column(name), as a view where the layout allows one."""
+        return self.column(name)[start:stop]
+
+    def column_take(self, name: str, offsets: Sequence[int]) -> np.ndarray:
+        """Returns the values of column(name) at the row offsets, touching only the pages that hold them."""
+        return self.column(name)[np.asarray(offsets, dtype=np.int64)]
+
+    def _series(self, name: str, start: int, stop: int, index: Optional[np.ndarray] = None) -> pd.Series:
+        values = self.column_slice(name, start, stop)
+        if index is not None:
+            values = values[index]
+        dtype = self.dtype(name)
+        if isinstance(dtype, CategoricalDtype):
+            return pd.Series(pd.Categorical.from_codes(values, dtype=dtype), name=name)
+        return pd.Series(np.array(values), name=name)
+
+    def _encode_value(self, name: str, value):
+        spec = self.footer['columns'][name]
+        if spec['kind'] != 'categorical':
+            return value
+        categories = spec['categories']
+        if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+            return [categories.index(v) for v in value if v in categories]
+        return categories.index(value) if value in categories else -2
+
+    def _row_group_may_match(self, stats: dict, filters: Sequence[Filter]) -> bool:
+        for name, op, value in filters:
+            low, high = stats[name]['min'], stats[name]['max']
+            if low is None:
+                return False
+            value = self._encode_value(name, value)
+            if op == 'in':
+                if not any(low <= v <= high for v in value):
+                    return False
+            elif (op == '==' and not low <= value <= high) or (op == '<' and not low < value) \
+                    or (op == '<=' and not low <= value) or (op == '>' and not high > value) \
+                    or (op == '>=' and not high >= value):
+                return False
+        return True
+
+    def _filter_mask(self, start: int, stop: int, filters: Sequence[Filter]) -> Optional[np.ndarray]:
+        mask = None
+        for name, op, value in filters:
+            values = self.column_slice(name, start, stop)
+            value = self._encode_value(name, value)
+            if op == 'in':
+                matched = np.isin(values, value)
+            elif op in _COMPARISONS:
+                matched = _COMPARISONS[op](values, value)
+            else:
+                raise ValueError(f"Unsupported filter operator {op!r}")
+            mask = matched if mask is None else mask & matched
+        return mask
+
+    def iter_row_groups(self, columns: Optional[Sequence[str]] = None,
+                        filters: Optional[Sequence[Filter]] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields one DataFrame per row group that can match filters.
+        Args:
+            columns (list[str], optional): Columns to load; defaults to all.
+            filters (list[Filter], optional): Row filters, ANDed together.
+        Yields:
+            pd.DataFrame: The matching rows of each row group.
+        """
+        columns = list(columns) if columns is not None else self.columns
+        filters = list(filters or [])
+        for group in self.row_groups:
+            if filters and not self._row_group_may_match(group['stats'], filters):
+                continue
+            start, stop = group['offset'], group['offset'] + group['num_rows']
+            index = np.flatnonzero(self._filter_mask(start, stop, filters)) if filters else None
+            frame = pd.DataFrame({name: self._series(name, start, stop, index) for name in columns})
+            frame.index = np.arange(start, stop)[index] if index is not None else pd.RangeIndex(start, stop)
+            yield frame
+
+    def where(self, filters: Sequence[Filter]) -> np.ndarray:
+        """
+        Returns the offsets of the rows matching filters, ascending. Only the
+        filter columns are read, so the result is a cheap view definition that
+        can be passed to read_rows or used to index column().
+        """
+        filters = list(filters)
+        pieces = []
+        for group in self.row_groups:
+            if filters and not self._row_group_may_match(group['stats'], filters):
+                continue
+            start, stop = group['offset'], group['offset'] + group['num_rows']
+            if filters:
+                pieces.append(start + np.flatnonzero(self._filter_mask(start, stop, filters)))
+            else:
+                pieces.append(np.arange(start, stop))
+        return np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int64)
+
+    def read_rows(self, offsets: Sequence[int], columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Loads specific rows by offset, touching only the pages that hold them.
+        The index holds each row's offset in the dataset.
+        """
+        columns = list(columns) if columns is not None else self.columns
+        offsets = np.asarray(offsets, dtype=np.int64)
+        frame = pd.DataFrame({name: self._series(name, 0, self.num_rows, offsets) for name in columns})
+        frame.index = offsets
+        return frame
+
+    def read(self, columns: Optional[Sequence[str]] = None,
+             filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        """
+        Loads the selected columns of all rows matching filters into a DataFrame.
+        The index holds each row's offset in the dataset.
+        """
+        columns = list(columns) if columns is not None else self.columns
+        if not filters:
+            frame = pd.DataFrame({name: self._series(name, 0, self.num_rows) for name in columns})
+            return frame
+        frames = list(self.iter_row_groups(columns, filters))
+        if not frames:
+            return pd.DataFrame({name: pd.Series([], dtype=self.dtype(name)) for name in columns})
+        return pd.concat(frames)
+
+
+class PartitionedDataset(ColumnarDataset):
+    """
+    Read-only view of a partitioned dataset as one table, with the same
+    interface as ColumnarDataset. Row offsets and row groups are global; every
+    row group lies within one partition, so row-group reads stay memory-mapped
+    views. Whole-table reads (read, where, read_rows) go over the partitions in
+    parallel on up to max_workers threads. Nothing is concatenated across
+    partitions except by column(), which callers should avoid for large data.
+    Args:
+        path (str): Directory holding the manifest.
+        max_workers (int, optional): Reader threads; defaults to one per partition.
+    """
+    def __init__(self, path: str, max_workers: Optional[int] = None):
+        self.path = path
+        self.manifest = read_manifest(path)
+        self.partitions = [ColumnarDataset(os.path.join(path, entry['path'])) for entry in self.manifest['partitions']]
+        self.starts = np.cumsum([0] + [partition.num_rows for partition in self.partitions])
+        self.max_workers = max_workers or len(self.partitions)
+        row_groups = [dict(group, offset=group['offset'] + int(start))
+                      for partition, start in zip(self.partitions, self.starts) for group in partition.row_groups]
+        self.footer = dict(self.partitions[0].footer, num_rows=int(self.starts[-1]), row_groups=row_groups)
+
+    def _map(self, fn, items: Sequence) -> list:
+        if len(items) <= 1 or self.max_workers == 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(fn, items))
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Returns a whole column. Unlike a single dataset's, this is a new
+        in-memory concatenation of the partitions on every call; use
+        column_slice, column_take or the row-group readers instead.
+        """
+        return np.concatenate([partition.column(name) for partition in self.partitions])
+
+    def column_slice(self, name: str, start: int, stop: int) -> np.ndarray:
+        # A view when the rows lie in one partition, as a row group's always do
+        first = min(max(int(np.searchsorted(self.starts, start, side='right')) - 1, 0), len(self.partitions) - 1)
+        last = max(int(np.searchsorted(self.starts, stop, side='left')) - 1, first)
+        pieces = [self.partitions[i].column(name)[max(start - self.starts[i], 0):stop - self.starts[i]]
+                  for i in range(first, min(last + 1, len(self.partitions)))]
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+    def column_take(self, name: str, offsets: Sequence[int]) -> np.ndarray:
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(offsets) and (offsets.min() < 0 or offsets.max() >= self.num_rows):
+            raise IndexError(f"Row offsets out of range for a dataset of {self.num_rows} rows.")
+        owner = np.searchsorted(self.starts, offsets, side='right') - 1
+        values = np.empty(len(offsets), dtype=self.footer['columns'][name]['dtype'])
+        for i in np.unique(owner):
+            rows = owner == i
+            values[rows] = self.partitions[i].column(name)[offsets[rows] - self.starts[i]]
+        return values
+
+    def where(self, filters: Sequence[Filter]) -> np.ndarray:
+        return np.concatenate(self._map(lambda i: self.partitions[i].where(filters) + self.starts[i],
+                                        range(len(self.partitions))))
+
+    def read_rows(self, offsets: Sequence[int], columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(offsets) == 0:
+            return self.partitions[0].read_rows(offsets, columns)
+        if offsets.min() < 0 or offsets.max() >= self.num_rows:
+            raise IndexError(f"Row offsets out of range for a dataset of {self.num_rows} rows.")
+        owner = np.searchsorted(self.starts, offsets, side='right') - 1
+        frames = self._map(lambda i: self.partitions[i].read_rows(offsets[owner == i] - self.starts[i], columns),
+                           np.unique(owner))
+        # The frames hold the rows partition by partition; put them back in the caller's order
+        order = np.argsort(owner, kind='stable')
+        frame = pd.concat(frames)
+        frame.index = offsets[order]
+        return frame.iloc[np.argsort(order, kind='stable')]
+
+    def read(self, columns: Optional[Sequence[str]] = None,
+             filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+        def read_partition(i: int) -> pd.DataFrame:
+            frame = self.partitions[i].read(columns, filters)
+            frame.index = frame.index + self.starts[i]
+            return frame
+        return pd.concat(self._map(read_partition, range(len(self.partitions))))
+
+
+def open_dataset(path: str) -> ColumnarDataset:
+    """Opens the columnar dataset at path for reading (a PartitionedDataset if it is partitioned)."""
+    return PartitionedDataset(path) if is_partitioned(path) else ColumnarDataset(path)
@@ -4,48 +4,57 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import numpy as np
 import os # Import os to check for file existence
 
+from typing import Optional
 
+from dashboard_data import SharedData, open_csv, open_release, summarize, trait_user_index
+from releases import DEFAULT_DATA_DIR, current_release
+from schema import PSYCH_TRAITS, format_user_id, format_notification_time
+from user_index import DEFAULT_PAGE_SIZE, UserIndex, prefix_ranges
+
+
+DATA_DIR = DEFAULT_DATA_DIR
 DATA_PATH = 'data/shadowpersona_processed_data.csv'
 
 
 st.set_page_config(layout="wide", page_title="ShadowPersona Dashboard")
 
 # --- Data Loading ---
-@st.cache_data 
-def load_processed_data():
+@st.cache_resource(max_entries=2)
+def load_shared_data(release: Optional[str], csv_mtime: float) -> Optional[SharedData]:
     """
-    Loads the processed user engagement data from the specified CSV path.
-    Assumes the data has been generated and processed by the Prefect pipeline.
+    Opens the release published by the Prefect pipeline, falling back to the CSV
+    export for data produced before releases existed. Cached as a resource, so
+    every session gets this same object rather than a deserialized copy; the
+    arguments key the cache, so publishing a new release (or rewriting the CSV)
+    swaps every session over on its next rerun. Returns None when there is no data.
     """
-    if not os.path.exists(DATA_PATH):
-        st.error(f"Data file not found at {DATA_PATH}. Please run `python data_pipeline.py` first to generate it.")
-        return pd.DataFrame()
-    
     try:
-        df = pd.read_csv(DATA_PATH)
-        
-        df['session_time'] = df['session_time'].astype(int)
-        df['rage_clicks'] = df['rage_clicks'].astype(int)
-        df['doomscroll_length'] = df['doomscroll_length'].astype(float)
-        df['feed_bias_score'] = df['feed_bias_score'].astype(float)
-        
-        # Handle NaN for notif_response_time (important if you have it in your data)
-        df['notif_response_time'] = df['notif_response_time'].replace([np.inf, -np.inf], np.nan)
-        
-        print(f"Data loaded successfully from {DATA_PATH} with {len(df)} records.")
-        return df
+        if release is not None:
+            shared = open_release(release)
+        elif csv_mtime:
+            shared = open_csv(DATA_PATH)
+        else:
+            st.error(f"No data found in {DATA_DIR}. Please run `python data_pipeline.py` first to generate it.")
+            return None
+        print(f"Data loaded successfully from {shared.source} with {shared.num_rows} records.")
+        return shared
     except Exception as e:
-        st.error(f"Error loading or processing data from {DATA_PATH}: {e}")
-        return pd.DataFrame()
+        st.error(f"Error loading or processing data from {release or DATA_PATH}: {e}")
+        return None
+
+@st.cache_resource(max_entries=16)
+def load_trait_user_index(_shared: SharedData, source: str, traits: tuple) -> UserIndex:
+    """Caches trait_user_index for every session; source and traits key the cache."""
+    return trait_user_index(_shared, traits)
 
-df = load_processed_data()
+shared = load_shared_data(current_release(DATA_DIR), os.path.getmtime(DATA_PATH) if os.path.exists(DATA_PATH) else 0.0)
 
 # --- Streamlit App Layout ---
 # The rest of your app logic now correctly follows the page config
-if not df.empty:
+if shared is not None:
+    cube = shared.cube
     st.title("ShadowPersona: Algorithmic Psychology Unveiled")
     st.markdown("""
     This dashboard simulates the outputs of **ShadowPersona**, a project designed to
@@ -56,98 +65,100 @@ if not df.empty:
     """)
 
     st.sidebar.header("Dashboard Controls")
-    
-    # Check if 'user_id' column exists before getting unique values
-    if 'user_id' in df.columns and not df['user_id'].empty:
-        selected_user = st.sidebar.selectbox("Select User ID (for detailed profile):", df['user_id'].unique())
+
+    # Traits come from the fixed schema dictionary; the rollup cube does the filtering
+    selected_trait_filter = st.sidebar.multiselect(
+        "Filter by Predicted Trait:",
+        options=PSYCH_TRAITS,
+        default=PSYCH_TRAITS
+    )
+    summary = summarize(cube, selected_trait_filter)
+
+    # Users are searched by id prefix through the index and listed one page at a time,
+    # so only a page of ids is ever sent to the browser
+    if set(selected_trait_filter) == set(PSYCH_TRAITS):
+        search_index = shared.user_index
     else:
-        selected_user = None
-        st.sidebar.warning("No user IDs found in data for selection.")
-
-    # Check if 'predicted_trait_label' exists
-    if 'predicted_trait_label' in df.columns and not df['predicted_trait_label'].empty:
-        selected_trait_filter = st.sidebar.multiselect(
-            "Filter by Predicted Trait:",
-            options=df['predicted_trait_label'].unique(),
-            default=df['predicted_trait_label'].unique()
-        )
-        filtered_df = df[df['predicted_trait_label'].isin(selected_trait_filter)]
+        search_index = load_trait_user_index(shared, shared.source, tuple(sorted(selected_trait_filter)))
+    user_query = st.sidebar.text_input("Search User ID (prefix, e.g. user_001):", value="")
+    user_ranges = prefix_ranges(user_query, search_index.max_id)
+    matches = search_index.count(user_ranges)
+    if matches:
+        num_pages = (matches + DEFAULT_PAGE_SIZE - 1) // DEFAULT_PAGE_SIZE
+        page = st.sidebar.number_input(f"Results page (of {num_pages}):", min_value=1, max_value=num_pages, value=1)
+        page_ids, _ = search_index.search(user_ranges, page=page - 1)
+        st.sidebar.caption(f"{matches} matching users")
+        selected_user = st.sidebar.selectbox("Select User ID (for detailed profile):", page_ids.tolist(),
+                                             format_func=format_user_id)
     else:
-        selected_trait_filter = []
-        filtered_df = df.copy()
-        st.sidebar.warning("No psychological trait labels found in data for filtering.")
+        selected_user = None
+        st.sidebar.warning("No user IDs match the search.")
 
 
     # --- Overall Engagement Metrics ---
     st.header("Overall Behavioral Metrics")
     col1, col2, col3, col4, col5 = st.columns(5) # Added one more column for new metric
+    overall, responders = summary.overall, summary.responders
     
     with col1:
-        st.metric("Avg Session Time (min)", f"{df['session_time'].mean():.1f}")
+        st.metric("Avg Session Time (min)", f"{overall['session_time_mean']:.1f}")
     with col2:
-        st.metric("Avg Doomscroll Length (min)", f"{df['doomscroll_length'].mean():.1f}")
+        st.metric("Avg Doomscroll Length (min)", f"{overall['doomscroll_length_mean']:.1f}")
     with col3:
-        st.metric("Avg Rage Clicks", f"{df['rage_clicks'].mean():.1f}")
+        st.metric("Avg Rage Clicks", f"{overall['rage_clicks_mean']:.1f}")
     with col4:
         # Use the newly engineered 'active_notif_responder'
-        st.metric("Notification Response Rate", f"{(df['active_notif_responder'].sum() / len(df) * 100):.1f}%")
+        st.metric("Notification Response Rate", f"{(responders.loc[1] / overall['count'] * 100):.1f}%")
     with col5:
         # New metric from engineered feature
-        st.metric("Avg Negative Engagement Score", f"{df['total_negative_engagement_score'].mean():.1f}")
+        st.metric("Avg Negative Engagement Score", f"{overall['total_negative_engagement_score_mean']:.1f}")
 
 
     # --- Distribution of Predicted Traits ---
-    if 'predicted_trait_label' in filtered_df.columns and not filtered_df['predicted_trait_label'].empty:
+    if summary.filtered_count > 0:
         st.header("Distribution of Simulated Psychological Traits")
-        trait_counts = filtered_df['predicted_trait_label'].value_counts().reset_index()
-        trait_counts.columns = ['Trait', 'Count']
-        fig_traits = px.bar(trait_counts, x='Trait', y='Count', color='Trait',
+        fig_traits = px.bar(summary.trait_counts, x='Trait', y='Count', color='Trait',
                             title='Simulated Psychological Trait Distribution',
                             labels={'Trait': 'Predicted Trait', 'Count': 'Number of Users'})
         st.plotly_chart(fig_traits, use_container_width=True)
     else:
-        st.info("Trait distribution cannot be displayed as 'predicted_trait_label' column is missing or empty in filtered data.")
+        st.info("Trait distribution cannot be displayed as no users match the selected traits.")
 
 
     # --- Engagement Heatmap (Simulated) ---
     st.header("Engagement Heatmap (Simulated)")
     st.markdown("This heatmap visualizes how different traits might correlate with key engagement patterns.")
     
-    # Ensure columns exist before using them for heatmap
-    if all(col in filtered_df.columns for col in ['predicted_trait_label', 'session_time', 'doomscroll_length', 'rage_clicks', 'total_negative_engagement_score']):
-        heatmap_data = filtered_df.groupby('predicted_trait_label')[['session_time', 'doomscroll_length', 'rage_clicks', 'total_negative_engagement_score']].mean().reset_index()
-        fig_heatmap = px.imshow(heatmap_data.set_index('predicted_trait_label'),
+    if summary.filtered_count > 0:
+        fig_heatmap = px.imshow(summary.heatmap,
                                 text_auto=True, color_continuous_scale='Viridis',
                                 title='Average Engagement Metrics by Simulated Trait')
         st.plotly_chart(fig_heatmap, use_container_width=True)
     else:
-        st.info("Engagement heatmap cannot be displayed due to missing key columns.")
+        st.info("Engagement heatmap cannot be displayed as no users match the selected traits.")
 
 
     # --- Ad Emotion Clusters (Simulated) ---
-    if all(col in filtered_df.columns for col in ['ad_click_emotion', 'ad_category_clicked']):
+    if summary.filtered_count > 0:
         st.header("Ad Emotion & Category Distribution")
         col_ad1, col_ad2 = st.columns(2)
         with col_ad1:
-            ad_emotion_counts = filtered_df['ad_click_emotion'].value_counts().reset_index()
-            ad_emotion_counts.columns = ['Emotion', 'Count']
-            fig_ad_emotion = px.pie(ad_emotion_counts, values='Count', names='Emotion',
+            fig_ad_emotion = px.pie(summary.emotion_counts, values='Count', names='Emotion',
                                     title='Distribution of Ad Click Emotions')
             st.plotly_chart(fig_ad_emotion, use_container_width=True)
         with col_ad2:
-            ad_category_counts = filtered_df['ad_category_clicked'].value_counts().reset_index()
-            ad_category_counts.columns = ['Category', 'Count']
-            fig_ad_category = px.bar(ad_category_counts, x='Category', y='Count', color='Category',
+            fig_ad_category = px.bar(summary.category_counts, x='Category', y='Count', color='Category',
                                     title='Distribution of Ad Categories Clicked')
             st.plotly_chart(fig_ad_category, use_container_width=True)
     else:
-        st.info("Ad emotion and category distributions cannot be displayed due to missing columns.")
+        st.info("Ad emotion and category distributions cannot be displayed as no users match the selected traits.")
 
 
     # --- Individual User Profile (Simulated 'Report') ---
-    if selected_user:
-        st.header(f"Simulated Psychological Profile for User: `{selected_user}`")
-        user_data = df[df['user_id'] == selected_user].iloc[0]
+    if selected_user is not None:
+        selected_user_label = format_user_id(selected_user)
+        st.header(f"Simulated Psychological Profile for User: `{selected_user_label}`")
+        user_data = shared.rows([shared.user_index.lookup(selected_user)]).iloc[0]
 
         st.subheader("Behavioral Snapshot:")
         col_u1, col_u2, col_u3 = st.columns(3)
@@ -162,7 +173,7 @@ if not df.empty:
             st.write(f"**Ad Category Clicked:** `{user_data.get('ad_category_clicked', 'N/A').capitalize()}`")
         with col_u3:
             st.write(f"**Feed Bias Score:** `{user_data.get('feed_bias_score', 'N/A'):.2f}` ({user_data.get('feed_bias_category', 'N/A').capitalize()})") # New
-            st.write(f"**Notification Time:** `{user_data.get('notification_time', 'N/A')}`")
+            st.write(f"**Notification Time:** `{format_notification_time(user_data['notification_time'])}`")
             if pd.isna(user_data.get('notif_response_time')):
                 st.write(f"**Notification Response:** `No Response`")
             else:
@@ -171,7 +182,7 @@ if not df.empty:
 
         st.subheader("Simulated Model Explainability (Concept):")
         st.markdown(f"""
-        **Why was `{selected_user}` profiled as `{user_data.get('predicted_trait_label', 'N/A').capitalize()}`?**
+        **Why was `{selected_user_label}` profiled as `{user_data.get('predicted_trait_label', 'N/A').capitalize()}`?**
 
         *(Note: This is a simulated explanation. In a real project, this would be generated by SHAP/LIME based on a trained ML model's features and their impact.)*
 
@@ -1,117 +1,404 @@
 # tasks.py
 
 import pandas as pd
-import numpy as np
-from faker import Faker
-import random
-from datetime import datetime
 import os
+import shutil
+from typing import Iterator, List, Optional, Sequence
 
 # Import Prefect for tasks
 from prefect import task
+from prefect.cache_policies import NO_CACHE
+
+import data_generator
+import identity
+import schema
+from cache import DEFAULT_CACHE_DIR, cached_rows, code_hash, entry_dir, make_cache_key, write_metadata
+from data_generator import DEFAULT_SHARD_SIZE, generate_sharded, iter_sharded
+import features as feature_registry
+from features import FEATURES, compute_features
+from identity import check_identity_columns, load_vocabulary
+from instrumentation import instrumented, record_metrics
+from releases import DEFAULT_DATA_DIR, DEFAULT_GRACE_S, DEFAULT_KEEP_RELEASES, publish_release
+from rollup import build_rollup_from_dataset
+from storage import ColumnarWriter, open_dataset, write_dataset, write_manifest
+from training import DEFAULT_MAX_ROWS, DEFAULT_TIME_BUDGET_S, InsufficientDataError, train_trait_model
+from user_index import build_user_index_file
 
 # --- Data Generation Task ---
 @task(name="Generate Synthetic Data")
-def generate_data(num_records: int = 5000) -> pd.DataFrame:
+@instrumented()
+def generate_data(num_records: int = 5000, seed: Optional[int] = None,
+                  shard_size: int = DEFAULT_SHARD_SIZE, max_workers: Optional[int] = None,
+                  start_id: int = 0, identity_columns: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Generates a synthetic dataset for user engagement and psychological profiling.
     Mimics the schema: shadowpersona_user_engagement.csv
+    Rows are produced in shards of shard_size by the vectorized batch engine, on a
+    process pool when there is more than one shard. Rows are seeded per fixed
+    block of user ids spawned from the master seed, so the output is reproducible
+    for a given seed regardless of shard_size and max_workers.
+    Args:
+        num_records (int): Number of rows to generate.
+        seed (int, optional): Master seed; None draws fresh entropy.
+        shard_size (int): Maximum rows per shard.
+        max_workers (int, optional): Worker processes; defaults to the CPU count.
+        start_id (int): First user id to generate; rows before it are skipped.
+        identity_columns (list[str], optional): Demographic and device columns to add
+            (see identity.py), drawn as codes into the identity vocabulary.
     Returns:
         pd.DataFrame: A DataFrame containing the simulated user engagement data.
     """
-    print(f"Generating {num_records} synthetic records...")
-    fake = Faker()
-    data = []
-
-    # Define possible ad click emotions and categories
-    ad_emotions = ['anger', 'curiosity', 'joy', 'sadness', 'surprise', 'neutral']
-    ad_categories = ['finance', 'travel', 'fashion', 'tech', 'food', 'gaming', 'news']
-
-    # Define possible psychological traits (for 'predicted_trait_label' - this would normally be an ML output)
-    psych_traits = ['anxious', 'impulsive', 'curious', 'skeptical', 'compliant', 'distracted']
-
-    for i in range(num_records):
-        user_id = f"user_{i:05d}"
-        session_time = np.random.randint(5, 120) # 5 to 120 minutes
-        rage_clicks = np.random.randint(0, 15) if np.random.rand() < 0.3 else 0 # 30% chance of rage clicks
-        doomscroll_length = np.random.uniform(0, 60) if np.random.rand() < 0.5 else 0 # 50% chance of doomscrolling
-        ad_click_emotion = random.choice(ad_emotions)
-        feed_bias_score = np.random.uniform(0, 1) # 0 to 1
-        
-        # Simulate notification time within a day
-        base_time = datetime(2023, 1, 1, np.random.randint(8, 23), np.random.randint(0, 59))
-        notification_time_str = base_time.strftime("%H:%M:%S")
-
-        notif_response_time = np.random.uniform(1, 60) if np.random.rand() < 0.7 else np.nan # 70% response, otherwise NaN
-        keyword_sentiment_score = np.random.uniform(-1, 1) # -1 (negative) to 1 (positive)
-        ad_category_clicked = random.choice(ad_categories)
-
-        # Simulate predicted_trait_label based on some simple rules for demonstration
-        # In a real scenario, this would come from your ML model.
-        # Here, we're just creating plausible "ground truth" for the simulated data.
-        if rage_clicks > 5 or doomscroll_length > 30:
-            predicted_trait_label = random.choice(['anxious', 'impulsive'])
-        elif keyword_sentiment_score < -0.5:
-            predicted_trait_label = 'skeptical'
-        elif ad_click_emotion == 'curiosity':
-            predicted_trait_label = 'curious'
-        else:
-            predicted_trait_label = random.choice(psych_traits) # pick from all if no specific rule matched
-
-        data.append({
-            'user_id': user_id,
-            'session_time': session_time,
-            'rage_clicks': rage_clicks,
-            'doomscroll_length': doomscroll_length,
-            'ad_click_emotion': ad_click_emotion,
-            'feed_bias_score': feed_bias_score,
-            'notification_time': notification_time_str,
-            'notif_response_time': notif_response_time,
-            'keyword_sentiment_score': keyword_sentiment_score,
-            'ad_category_clicked': ad_category_clicked,
-            'predicted_trait_label': predicted_trait_label
-        })
-
-    df = pd.DataFrame(data)
+    print(f"Generating {num_records - start_id} synthetic records...")
+    df = generate_sharded(num_records, seed=seed, shard_size=shard_size, max_workers=max_workers, start_id=start_id,
+                          identity_columns=identity_columns)
     print(f"Generated {len(df)} records.")
     return df
 
 # --- Feature Engineering Task ---
-@task(name="Perform Feature Engineering")
-def feature_engineer_data(df: pd.DataFrame) -> pd.DataFrame:
+def engineer_features(df: pd.DataFrame, features: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Adds the registered derived features (see features.py) to df in place.
+    Shared by the batch and streaming tasks.
+    Args:
+        df (pd.DataFrame): The input DataFrame (or one chunk of it).
+        features (list[str], optional): Features to compute; defaults to all registered ones.
+    Returns:
+        pd.DataFrame: The DataFrame with new features added.
+    """
+    return compute_features(df, features)
+
+@task(name="Perform Feature Engineering", cache_policy=NO_CACHE)
+@instrumented()
+def feature_engineer_data(df: pd.DataFrame, features: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Performs light feature engineering on the input DataFrame.
-    Calculates derived features such as total_negative_engagement_score,
-    active_notif_responder, and feed_bias_category.
+    Calculates the derived features declared in the feature registry, such as
+    total_negative_engagement_score, active_notif_responder, and feed_bias_category.
     Args:
         df (pd.DataFrame): The input DataFrame.
+        features (list[str], optional): Features to compute; defaults to all registered ones.
     Returns:
         pd.DataFrame: The DataFrame with new features added.
     """
     print("Performing feature engineering...")
-    df['total_negative_engagement_score'] = df['rage_clicks'] * 0.5 + df['doomscroll_length'] * 0.7
-    df['active_notif_responder'] = (~df['notif_response_time'].isna()).astype(int)
-    
-    # Ensure feed_bias_score is numeric before cutting
-    df['feed_bias_score'] = pd.to_numeric(df['feed_bias_score'], errors='coerce')
-    df['feed_bias_category'] = pd.cut(df['feed_bias_score'], bins=[0, 0.3, 0.7, 1.0],
-                                      labels=['left_leaning', 'neutral', 'right_leaning'], include_lowest=True, right=True)
-    
+    df = engineer_features(df, features)
     print("Feature engineering complete.")
-    print("New features added:", ['total_negative_engagement_score', 'active_notif_responder', 'feed_bias_category'])
+    print("New features added:", features if features is not None else list(FEATURES))
     return df
 
 # --- Data Saving Task ---
-@task(name="Save Processed Data")
-def save_data(df: pd.DataFrame, output_path: str):
+@task(name="Save Processed Data", cache_policy=NO_CACHE)
+@instrumented()
+def save_data(df: pd.DataFrame, dataset_path: str, csv_path: Optional[str] = None) -> int:
     """
-    Saves the DataFrame to a specified CSV path.
+    Saves the DataFrame as a columnar dataset, optionally exporting a CSV copy.
     Args:
         df (pd.DataFrame): The DataFrame to save.
-        output_path (str): The full path including filename to save the CSV.
+        dataset_path (str): Directory of the columnar dataset.
+        csv_path (str, optional): The full path including filename to also export a CSV to.
+    Returns:
+        int: The number of rows written.
+    """
+    print(f"Saving data to {dataset_path}...")
+    bytes_written = write_dataset(df, dataset_path)
+    record_metrics(bytes_written=bytes_written)
+    print(f"Data saved successfully to {dataset_path} ({bytes_written} bytes).")
+    if csv_path:
+        # Ensure the directory exists
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        df.to_csv(csv_path, index=False)
+        print(f"CSV exported to {csv_path}.")
+    return len(df)
+
+# --- Partition Manifest Task ---
+@task(name="Write Partition Manifest")
+@instrumented()
+def write_partition_manifest(dataset_path: str, partition_paths: Sequence[str],
+                             csv_parts: Optional[Sequence[str]] = None, csv_path: Optional[str] = None) -> int:
+    """
+    Publishes saved partitions as one partitioned dataset by writing its
+    manifest, and joins the partitions' CSV exports (if any) into csv_path.
+    Args:
+        dataset_path (str): Directory of the partitioned dataset.
+        partition_paths (list[str]): The partition datasets, in user id order.
+        csv_parts (list[str], optional): Per-partition CSV files, in the same order; removed once joined.
+        csv_path (str, optional): The CSV file to join them into.
+    Returns:
+        int: The number of rows in the dataset.
+    """
+    manifest = write_manifest(dataset_path, partition_paths)
+    print(f"Manifest of {len(partition_paths)} partitions ({manifest['num_rows']} rows) written to {dataset_path}.")
+    if csv_parts and csv_path:
+        with open(csv_path, 'wb') as out:
+            for i, part in enumerate(csv_parts):
+                with open(part, 'rb') as f:
+                    if i:
+                        f.readline()  # every part starts with the header
+                    shutil.copyfileobj(f, out)
+                os.remove(part)
+        print(f"CSV exported to {csv_path}.")
+    return manifest['num_rows']
+
+# --- Rollup Task ---
+@task(name="Build Rollup Cube")
+@instrumented()
+def build_rollup(dataset_path: str, rollup_path: str) -> int:
+    """
+    Pre-aggregates the stored processed data into the compact rollup cube the
+    dashboard reads (counts, sums and sums of squares per trait x ad emotion x
+    ad category x feed-bias bucket x responder flag).
+    Args:
+        dataset_path (str): Directory of the processed columnar dataset.
+        rollup_path (str): The .npz file to write the cube to.
+    Returns:
+        int: The number of rows aggregated.
+    """
+    print(f"Building rollup cube from {dataset_path}...")
+    cube = build_rollup_from_dataset(dataset_path)
+    os.makedirs(os.path.dirname(rollup_path), exist_ok=True)
+    cube.save(rollup_path)
+    record_metrics(rows_in=cube.total_count)
+    print(f"Rollup cube of {cube.counts.size} cells over {cube.total_count} rows saved to {rollup_path}.")
+    return cube.total_count
+
+# --- User Index Task ---
+@task(name="Build User Index")
+@instrumented()
+def build_user_index(dataset_path: str, index_path: str) -> int:
+    """
+    Builds the user id -> row offset index the dashboard uses to load a single
+    user's profile without reading the whole dataset.
+    Args:
+        dataset_path (str): Directory of the processed columnar dataset.
+        index_path (str): The .npz file to write the index to.
+    Returns:
+        int: The number of users indexed.
+    """
+    print(f"Building user index for {dataset_path}...")
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    index = build_user_index_file(dataset_path, index_path)
+    record_metrics(rows_in=index.num_rows)
+    layout = "contiguous id range" if index.contiguous else "sorted id table"
+    print(f"User index over {index.num_rows} users ({layout}) saved to {index_path}.")
+    return index.num_rows
+
+# --- Model Training Task ---
+@task(name="Train Trait Model")
+@instrumented()
+def train_model(dataset_path: str, model_path: str, time_budget_s: float = DEFAULT_TIME_BUDGET_S,
+                max_rows: int = DEFAULT_MAX_ROWS, n_jobs: int = -1, seed: int = 0) -> Optional[float]:
+    """
+    Picks the best predicted_trait_label classifier by a time-budgeted
+    successive-halving search (see training.py) and saves it for scoring.
+    Training is skipped, and no model saved, when the dataset is too small to
+    cross-validate.
+    Args:
+        dataset_path (str): Directory of the processed columnar dataset.
+        model_path (str): The .joblib file to write the model to.
+        time_budget_s (float): Time the model search may take.
+        max_rows (int): Rows sampled from the dataset for training.
+        n_jobs (int): Parallel fits; -1 uses every core.
+        seed (int): Seed of the row sample and the folds.
+    Returns:
+        float: The cross-validated accuracy of the saved model (None if skipped).
+    """
+    print(f"Training trait model on {dataset_path} (budget {time_budget_s:.0f}s)...")
+    try:
+        model = train_trait_model(dataset_path, time_budget_s=time_budget_s, max_rows=max_rows, n_jobs=n_jobs, seed=seed)
+    except InsufficientDataError as e:
+        print(f"Skipping trait model training: {e}")
+        return None
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    model.save(model_path)
+    record_metrics(rows_in=model.trained_rows, model=model.name, cv_accuracy=model.cv_accuracy)
+    print(f"Trait model '{model.name}' (CV accuracy {model.cv_accuracy:.4f}, {model.trained_rows} rows) saved to {model_path}.")
+    return model.cv_accuracy
+
+# --- Release Task ---
+@task(name="Publish Data Release")
+@instrumented()
+def publish_data_release(release_path: str, data_dir: str = DEFAULT_DATA_DIR,
+                         keep: int = DEFAULT_KEEP_RELEASES, grace_s: float = DEFAULT_GRACE_S) -> str:
+    """
+    Atomically switches the dashboard over to a fully written release (dataset,
+    rollup cube, user index and trait model) and prunes old releases.
+    Args:
+        release_path (str): The release directory written by this run.
+        data_dir (str): Directory holding the releases and the CURRENT pointer.
+        keep (int): Number of most recent releases to keep.
+        grace_s (float): How long an older release is kept after it was superseded.
+    Returns:
+        str: The published release path.
+    """
+    removed = publish_release(release_path, data_dir=data_dir, keep=keep, grace_s=grace_s)
+    print(f"Published release {release_path}" + (f"; removed {len(removed)} old release(s)." if removed else "."))
+    return release_path
+
+# --- Streaming Tasks ---
+# These tasks hand lazy chunk iterators to each other instead of whole frames.
+# Nothing is generated until save_data_chunks pulls from the chain, so peak
+# memory stays at roughly one chunk however many records are produced.
+class ChunkStream:
+    """
+    Single-use wrapper around an iterator of DataFrame chunks.
+    Prefect drains bare generators returned from tasks while resolving their
+    results, so chunk iterators cross task boundaries wrapped in this instead.
+    A stream cannot be hashed, so the tasks that take one opt out of caching.
+    """
+    def __init__(self, chunks: Iterator[pd.DataFrame]):
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        return iter(self._chunks)
+
+@task(name="Generate Synthetic Data Chunks", cache_policy=NO_CACHE)
+@instrumented(stream=True)
+def generate_data_chunks(num_records: int = 5000, seed: Optional[int] = None,
+                         chunk_size: int = DEFAULT_SHARD_SIZE, max_workers: Optional[int] = None,
+                         start_id: int = 0, identity_columns: Optional[List[str]] = None) -> ChunkStream:
+    """
+    Lazily generates the synthetic dataset as chunks of chunk_size rows.
+    Chunks are generation shards, so the concatenated output equals
+    generate_data(num_records, seed, start_id=start_id, identity_columns=identity_columns).
+    Returns:
+        ChunkStream: The generated chunks in user id order.
+    """
+    print(f"Streaming {num_records - start_id} synthetic records in chunks of {chunk_size}...")
+    return ChunkStream(iter_sharded(num_records, seed=seed, shard_size=chunk_size, max_workers=max_workers,
+                                    start_id=start_id, identity_columns=identity_columns))
+
+@task(name="Perform Feature Engineering On Chunks", cache_policy=NO_CACHE)
+@instrumented(stream=True)
+def feature_engineer_chunks(chunks: ChunkStream) -> ChunkStream:
+    """
+    Lazily applies the feature engineering step to every chunk.
+    Returns:
+        ChunkStream: The engineered chunks.
+    """
+    return ChunkStream(engineer_features(chunk) for chunk in chunks)
+
+@task(name="Save Processed Data Chunks", cache_policy=NO_CACHE)
+@instrumented()
+def save_data_chunks(chunks: ChunkStream, dataset_path: str, csv_path: Optional[str] = None) -> int:
+    """
+    Drains the chunk stream, appending each chunk to the columnar dataset at
+    dataset_path and, if csv_path is given, to a CSV export.
+    Args:
+        chunks (ChunkStream): The chunks to save.
+        dataset_path (str): Directory of the columnar dataset.
+        csv_path (str, optional): The full path including filename to also export a CSV to.
+    Returns:
+        int: The number of rows written.
+    """
+    print(f"Streaming data to {dataset_path}...")
+    rows = 0
+    csv_file = None
+    if csv_path:
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        csv_file = open(csv_path, 'w', newline='')
+    try:
+        with ColumnarWriter(dataset_path, mode='w') as writer:
+            for i, chunk in enumerate(chunks):
+                writer.write(chunk)
+                if csv_file is not None:
+                    chunk.to_csv(csv_file, index=False, header=(i == 0))
+                rows += len(chunk)
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+    record_metrics(rows_in=rows, bytes_written=writer.bytes_written)
+    print(f"Data saved successfully to {dataset_path} ({rows} rows).")
+    return rows
+
+# --- Caching Tasks ---
+# Processed rows are a pure function of (seed, generation and feature code), and
+# generation is prefix-stable, so one cache entry per such key holds the processed
+# rows for every num_records, shard size and chunk size: a shorter run reads a
+# prefix of it and a longer run only generates the missing tail and appends it.
+def processed_data_cache_key(seed: int, identity_columns: Optional[List[str]] = None) -> str:
+    """
+    Returns the cache key of the processed dataset for a seed.
+    The key covers the source of the generator, the schema and the feature
+    registry, so editing any of them invalidates the cache. With identity
+    columns it also covers them and the identity vocabulary they draw from.
+    """
+    inputs = {'seed': seed}
+    identity_columns = check_identity_columns(identity_columns)
+    if identity_columns:
+        inputs.update(identity_columns=identity_columns, identity_vocabulary=load_vocabulary().digest)
+    return make_cache_key('processed_data', inputs,
+                          code_hash(data_generator, identity, schema, feature_registry, engineer_features))
+
+@task(name="Look Up Cached Data")
+@instrumented()
+def lookup_cached_data(cache_key: str, cache_dir: str = DEFAULT_CACHE_DIR) -> int:
+    """
+    Returns:
+        int: How many processed rows the cache already holds for cache_key.
+    """
+    rows = cached_rows(cache_key, cache_dir)
+    print(f"Cache entry {cache_key} holds {rows} rows.")
+    return rows
+
+@task(name="Load Cached Data", cache_policy=NO_CACHE)
+@instrumented()
+def load_cached_data(cache_key: str, num_records: int, cache_dir: str = DEFAULT_CACHE_DIR) -> pd.DataFrame:
+    """
+    Loads the first num_records processed rows from the cache.
+    Returns:
+        pd.DataFrame: The cached processed data.
+    """
+    print(f"Loading {num_records} processed records from cache entry {cache_key}...")
+    dataset = open_dataset(entry_dir(cache_key, cache_dir))
+    return dataset.read(filters=[('user_id', '<', num_records)]).reset_index(drop=True)
+
+@task(name="Update Data Cache", cache_policy=NO_CACHE)
+@instrumented()
+def update_cache(df: pd.DataFrame, cache_key: str, inputs: dict, append: bool = False,
+                 cache_dir: str = DEFAULT_CACHE_DIR):
+    """
+    Stores freshly processed rows in the cache, appending them to the entry
+    when they extend it or replacing it otherwise.
+    """
+    mode = 'a' if append else 'w'
+    with ColumnarWriter(entry_dir(cache_key, cache_dir), mode=mode) as writer:
+        writer.write(df)
+    record_metrics(bytes_written=writer.bytes_written)
+    write_metadata(cache_key, inputs, cache_dir)
+    print(f"{'Appended' if append else 'Stored'} {len(df)} rows in cache entry {cache_key}.")
+
+def _cache_chunks(chunks: ChunkStream, path: str, start_id: int):
+    # Replay the cached rows first, then pass new chunks through while appending them
+    if start_id:
+        for chunk in open_dataset(path).iter_row_groups(filters=[('user_id', '<', start_id)]):
+            yield chunk.reset_index(drop=True)
+    with ColumnarWriter(path, mode='a' if start_id else 'w') as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+
+@task(name="Cache Processed Data Chunks", cache_policy=NO_CACHE)
+@instrumented(stream=True)
+def cache_data_chunks(chunks: ChunkStream, cache_key: str, inputs: dict, start_id: int = 0,
+                      cache_dir: str = DEFAULT_CACHE_DIR) -> ChunkStream:
+    """
+    Lazily prepends the first start_id cached rows to a stream of newly
+    processed chunks and appends those chunks to the cache as they pass.
+    Returns:
+        ChunkStream: Cached rows followed by the new chunks.
+    """
+    write_metadata(cache_key, inputs, cache_dir)
+    return ChunkStream(_cache_chunks(chunks, entry_dir(cache_key, cache_dir), start_id))
+
+@task(name="Load Cached Data Chunks", cache_policy=NO_CACHE)
+@instrumented(stream=True)
+def load_cached_data_chunks(cache_key: str, num_records: int, cache_dir: str = DEFAULT_CACHE_DIR) -> ChunkStream:
+    """
+    Lazily streams the first num_records processed rows from the cache, one row group at a time.
+    Returns:
+        ChunkStream: The cached chunks.
     """
-    print(f"Saving data to {output_path}...")
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False)
-    print(f"Data saved successfully to {output_path}.")
\ No newline at end of file
+    print(f"Streaming {num_records} processed records from cache entry {cache_key}...")
+    dataset = open_dataset(entry_dir(cache_key, cache_dir))
+    return ChunkStream(chunk.reset_index(drop=True)
+                       for chunk in dataset.iter_row_groups(filters=[('user_id', '<', num_records)]))
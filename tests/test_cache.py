@@ -0,0 +1,45 @@
+# tests/test_cache.py
+
+import importlib
+import sys
+
+import pandas as pd
+
+import tasks
+from cache import cached_rows, code_hash
+from data_generator import generate_sharded
+from tasks import engineer_features, load_cached_data, processed_data_cache_key, update_cache
+
+
+def test_cache_key_changes_with_inputs_and_code(tmp_path, monkeypatch):
+    key = processed_data_cache_key(seed=1)
+    assert processed_data_cache_key(seed=1) == key
+    assert processed_data_cache_key(seed=2) != key
+
+    def edited_engineer_features(df):
+        return df
+    monkeypatch.setattr(tasks, 'engineer_features', edited_engineer_features)
+    assert processed_data_cache_key(seed=1) != key
+
+    module_path = tmp_path / 'cached_module.py'
+    module_path.write_text("def f():\n    return 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module('cached_module')
+    before = code_hash(module)
+    module_path.write_text("def f():\n    return 2\n")
+    after = code_hash(importlib.reload(module))
+    sys.modules.pop('cached_module')
+    assert after != before
+
+
+def test_incremental_append_matches_a_cold_build(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    key = processed_data_cache_key(seed=5)
+    inputs = {'seed': 5}
+    update_cache.fn(engineer_features(generate_sharded(1200, seed=5, shard_size=500)), key, inputs, cache_dir=cache_dir)
+    tail = engineer_features(generate_sharded(3000, seed=5, shard_size=500, start_id=cached_rows(key, cache_dir)))
+    update_cache.fn(tail, key, inputs, append=True, cache_dir=cache_dir)
+
+    cold = engineer_features(generate_sharded(3000, seed=5))
+    pd.testing.assert_frame_equal(load_cached_data.fn(key, 3000, cache_dir=cache_dir), cold)
+    pd.testing.assert_frame_equal(load_cached_data.fn(key, 2000, cache_dir=cache_dir), cold.iloc[:2000])
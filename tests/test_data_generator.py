@@ -0,0 +1,38 @@
+# tests/test_data_generator.py
+
+import pandas as pd
+
+import data_generator
+from data_generator import DEFAULT_SHARD_SIZE, generate_sharded, iter_sharded, plan_shards
+
+
+def test_output_does_not_depend_on_shard_size_or_worker_count():
+    expected = generate_sharded(25_000, seed=7, max_workers=1)
+    for shard_size in (1000, 7000, DEFAULT_SHARD_SIZE):
+        for max_workers in (1, 2):
+            pd.testing.assert_frame_equal(generate_sharded(25_000, seed=7, shard_size=shard_size,
+                                                           max_workers=max_workers), expected)
+    assert expected['user_id'].tolist() == list(range(25_000))
+    assert not expected.equals(generate_sharded(25_000, seed=8, max_workers=1))
+
+
+def test_shards_splitting_seed_blocks_reproduce_the_single_shard_output(monkeypatch):
+    expected_default_blocks = generate_sharded(5000, seed=7, max_workers=1)
+    # Small blocks put several block boundaries inside the run. Workers would not
+    # see the patched module, so everything runs in process (max_workers=1).
+    monkeypatch.setattr(data_generator, 'SEED_BLOCK_SIZE', 1000)
+    expected = generate_sharded(5000, seed=7, shard_size=5000, max_workers=1)
+    assert not expected.equals(expected_default_blocks)
+    for shard_size in (300, 700, 1500, 2500):
+        pd.testing.assert_frame_equal(generate_sharded(5000, seed=7, shard_size=shard_size, max_workers=1), expected)
+        chunks = list(iter_sharded(5000, seed=7, shard_size=shard_size, max_workers=1))
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
+    # Extending a run from part-way through a block gives the rows it would have had
+    tail = generate_sharded(5000, seed=7, shard_size=700, max_workers=1, start_id=2345)
+    pd.testing.assert_frame_equal(tail, expected.iloc[2345:].reset_index(drop=True))
+
+
+def test_plan_shards_covers_contiguous_user_ids():
+    shards = plan_shards(25_000, seed=7, shard_size=7000)
+    assert [(shard.start_id, shard.num_records) for shard in shards] == [(0, 7000), (7000, 7000), (14000, 7000),
+                                                                        (21000, 4000)]
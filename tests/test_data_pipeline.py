@@ -0,0 +1,70 @@
+# tests/test_data_pipeline.py
+
+import os
+
+import pandas as pd
+import pytest
+from prefect.testing.utilities import prefect_test_harness
+
+from cache import cached_rows
+from data_generator import DEFAULT_SEED
+from data_pipeline import shadowpersona_data_pipeline
+from releases import current_release, list_releases
+from storage import open_dataset
+from tasks import processed_data_cache_key
+
+NUM_RECORDS = 3000
+SEED = 11
+
+
+def _build(tmp_path, name: str, **options) -> pd.DataFrame:
+    data_dir = str(tmp_path / name)
+    options.setdefault('cache_dir', str(tmp_path / f'{name}_cache'))
+    shadowpersona_data_pipeline(num_records=NUM_RECORDS, seed=SEED, export_csv=False, data_dir=data_dir, **options)
+    dataset = open_dataset(os.path.join(current_release(data_dir), 'shadowpersona_processed_data.cols'))
+    return dataset.read().reset_index(drop=True)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def prefect_server():
+    with prefect_test_harness():
+        yield
+
+
+@pytest.fixture(scope='module')
+def reference(prefect_server, tmp_path_factory):
+    return _build(tmp_path_factory.mktemp('pipeline'), 'reference', shard_size=1000, max_workers=1)
+
+
+@pytest.mark.parametrize('options', [
+    {'shard_size': 700, 'max_workers': 2},
+    {'chunk_size': 700},
+    {'partitions': 3, 'task_runner': 'thread', 'max_workers': 2},
+    {'partitions': 2, 'task_runner': 'process', 'max_workers': 2},
+], ids=['batch', 'streaming', 'partitioned-thread', 'partitioned-process'])
+def test_processed_data_does_not_depend_on_the_execution_mode(tmp_path, reference, options):
+    pd.testing.assert_frame_equal(_build(tmp_path, 'run', **options), reference)
+
+
+def test_cache_hit_reproduces_the_processed_data(tmp_path, reference):
+    cache_dir = str(tmp_path / 'cache')
+    _build(tmp_path, 'cold', cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(_build(tmp_path, 'warm', cache_dir=cache_dir, shard_size=1000), reference)
+
+
+def test_runs_without_a_seed_reuse_the_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    data_dir = str(tmp_path / 'data')
+    for _ in range(2):
+        shadowpersona_data_pipeline(num_records=NUM_RECORDS, export_csv=False, data_dir=data_dir, cache_dir=cache_dir)
+    assert cached_rows(processed_data_cache_key(seed=DEFAULT_SEED), cache_dir) == NUM_RECORDS
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_failed_run_leaves_no_release_behind(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    with pytest.raises(ValueError):
+        shadowpersona_data_pipeline(num_records=NUM_RECORDS, seed=SEED, export_csv=False, data_dir=data_dir,
+                                    cache_dir=str(tmp_path / 'cache'), identity_columns=['not_a_column'])
+    assert list_releases(data_dir) == []
+    assert current_release(data_dir) is None
@@ -0,0 +1,67 @@
+# tests/test_event_stream.py
+
+import asyncio
+import os
+
+import numpy as np
+
+from event_stream import UserFeatureState, ingest, simulate_events, tail_jsonl
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def test_resume_after_failure_matches_one_run(tmp_path):
+    events_path, checkpoint = str(tmp_path / 'events.jsonl'), str(tmp_path / 'state.npz')
+    simulate_events(events_path, num_users=50, num_events=5000, seed=1)
+    with open(events_path) as f:
+        lines = f.read().splitlines()
+    lines[100:100] = ['{not json', '{"type": "scroll", "user_id": -1, "ts": 1, "minutes": 2}']
+    with open(events_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    async def failing_source():
+        # Fails half-way, after some checkpoints
+        async for events, offset in tail_jsonl(events_path, follow=False, batch_size=500):
+            if offset > os.path.getsize(events_path) // 2:
+                raise _Interrupted()
+            yield events, offset
+
+    try:
+        asyncio.run(ingest(failing_source(), UserFeatureState(), checkpoint, checkpoint_interval_s=0))
+    except _Interrupted:
+        pass
+    resumed, offset = UserFeatureState.load(checkpoint)
+    assert 0 < offset
+    asyncio.run(ingest(tail_jsonl(events_path, offset=offset, follow=False, batch_size=500), resumed, checkpoint))
+    once = asyncio.run(ingest(tail_jsonl(events_path, follow=False, batch_size=500), UserFeatureState()))
+
+    assert UserFeatureState.load(checkpoint)[0].snapshot().equals(once.snapshot())
+    assert once.events == 5000 and once.rejected == 2
+
+
+def test_snapshot_derives_registered_features():
+    state = UserFeatureState()
+    state.apply([{'user_id': 'user_00001', 'ts': 10.0, 'type': 'rage_click'},
+                 {'user_id': 'user_00001', 'ts': 11.0, 'type': 'scroll', 'minutes': 3.3},
+                 {'user_id': 'user_00002', 'ts': 12.0, 'type': 'notification_response', 'seconds': 4.0}])
+    snapshot = state.snapshot()
+    expected = (snapshot['rage_clicks'] * 0.5 + snapshot['doomscroll_length'] * 0.7).astype(np.float32)
+    np.testing.assert_array_equal(snapshot['total_negative_engagement_score'], expected)
+    assert snapshot['active_notif_responder'].tolist() == [0, 1]
+
+
+def test_state_grows_with_users_not_ids(tmp_path):
+    state = UserFeatureState()
+    state.apply([{'user_id': 4_000_000_000, 'ts': 10.0, 'type': 'rage_click'},
+                 {'user_id': 'user_00007', 'ts': 11.0, 'type': 'rage_click'},
+                 {'user_id': 2 ** 32, 'ts': 12.0, 'type': 'rage_click'}])
+    assert state.capacity <= 1024 and state.rejected == 1
+    state.save(str(tmp_path / 'state.npz'))
+    loaded, _ = UserFeatureState.load(str(tmp_path / 'state.npz'))
+    assert loaded.capacity == 2
+    loaded.apply([{'user_id': 7, 'ts': 13.0, 'type': 'rage_click'}])
+    snapshot = loaded.snapshot()
+    assert snapshot['user_id'].tolist() == [7, 4_000_000_000]
+    assert snapshot['rage_clicks'].tolist() == [2, 1]
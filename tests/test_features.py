@@ -0,0 +1,28 @@
+# tests/test_features.py
+
+import numpy as np
+import pandas as pd
+
+import features
+from features import compute_feature_arrays
+
+
+def test_kernels_match_the_column_expressions_across_blocks(monkeypatch):
+    # A small block size puts several block boundaries inside the columns
+    monkeypatch.setattr(features, 'BLOCK_ROWS', 7)
+    rng = np.random.default_rng(0)
+    n = 50
+    columns = {
+        'rage_clicks': rng.integers(0, 256, n).astype(np.uint8),
+        'doomscroll_length': (rng.random(n) * 500).astype(np.float32),
+        'notif_response_time': np.where(rng.random(n) < 0.3, np.nan, rng.random(n)).astype(np.float32),
+        'feed_bias_score': np.concatenate([rng.random(n - 7), [0, 0.3, 0.7, 1, np.nan, -0.1, 1.2]]).astype(np.float32),
+    }
+    outputs = compute_feature_arrays(columns)
+
+    expected = (columns['rage_clicks'] * 0.5 + columns['doomscroll_length'] * 0.7).astype(np.float32)
+    np.testing.assert_array_equal(outputs['total_negative_engagement_score'], expected)
+    np.testing.assert_array_equal(outputs['active_notif_responder'], ~np.isnan(columns['notif_response_time']))
+    buckets = pd.cut(columns['feed_bias_score'], bins=[0, 0.3, 0.7, 1.0], include_lowest=True, right=True)
+    np.testing.assert_array_equal(outputs['feed_bias_category'], buckets.codes)
+    assert compute_feature_arrays({name: values[:0] for name, values in columns.items()})['feed_bias_category'].size == 0
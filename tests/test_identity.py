@@ -0,0 +1,33 @@
+# tests/test_identity.py
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import identity
+from identity import build_vocabulary, load_vocabulary
+
+
+def test_threads_loading_a_missing_vocabulary_build_it_once(tmp_path, monkeypatch):
+    path = str(tmp_path / 'vocabulary.json')
+    builds = []
+
+    def small_vocabulary():
+        builds.append(1)
+        return build_vocabulary(names_per_country=5, cities_per_country=3)
+    monkeypatch.setattr(identity, 'build_vocabulary', small_vocabulary)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        vocabularies = list(executor.map(load_vocabulary, [path] * 16))
+    assert len(builds) == 1
+    assert all(vocabulary is vocabularies[0] for vocabulary in vocabularies)
+
+
+def test_processes_loading_a_missing_vocabulary_all_succeed(tmp_path):
+    path = str(tmp_path / 'vocabulary.json')
+    # Fresh interpreters, as on the process task runner; each may build the file
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('spawn')) as executor:
+        vocabularies = list(executor.map(load_vocabulary, [path] * 8))
+    assert len({vocabulary.digest for vocabulary in vocabularies}) == 1
+    assert load_vocabulary(path).digest == vocabularies[0].digest
+    assert os.listdir(tmp_path) == ['vocabulary.json']
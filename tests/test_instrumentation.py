@@ -0,0 +1,76 @@
+# tests/test_instrumentation.py
+
+import json
+import os
+
+import cloudpickle
+import pytest
+
+import instrumentation
+import tasks
+from data_generator import generate_sharded
+from instrumentation import METRICS_ENV, PROFILE_DIR_ENV, PROFILE_ENV, PROFILER_ENV
+from storage import write_dataset
+
+
+@pytest.fixture(autouse=True)
+def instrumentation_off(monkeypatch):
+    for name in (METRICS_ENV, PROFILE_ENV, PROFILER_ENV, PROFILE_DIR_ENV):
+        monkeypatch.delenv(name, raising=False)
+
+
+def _records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_metrics_record_rows_and_bytes(tmp_path, monkeypatch):
+    metrics_path = str(tmp_path / 'metrics.jsonl')
+    monkeypatch.setenv(METRICS_ENV, metrics_path)
+    df = generate_sharded(500, seed=1, max_workers=1)
+    tasks.feature_engineer_data.fn(df)
+    tasks.save_data.fn(df=df, dataset_path=str(tmp_path / 'data.cols'))
+
+    engineered, saved = _records(metrics_path)
+    assert engineered['task'] == 'feature_engineer_data' and engineered['status'] == 'completed'
+    assert engineered['rows_in'] == engineered['rows_out'] == 500
+    assert engineered['wall_s'] >= engineered['self_s'] >= 0 and engineered['rows_per_s'] > 0
+    assert saved['task'] == 'save_data' and saved['rows_in'] == 500
+    assert saved['bytes_written'] == write_dataset(df, str(tmp_path / 'copy.cols'))
+    # Calls ran one at a time in this process, so the per-process counters are attributed
+    assert saved['cpu_s'] is not None and saved['peak_rss_delta_bytes'] is not None
+
+
+def test_disabled_instrumentation_does_no_work(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("instrumentation ran while switched off")
+    for name in ('_emit', '_enter_call', '_now', '_run_ids', '_call_profiled', 'reset_peak_rss'):
+        monkeypatch.setattr(instrumentation, name, fail)
+    monkeypatch.chdir(tmp_path)
+    df = generate_sharded(200, seed=1, max_workers=1)
+    assert tasks.feature_engineer_data.fn(df) is df
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('profiler, extension', [('cprofile', '.prof'), ('sampling', '.folded')])
+def test_profiler_switch_writes_a_profile(tmp_path, monkeypatch, profiler, extension):
+    profile_dir = tmp_path / 'profiles'
+    monkeypatch.setenv(PROFILE_ENV, 'feature_engineer_data')
+    monkeypatch.setenv(PROFILER_ENV, profiler)
+    monkeypatch.setenv(PROFILE_DIR_ENV, str(profile_dir))
+    tasks.feature_engineer_data.fn(generate_sharded(200, seed=1, max_workers=1))
+    tasks.save_data.fn(df=generate_sharded(10, seed=1, max_workers=1), dataset_path=str(tmp_path / 'data.cols'))
+
+    profiles = os.listdir(profile_dir)
+    assert len(profiles) == 1
+    assert profiles[0].startswith('feature_engineer_data-') and profiles[0].endswith(extension)
+
+
+def test_instrumented_tasks_survive_pickling(tmp_path, monkeypatch):
+    # Process-based task runners ship tasks to their workers with cloudpickle
+    task = cloudpickle.loads(cloudpickle.dumps(tasks.feature_engineer_data))
+    metrics_path = str(tmp_path / 'metrics.jsonl')
+    monkeypatch.setenv(METRICS_ENV, metrics_path)
+    task.fn(generate_sharded(300, seed=1, max_workers=1))
+    [record] = _records(metrics_path)
+    assert record['task'] == 'feature_engineer_data' and record['rows_out'] == 300
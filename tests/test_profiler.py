@@ -0,0 +1,39 @@
+# tests/test_profiler.py
+
+import pandas as pd
+
+from data_generator import generate_sharded
+from profiler import profile_csv, profile_dataset
+from schema import IDENTITY_COLUMNS, read_csv
+from storage import write_dataset
+from tasks import engineer_features
+
+
+def test_profiles_identity_columns(tmp_path):
+    df = engineer_features(generate_sharded(5000, seed=4, shard_size=2000, identity_columns=IDENTITY_COLUMNS))
+    dataset_path, csv_path = str(tmp_path / 'data.cols'), str(tmp_path / 'data.csv')
+    write_dataset(df, dataset_path)
+    df.to_csv(csv_path, index=False)
+    pd.testing.assert_frame_equal(read_csv(csv_path), df)
+
+    from_dataset = profile_dataset(dataset_path, max_workers=1).to_dict()['columns']
+    from_csv = profile_csv(csv_path, chunk_size=2000, max_workers=1).to_dict()['columns']
+    signup = from_dataset['signup_date']
+    assert signup['count'] == 5000
+    assert signup['min'] == df['signup_date'].min().timestamp()
+    assert signup == from_csv['signup_date']
+    for column in ('name', 'country', 'city', 'age_band', 'device'):
+        assert from_dataset[column]['count'] == 5000
+        assert from_dataset[column]['top'] == from_csv[column]['top']
+
+
+def test_csv_workers_profile_their_own_byte_ranges(tmp_path):
+    df = engineer_features(generate_sharded(3000, seed=5))
+    csv_path = str(tmp_path / 'data.csv')
+    df.to_csv(csv_path, index=False)
+    whole = profile_csv(csv_path, chunk_size=10_000, max_workers=1).to_dict()['columns']
+    split = profile_csv(csv_path, chunk_size=700, max_workers=2).to_dict()['columns']
+    assert set(whole) == set(split) and whole['user_id']['count'] == 3000
+    for name, summary in whole.items():
+        for key in ('count', 'min', 'max', 'top'):
+            assert summary.get(key) == split[name].get(key)
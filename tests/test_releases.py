@@ -0,0 +1,65 @@
+# tests/test_releases.py
+
+import os
+
+import pytest
+
+from releases import (PUBLISHED_FILENAME, create_release, current_release, discard_release, list_releases,
+                      publish_release, published_releases)
+
+
+def test_publish_switches_current_and_marks_the_release(tmp_path):
+    data_dir = str(tmp_path)
+    assert current_release(data_dir) is None
+    first = create_release(data_dir)
+    second = create_release(data_dir)
+    assert list_releases(data_dir) == [os.path.basename(first), os.path.basename(second)]
+    assert published_releases(data_dir) == []
+
+    publish_release(second, data_dir, grace_s=0)
+    publish_release(first, data_dir, grace_s=0)
+    assert current_release(data_dir) == first
+    assert os.path.isfile(os.path.join(first, PUBLISHED_FILENAME))
+    # Publish order, not creation order
+    assert published_releases(data_dir) == [os.path.basename(second), os.path.basename(first)]
+
+
+def test_prune_keeps_recent_and_unpublished_releases(tmp_path):
+    data_dir = str(tmp_path)
+    published = []
+    for _ in range(4):
+        published.append(create_release(data_dir))
+        publish_release(published[-1], data_dir, keep=2, grace_s=0)
+    unpublished = create_release(data_dir)
+    removed = publish_release(published[-1], data_dir, keep=2, grace_s=0)
+
+    assert removed == []
+    assert published_releases(data_dir) == [os.path.basename(path) for path in published[2:]]
+    assert os.path.isdir(unpublished)
+    assert current_release(data_dir) == published[-1]
+
+
+def test_prune_waits_for_the_grace_period(tmp_path):
+    data_dir = str(tmp_path)
+    paths = [create_release(data_dir) for _ in range(3)]
+    for path in paths:
+        publish_release(path, data_dir, keep=1, grace_s=3600)
+    # The older releases were superseded just now, so sessions may still be reading them
+    assert published_releases(data_dir) == [os.path.basename(path) for path in paths]
+    removed = publish_release(paths[-1], data_dir, keep=1, grace_s=0)
+    assert removed == [os.path.basename(path) for path in paths[:2]]
+
+
+def test_discard_removes_only_unpublished_releases(tmp_path):
+    data_dir = str(tmp_path)
+    published = create_release(data_dir)
+    publish_release(published, data_dir, grace_s=0)
+    abandoned = create_release(data_dir)
+    with open(os.path.join(abandoned, 'partial.bin'), 'wb') as f:
+        f.write(b'\0' * 64)
+
+    discard_release(abandoned)
+    assert list_releases(data_dir) == [os.path.basename(published)]
+    with pytest.raises(ValueError):
+        discard_release(published)
+    assert current_release(data_dir) == published
@@ -0,0 +1,75 @@
+# tests/test_rollup.py
+
+import numpy as np
+import pandas as pd
+
+from data_generator import generate_sharded
+from rollup import DIMENSIONS, MEASURES, MISSING, RollupCube, build_rollup_from_dataset
+from storage import write_dataset
+from tasks import engineer_features
+
+SELECTED_TRAITS = ['anxious', 'curious']
+
+
+def _processed(num_records=2000):
+    df = generate_sharded(num_records, seed=3, shard_size=700)
+    # Out-of-range scores leave feed_bias_category missing (code -1)
+    out_of_range = np.flatnonzero(df['predicted_trait_label'].isin(SELECTED_TRAITS).to_numpy())[:25]
+    df.iloc[out_of_range, df.columns.get_loc('feed_bias_score')] = 1.5
+    return engineer_features(df)
+
+
+def _expected(df, by):
+    # The cube's aggregates computed with a pandas groupby, missing values as MISSING
+    frame = df.copy()
+    for name in by:
+        if isinstance(frame[name].dtype, pd.CategoricalDtype):
+            frame[name] = frame[name].cat.add_categories([MISSING]).fillna(MISSING)
+    grouped = frame.groupby(by, observed=True)
+    expected = grouped[MEASURES].agg(['mean', 'std'])
+    expected.columns = [f'{name}_{stat}' for name, stat in expected.columns]
+    expected.insert(0, 'count', grouped.size())
+    expected.index = expected.index.astype(object)
+    return expected
+
+
+def test_aggregates_match_a_pandas_groupby():
+    df = _processed()
+    cube = RollupCube()
+    # Built in two chunks and merged, as the pipeline does per row group
+    cube.update({name: df[name].iloc[:900] for name in list(DIMENSIONS) + MEASURES})
+    cube.merge(RollupCube.from_frame(df.iloc[900:]))
+    assert cube.total_count == len(df)
+
+    pd.testing.assert_frame_equal(cube.aggregate(by=['predicted_trait_label']),
+                                  _expected(df, ['predicted_trait_label']),
+                                  check_dtype=False, check_index_type=False, rtol=1e-4)
+
+    selected = cube.select(predicted_trait_label=SELECTED_TRAITS).aggregate(by=['feed_bias_category'])
+    expected = _expected(df[df['predicted_trait_label'].isin(SELECTED_TRAITS)], ['feed_bias_category'])
+    pd.testing.assert_frame_equal(selected, expected, check_dtype=False, check_index_type=False, rtol=1e-4)
+    assert selected.loc[MISSING, 'count'] == 25
+
+    by = ['feed_bias_category', 'predicted_trait_label']
+    counts = cube.aggregate(by=by, measures=[])['count']
+    assert counts.to_dict() == _expected(df, by)['count'].to_dict()
+    overall = cube.aggregate(measures=['session_time'])
+    assert overall['count'].iloc[0] == len(df)
+    np.testing.assert_allclose(overall['session_time_mean'].iloc[0], df['session_time'].mean())
+
+
+def test_dataset_rollup_matches_the_frame_and_survives_save_and_load(tmp_path):
+    df = _processed()
+    path = str(tmp_path / 'data.cols')
+    write_dataset(df, path, row_group_size=300)
+    cube = build_rollup_from_dataset(path)
+    reference = RollupCube.from_frame(df)
+    np.testing.assert_array_equal(cube.counts, reference.counts)
+    np.testing.assert_allclose(cube.sums, reference.sums)
+    np.testing.assert_allclose(cube.sumsq, reference.sumsq)
+
+    cube.save(str(tmp_path / 'rollup.npz'))
+    loaded = RollupCube.load(str(tmp_path / 'rollup.npz'))
+    np.testing.assert_array_equal(loaded.counts, cube.counts)
+    np.testing.assert_array_equal(loaded.sums, cube.sums)
+    np.testing.assert_array_equal(loaded.sumsq, cube.sumsq)
@@ -0,0 +1,35 @@
+# tests/test_storage.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import AD_EMOTION_DTYPE
+from storage import ColumnarWriter, open_dataset, write_dataset
+
+
+def _frame(start, stop):
+    ids = np.arange(start, stop, dtype=np.uint32)
+    return pd.DataFrame({
+        'user_id': ids,
+        'score': (ids * 0.5).astype(np.float64),
+        'ad_click_emotion': pd.Categorical.from_codes(ids % 6, dtype=AD_EMOTION_DTYPE),
+    })
+
+
+def test_append_discards_uncommitted_column_bytes(tmp_path):
+    path = str(tmp_path / 'data.cols')
+    write_dataset(_frame(0, 100), path)
+    # An interrupted append: some column files got rows the footer never committed
+    with open(os.path.join(path, 'user_id.bin'), 'ab') as f:
+        np.arange(1000, 1007, dtype=np.uint32).tofile(f)
+    with open(os.path.join(path, 'orphan.bin'), 'wb') as f:
+        f.write(b'\0' * 16)
+
+    with ColumnarWriter(path, mode='a') as writer:
+        writer.write(_frame(100, 150))
+
+    df = open_dataset(path).read()
+    pd.testing.assert_frame_equal(df, _frame(0, 150))
+    assert not os.path.exists(os.path.join(path, 'orphan.bin'))
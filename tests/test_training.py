@@ -0,0 +1,34 @@
+# tests/test_training.py
+
+import os
+
+import pytest
+
+from data_generator import generate_sharded
+from storage import write_dataset
+from tasks import engineer_features, train_model
+from training import InsufficientDataError, TraitModel, train_trait_model
+
+
+def _dataset(tmp_path, num_records, seed=2):
+    path = str(tmp_path / 'data.cols')
+    write_dataset(engineer_features(generate_sharded(num_records, seed=seed)), path)
+    return path
+
+
+def test_tiny_dataset_clamps_folds_and_trains(tmp_path):
+    # 30 rows: fewer than 3 of the rarest trait, too few for early stopping in hgb
+    path = _dataset(tmp_path, 30)
+    model_path = str(tmp_path / 'model' / 'model.joblib')
+    accuracy = train_model.fn(path, model_path, time_budget_s=5, n_jobs=1)
+    assert accuracy is not None
+    assert TraitModel.load(model_path).trained_rows == 30
+
+
+def test_too_little_data_skips_training(tmp_path):
+    path = _dataset(tmp_path, 1)
+    with pytest.raises(InsufficientDataError):
+        train_trait_model(path, time_budget_s=5, n_jobs=1)
+    model_path = str(tmp_path / 'model' / 'model.joblib')
+    assert train_model.fn(path, model_path, time_budget_s=5, n_jobs=1) is None
+    assert not os.path.exists(model_path)
@@ -0,0 +1,47 @@
+# tests/test_user_index.py
+
+import numpy as np
+import pandas as pd
+
+from storage import open_dataset, write_dataset
+from user_index import UserIndex, prefix_ranges
+
+
+def _index(tmp_path, user_ids):
+    path = str(tmp_path / 'data.cols')
+    write_dataset(pd.DataFrame({'user_id': np.asarray(user_ids, dtype=np.uint32)}), path, row_group_size=4)
+    index = UserIndex.build(open_dataset(path))
+    index.save(str(tmp_path / 'index.npz'))
+    return UserIndex.load(str(tmp_path / 'index.npz'))
+
+
+def test_lookup_contiguous_ids(tmp_path):
+    index = _index(tmp_path, range(100, 110))
+    assert index.contiguous and index.max_id == 109
+    assert index.lookup(100) == 0 and index.lookup(109) == 9
+    assert index.lookup(99) is None and index.lookup(110) is None
+
+
+def test_lookup_and_search_scattered_ids(tmp_path):
+    user_ids = [42, 7, 123456, 12000, 120, 9, 12999]
+    index = _index(tmp_path, user_ids)
+    assert not index.contiguous and index.max_id == 123456
+    for offset, user_id in enumerate(user_ids):
+        assert index.lookup(user_id) == offset
+    assert index.lookup(8) is None
+
+    # '12' matches user_12000, user_12999 and user_123456, but not user_00120
+    ranges = prefix_ranges('12', index.max_id)
+    assert index.count(ranges) == 3
+    ids, total = index.search(ranges, page=0, page_size=2)
+    assert ids.tolist() == [12000, 12999] and total == 3
+    assert index.search(ranges, page=1, page_size=2)[0].tolist() == [123456]
+
+
+def test_prefix_ranges():
+    assert prefix_ranges('', 999) == [(0, 1000)]
+    assert prefix_ranges('user_', 999) == [(0, 1000)]
+    assert prefix_ranges('0004', 99_999) == [(40, 50)]
+    # Unpadded six-digit ids start with their first non-zero digit
+    assert prefix_ranges('12', 200_000) == [(12_000, 13_000), (120_000, 130_000)]
+    assert prefix_ranges('x1', 999) == []
@@ -0,0 +1,271 @@
+# training.py
+
+import math
+import time
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from pandas.api.types import CategoricalDtype
+from sklearn.base import clone
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression, RidgeClassifier
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import GaussianNB
+from sklearn.tree import DecisionTreeClassifier
+
+from schema import PROCESSED_DTYPES
+from storage import open_dataset
+
+# Learns predicted_trait_label from the engineered features. Replaces the PyCaret
+# compare_models sweep (19 models x 10 folds, each re-running the preprocessing)
+# with one preprocessed matrix, fold splits computed once, and successive
+# halving: every candidate is scored on a small slice of the training rows, and
+# only the best third moves on to three times as many rows, until a single
+# winner is left, the rows run out or the time budget would be exceeded.
+TARGET = 'predicted_trait_label'
+NUMERIC_FEATURES = ['session_time', 'rage_clicks', 'doomscroll_length', 'feed_bias_score', 'notification_time',
+                    'notif_response_time', 'keyword_sentiment_score', 'total_negative_engagement_score',
+                    'active_notif_responder']
+CATEGORICAL_FEATURES = ['ad_click_emotion', 'ad_category_clicked', 'feed_bias_category']
+MODEL_NAME = 'shadowpersona_trait_model.joblib'
+DEFAULT_TIME_BUDGET_S = 30.0
+DEFAULT_MAX_ROWS = 100_000
+DEFAULT_MIN_ROWS = 2_000
+DEFAULT_FOLDS = 3
+# Validation rows scored per fold; more only tightens estimates that are already
+# far below the differences halving acts on
+MAX_VALIDATION_ROWS = 20_000
+HALVING_FACTOR = 3
+
+# Candidates whose cost grows with the square of the rows (kNN, kernel SVMs) are
+# left out: successive halving relies on the cost of a round being predictable
+# from the one before.
+CANDIDATES = {
+    'lr': LogisticRegression(max_iter=300),
+    'ridge': RidgeClassifier(),
+    'lda': LinearDiscriminantAnalysis(),
+    'nb': GaussianNB(),
+    'dt': DecisionTreeClassifier(max_depth=12, random_state=0),
+    'rf': RandomForestClassifier(n_estimators=50, min_samples_leaf=2, n_jobs=1, random_state=0),
+    'et': ExtraTreesClassifier(n_estimators=50, min_samples_leaf=2, n_jobs=1, random_state=0),
+    'hgb': HistGradientBoostingClassifier(max_iter=100, early_stopping=True, n_iter_no_change=5, random_state=0),
+}
+
+
+class InsufficientDataError(ValueError):
+    """The dataset is too small to cross-validate a trait model on."""
+
+
+def feature_names() -> List[str]:
+    """Names of the feature matrix columns: the numeric features, then one column per category."""
+    names = list(NUMERIC_FEATURES)
+    for column in CATEGORICAL_FEATURES:
+        names += [f"{column}={category}" for category in PROCESSED_DTYPES[column].categories]
+    return names
+
+
+def frame_columns(df: pd.DataFrame, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Column arrays of df as build_feature_matrix expects them (integer codes for categoricals)."""
+    return {name: df[name].cat.codes.to_numpy() if isinstance(df[name].dtype, CategoricalDtype) else df[name].to_numpy()
+            for name in columns}
+
+
+def build_feature_matrix(columns: Mapping[str, np.ndarray]) -> np.ndarray:
+    """
+    Builds the float32 model input from column arrays in the stored layout.
+    Numeric features are copied as is (a missing notif_response_time becomes 0;
+    active_notif_responder tells the two apart) and categoricals are one-hot
+    encoded from their codes, so the matrix never depends on the data it is
+    built from and is identical for training and scoring.
+    Args:
+        columns (Mapping[str, np.ndarray]): Feature columns, categoricals as codes.
+    Returns:
+        np.ndarray: A (rows, len(feature_names())) matrix.
+    """
+    n = len(columns[NUMERIC_FEATURES[0]])
+    X = np.zeros((n, len(feature_names())), dtype=np.float32)
+    for i, name in enumerate(NUMERIC_FEATURES):
+        X[:, i] = columns[name]
+    np.nan_to_num(X[:, :len(NUMERIC_FEATURES)], copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    offset = len(NUMERIC_FEATURES)
+    for name in CATEGORICAL_FEATURES:
+        codes = np.asarray(columns[name]).astype(np.int64)
+        valid = codes >= 0
+        X[np.flatnonzero(valid), offset + codes[valid]] = 1.0
+        offset += len(PROCESSED_DTYPES[name].categories)
+    return X
+
+
+class TraitModel:
+    """
+    A fitted trait classifier together with its input scaling, as persisted
+    for scoring.
+    Args:
+        estimator: The fitted scikit-learn classifier (predicts trait codes).
+        mean (np.ndarray), scale (np.ndarray): Standardization of the feature matrix.
+        name (str): Key of the winning candidate in CANDIDATES.
+        cv_accuracy (float): Its cross-validated accuracy in the last round it ran.
+        leaderboard (list[dict]): Every candidate's score in every round.
+        trained_rows (int): Rows the estimator was fitted on.
+    """
+    def __init__(self, estimator, mean: np.ndarray, scale: np.ndarray, name: str,
+                 cv_accuracy: float, leaderboard: List[dict], trained_rows: int):
+        self.estimator = estimator
+        self.mean = mean
+        self.scale = scale
+        self.name = name
+        self.cv_accuracy = cv_accuracy
+        self.leaderboard = leaderboard
+        self.trained_rows = trained_rows
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return (X - self.mean) / self.scale
+
+    def predict_codes(self, X: np.ndarray) -> np.ndarray:
+        """Trait codes (indexes into PSYCH_TRAITS) for a matrix from build_feature_matrix."""
+        return self.estimator.predict(self.transform(X)).astype(np.int8)
+
+    def predict(self, df: pd.DataFrame) -> pd.Categorical:
+        """Predicts the trait of every row of a processed DataFrame."""
+        X = build_feature_matrix(frame_columns(df, NUMERIC_FEATURES + CATEGORICAL_FEATURES))
+        return pd.Categorical.from_codes(self.predict_codes(X), dtype=PROCESSED_DTYPES[TARGET])
+
+    def save(self, path: str):
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TraitModel':
+        return joblib.load(path)
+
+
+class _Fold(NamedTuple):
+    # Both shuffled, so any prefix is a random sample
+    train: np.ndarray
+    test: np.ndarray
+
+
+def _standardize(X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Label-free, so computing it once on the whole sample leaks nothing the folds care about
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    X -= mean
+    X /= scale
+    return mean, scale
+
+
+def _fit_and_score(estimator, X: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray) -> Tuple[float, float]:
+    start = time.perf_counter()
+    try:
+        estimator.fit(X[train], y[train])
+    except ValueError:
+        # e.g. early stopping cannot hold out a stratified split of a tiny fold;
+        # the candidate scores NaN and drops out rather than failing the search
+        return float('nan'), time.perf_counter() - start
+    accuracy = float(np.mean(estimator.predict(X[test]) == y[test]))
+    return accuracy, time.perf_counter() - start
+
+
+def successive_halving(X: np.ndarray, y: np.ndarray, candidates: Mapping[str, object], folds: Sequence[_Fold],
+                       min_rows: int = DEFAULT_MIN_ROWS, time_budget_s: float = DEFAULT_TIME_BUDGET_S,
+                       n_jobs: int = -1, factor: int = HALVING_FACTOR) -> Tuple[str, float, List[dict]]:
+    """
+    Scores candidates on the given folds, keeping the best 1/factor of them and
+    multiplying the training rows per fold by factor after every round. Each
+    round fits every (candidate, fold) pair in parallel on the same matrix.
+    Another round is only started if, extrapolated from the last one, it fits
+    in what is left of time_budget_s. A candidate that cannot be fitted on a
+    fold scores NaN and is ranked last.
+    Returns:
+        tuple: The best candidate's name, its mean accuracy in the last round
+            and the leaderboard (one entry per candidate and round).
+    """
+    started = time.perf_counter()
+    max_rows = min(len(fold.train) for fold in folds)
+    rows = min(min_rows, max_rows)
+    survivors = list(candidates)
+    leaderboard = []
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for round_number in range(len(candidates)):
+            round_start = time.perf_counter()
+            results = parallel(delayed(_fit_and_score)(clone(candidates[name]), X, y, fold.train[:rows], fold.test)
+                               for name in survivors for fold in folds)
+            scores = {}
+            for i, name in enumerate(survivors):
+                fold_results = results[i * len(folds):(i + 1) * len(folds)]
+                scores[name] = float(np.mean([accuracy for accuracy, _ in fold_results]))
+                leaderboard.append({'round': round_number, 'candidate': name, 'rows': rows, 'accuracy': scores[name],
+                                    'fit_s': float(sum(seconds for _, seconds in fold_results))})
+            survivors = [name for name in survivors if not np.isnan(scores[name])] or survivors
+            survivors.sort(key=scores.get, reverse=True)
+            best = survivors[0]
+            if np.isnan(scores[best]):
+                raise InsufficientDataError(f"No candidate could be fitted on {rows} rows per fold.")
+            ranking = ', '.join(f"{name} {scores[name]:.4f}" for name in survivors)
+            print(f"Round {round_number}: {len(survivors)} candidate(s) on {rows} rows per fold: {ranking}")
+            keep = math.ceil(len(survivors) / factor)
+            if keep == 1 or rows == max_rows:
+                break
+            next_rows = min(rows * factor, max_rows)
+            estimate = (time.perf_counter() - round_start) * (next_rows / rows) * (keep / len(survivors))
+            if time.perf_counter() - started + estimate > time_budget_s:
+                print(f"Stopping: the next round would take about {estimate:.1f}s, past the {time_budget_s:.0f}s budget.")
+                break
+            survivors, rows = survivors[:keep], next_rows
+    return best, scores[best], leaderboard
+
+
+def train_trait_model(dataset_path: str, time_budget_s: float = DEFAULT_TIME_BUDGET_S,
+                      max_rows: int = DEFAULT_MAX_ROWS, min_rows: int = DEFAULT_MIN_ROWS,
+                      n_folds: int = DEFAULT_FOLDS, n_jobs: int = -1, seed: int = 0,
+                      candidates: Optional[Mapping[str, object]] = None) -> TraitModel:
+    """
+    Selects and fits a trait classifier on a stored dataset.
+    Up to max_rows random rows are read (only the feature and target columns),
+    preprocessed into one matrix and split into n_folds stratified folds (fewer
+    if the rarest trait has fewer rows than that); the candidates then compete
+    by successive halving on those folds, and the winner is refitted on all
+    sampled rows.
+    Args:
+        dataset_path (str): Directory of the processed columnar dataset.
+        time_budget_s (float): Time the search may take; the final fit comes on top.
+        max_rows (int): Rows sampled for the search and the final fit.
+        min_rows (int): Training rows per fold in the first round.
+        n_folds (int): Cross-validation folds.
+        n_jobs (int): Parallel fits; -1 uses every core.
+        seed (int): Seed of the row sample and the folds.
+        candidates (Mapping[str, object], optional): Unfitted estimators by name; defaults to CANDIDATES.
+    Returns:
+        TraitModel: The fitted winner.
+    Raises:
+        InsufficientDataError: The sample has fewer than two traits, or a trait
+            with fewer than two rows, so it cannot be cross-validated.
+    """
+    candidates = dict(candidates or CANDIDATES)
+    dataset = open_dataset(dataset_path)
+    rng = np.random.default_rng(seed)
+    sample = np.arange(dataset.num_rows)
+    if dataset.num_rows > max_rows:
+        # Sorted, so reading the sample walks each memory-mapped column forwards
+        sample = np.sort(rng.choice(dataset.num_rows, max_rows, replace=False))
+    X = build_feature_matrix({name: dataset.column_take(name, sample) for name in NUMERIC_FEATURES + CATEGORICAL_FEATURES})
+    y = dataset.column_take(TARGET, sample).astype(np.int64)
+    mean, scale = _standardize(X)
+
+    counts = np.bincount(y)
+    counts = counts[counts > 0]
+    n_folds = min(n_folds, int(counts.min())) if len(counts) else 0
+    if len(counts) < 2 or n_folds < 2:
+        raise InsufficientDataError(f"Cannot cross-validate on {len(y)} rows: every one of at least two traits "
+                                    f"needs at least two rows.")
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    folds = [_Fold(rng.permutation(train), rng.permutation(test)[:MAX_VALIDATION_ROWS])
+             for train, test in splitter.split(X, y)]
+    name, accuracy, leaderboard = successive_halving(X, y, candidates, folds, min_rows=min_rows,
+                                                     time_budget_s=time_budget_s, n_jobs=n_jobs)
+    estimator = clone(candidates[name]).fit(X, y)
+    return TraitModel(estimator, mean, scale, name, accuracy, leaderboard, trained_rows=len(y))
@@ -0,0 +1,178 @@
+# user_index.py
+
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from schema import USER_ID_PREFIX
+from storage import ColumnarDataset, open_dataset
+
+# Width user ids are zero-padded to when displayed (see schema.format_user_id)
+USER_ID_WIDTH = 5
+DEFAULT_PAGE_SIZE = 50
+
+
+class UserIndex:
+    """
+    Maps user ids to row offsets in a stored dataset.
+    Pipeline output has contiguous ids (row i is user start + i), which is kept
+    as just (start, count) for O(1) lookups. Any other id layout is kept as
+    sorted ids plus their row offsets and looked up by binary search.
+    """
+    def __init__(self, num_rows: int, start: Optional[int] = None,
+                 sorted_ids: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None):
+        self.num_rows = num_rows
+        self.start = start
+        self.sorted_ids = sorted_ids
+        self.offsets = offsets
+
+    @property
+    def contiguous(self) -> bool:
+        return self.start is not None
+
+    @property
+    def max_id(self) -> int:
+        """Largest indexed id (-1 for an empty index)."""
+        if self.num_rows == 0:
+            return -1
+        return self.start + self.num_rows - 1 if self.contiguous else int(self.sorted_ids[-1])
+
+    @classmethod
+    def from_ids(cls, user_ids: np.ndarray) -> 'UserIndex':
+        """Builds the index for a column of user ids, in row order."""
+        n = len(user_ids)
+        if n == 0 or (int(user_ids[-1]) - int(user_ids[0]) == n - 1 and np.all(np.diff(user_ids.astype(np.int64)) == 1)):
+            return cls(n, start=int(user_ids[0]) if n else 0)
+        order = np.argsort(user_ids, kind='stable')
+        return cls(n, sorted_ids=np.asarray(user_ids)[order], offsets=order.astype(np.int64))
+
+    @classmethod
+    def build(cls, dataset: ColumnarDataset) -> 'UserIndex':
+        """
+        Builds the index for a stored dataset, checking its memory-mapped user_id
+        column one row group at a time; the ids are only gathered in memory
+        when they are not contiguous.
+        """
+        groups = [dataset.column_slice('user_id', group['offset'], group['offset'] + group['num_rows'])
+                  for group in dataset.row_groups]
+        if dataset.num_rows == 0:
+            return cls(0, start=0)
+        start = next_id = int(groups[0][0])
+        for ids in groups:
+            if not len(ids):
+                continue
+            if int(ids[0]) != next_id or not np.all(np.diff(ids.astype(np.int64)) == 1):
+                return cls.from_ids(np.concatenate(groups))
+            next_id += len(ids)
+        return cls(dataset.num_rows, start=start)
+
+    def save(self, path: str):
+        """Writes the index to an .npz file."""
+        if self.contiguous:
+            np.savez(path, num_rows=self.num_rows, start=self.start)
+        else:
+            np.savez(path, num_rows=self.num_rows, sorted_ids=self.sorted_ids, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path: str) -> 'UserIndex':
+        """Reads an index written by save."""
+        with np.load(path, allow_pickle=False) as data:
+            num_rows = int(data['num_rows'])
+            if 'start' in data:
+                return cls(num_rows, start=int(data['start']))
+            return cls(num_rows, sorted_ids=data['sorted_ids'], offsets=data['offsets'])
+
+    def lookup(self, user_id: int) -> Optional[int]:
+        """Returns the row offset of user_id, or None if it is not in the dataset."""
+        if self.contiguous:
+            offset = int(user_id) - self.start
+            return offset if 0 <= offset < self.num_rows else None
+        position = int(np.searchsorted(self.sorted_ids, user_id))
+        if position < len(self.sorted_ids) and self.sorted_ids[position] == user_id:
+            return int(self.offsets[position])
+        return None
+
+    def _count_below(self, user_id: int) -> int:
+        # Number of indexed ids strictly below user_id
+        if self.contiguous:
+            return int(min(max(user_id - self.start, 0), self.num_rows))
+        return int(np.searchsorted(self.sorted_ids, user_id))
+
+    def _ids_at(self, rank_start: int, rank_stop: int) -> np.ndarray:
+        # Indexed ids by rank in ascending order
+        if self.contiguous:
+            return np.arange(self.start + rank_start, self.start + rank_stop)
+        return np.asarray(self.sorted_ids[rank_start:rank_stop])
+
+    def count(self, ranges: List[Tuple[int, int]]) -> int:
+        """Returns how many indexed ids fall in the half-open id ranges."""
+        return sum(self._count_below(high) - self._count_below(low) for low, high in ranges)
+
+    def search(self, ranges: List[Tuple[int, int]], page: int = 0,
+               page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[np.ndarray, int]:
+        """
+        Returns one page of the indexed ids falling in any of the half-open id
+        ranges, in ascending order, plus the total number of matches. Only
+        the requested page is materialized.
+        Args:
+            ranges (list[tuple[int, int]]): Disjoint [low, high) id ranges, ascending.
+            page (int): Zero-based page number.
+            page_size (int): Ids per page.
+        Returns:
+            tuple[np.ndarray, int]: The ids on the page and the total match count.
+        """
+        spans = [(self._count_below(low), self._count_below(high)) for low, high in ranges]
+        total = sum(stop - start for start, stop in spans)
+        want_start, want_stop = page * page_size, min((page + 1) * page_size, total)
+        pieces, seen = [], 0
+        for start, stop in spans:
+            size = stop - start
+            lo, hi = max(want_start - seen, 0), min(want_stop - seen, size)
+            if lo < hi:
+                pieces.append(self._ids_at(start + lo, start + hi))
+            seen += size
+        ids = np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int64)
+        return ids, total
+
+
+def prefix_ranges(query: str, max_id: int) -> List[Tuple[int, int]]:
+    """
+    Converts a user id prefix such as 'user_0012', '0012' or '12' into the id
+    ranges whose displayed form (user_00012, user_123456, ...) starts with it.
+    An empty prefix matches every id.
+    Args:
+        query (str): The prefix typed by the user.
+        max_id (int): Largest id that can exist, bounding the ranges.
+    Returns:
+        list[tuple[int, int]]: Disjoint [low, high) id ranges, ascending.
+    """
+    digits = query.strip()
+    if digits.lower().startswith(USER_ID_PREFIX):
+        digits = digits[len(USER_ID_PREFIX):]
+    elif USER_ID_PREFIX.startswith(digits.lower()):
+        digits = ''
+    if not re.fullmatch(r'\d*', digits):
+        return []
+    if not digits:
+        return [(0, max_id + 1)]
+    ranges = []
+    # Displayed ids are zero-padded to USER_ID_WIDTH digits and longer ids are unpadded
+    for length in range(max(len(digits), USER_ID_WIDTH), max(len(str(max_id)), USER_ID_WIDTH) + 1):
+        scale = 10 ** (length - len(digits))
+        low, high = int(digits) * scale, (int(digits) + 1) * scale
+        if length > USER_ID_WIDTH:
+            # Unpadded, so the first digit cannot be 0 and the id must have exactly `length` digits
+            low, high = max(low, 10 ** (length - 1)), min(high, 10 ** length)
+        else:
+            high = min(high, 10 ** USER_ID_WIDTH)
+        if low < high and low <= max_id:
+            ranges.append((low, min(high, max_id + 1)))
+    return ranges
+
+
+def build_user_index_file(dataset_path: str, index_path: str) -> UserIndex:
+    """Builds the user index of a stored dataset and writes it to index_path."""
+    index = UserIndex.build(open_dataset(dataset_path))
+    index.save(index_path)
+    return index